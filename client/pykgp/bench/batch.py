@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Compare sowing and random playouts on one board at a time with
+# BoardBatch, which handles all boards at once using numpy.
+#
+#     PYTHONPATH=. python3 bench/batch.py [boards]
+
+import random
+import sys
+import time
+
+import numpy
+
+import kgp
+
+
+def boards(count, size, seed=2671):
+    """Generate COUNT random positions of games on boards of SIZE."""
+    rng = random.Random(seed)
+    result = []
+    while len(result) < count:
+        b = kgp.Board(0, 0, [size] * size, [size] * size)
+        side = kgp.SOUTH
+        for _ in range(rng.randint(0, 10)):
+            if b.is_final():
+                break
+            b, again = b.sow(side, rng.choice(b.legal_moves(side)))
+            if not again:
+                side = not side
+        if b.legal_moves(kgp.SOUTH):
+            result.append(b)
+    return result
+
+
+def playout(board, rng):
+    side = kgp.SOUTH
+    while not board.is_final():
+        board, again = board.sow(side, rng.choice(board.legal_moves(side)))
+        if not again:
+            side = not side
+    return board.south - board.north
+
+
+def measure(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {count / elapsed:12.0f}/s")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for size in (6, 8, 12):
+        positions = boards(count, size)
+        moves = [b.legal_moves(kgp.SOUTH)[0] for b in positions]
+        batch = kgp.BoardBatch.from_boards(positions)
+        print(f"size {size}, {count} boards:")
+
+        measure("Board.sow", count,
+                lambda: [b.sow(kgp.SOUTH, m) for b, m in zip(positions, moves)])
+        measure("BoardBatch.sow", count,
+                lambda: batch.sow(kgp.SOUTH, numpy.array(moves)))
+        measure("Board.legal_moves", count,
+                lambda: [b.legal_moves(kgp.SOUTH) for b in positions])
+        measure("BoardBatch.legal_moves", count,
+                lambda: batch.legal_moves(kgp.SOUTH))
+
+        rng = random.Random(0)
+        playouts = positions[:count // 10]
+        measure("playouts, one at a time", len(playouts),
+                lambda: [playout(b, rng) for b in playouts])
+        measure("playouts, BoardBatch", count,
+                lambda: batch.playout(rng=numpy.random.default_rng(0)))
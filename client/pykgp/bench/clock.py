@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Replay games against a stand-in server that gives the client an
+# absolute clock, and report how the client spends it.  The server
+# plays the opponent itself, choosing random moves with a fixed seed
+# per game, so that the games can be replayed.  Before every state,
+# it tells the client the time left with time:clock, and it deducts
+# the time from sending the state to receiving the yield.  When the
+# clock runs out, the server stops the request and the game is lost
+# on time.  The client is connected by connect in another process,
+# using IterativeDeepening with Negamax and the deadlines allocated
+# by its Clock.
+#
+#     PYTHONPATH=. python3 bench/clock.py [games] [seconds] [size]
+
+import asyncio
+import multiprocessing as mp
+import random
+import sys
+import time
+
+import kgp
+
+
+def client(port):
+    engine = kgp.Negamax(kgp.TranspositionTable(16))
+    deepening = kgp.IterativeDeepening(engine.search, budget=60)
+    kgp.connect(deepening.agent, host='127.0.0.1', port=port, name="clock")
+
+
+async def play(reader, writer, ids, seed, seconds, size):
+    """Play a game, returning the time spent per move and if it was lost on time."""
+    rng = random.Random(seed)
+    board = kgp.Board(0, 0, [size] * size, [size] * size)
+    side = kgp.SOUTH if seed % 2 == 0 else kgp.NORTH
+    left = float(seconds)
+    spent = []
+    while not board.is_final():
+        if side == kgp.NORTH:
+            move = rng.choice(board.legal_moves(kgp.NORTH))
+        else:
+            cid = next(ids)
+            writer.write(f"{next(ids)} set time:clock {int(left)}\r\n"
+                         f"{cid} state {board}\r\n".encode())
+            await writer.drain()
+            start = time.monotonic()
+            move = None
+            try:
+                async with asyncio.timeout(left):
+                    while True:
+                        line = (await reader.readline()).decode()
+                        command = kgp._parse(line)
+                        if command is None or command[1] != cid:
+                            continue
+                        if command[2] == "move":
+                            move = command[3][0] - 1
+                        elif command[2] == "yield":
+                            break
+            except TimeoutError:
+                pass
+            elapsed = time.monotonic() - start
+            writer.write(f"{next(ids)}@{cid} stop\r\n".encode())
+            left -= elapsed
+            spent.append(elapsed)
+            if left <= 0:
+                return spent, True
+            if move is None or not board.is_legal(kgp.SOUTH, move):
+                move = board.legal_moves(kgp.SOUTH)[0]
+        board, again = board.sow(side, move)
+        if not again:
+            side = not side
+    return spent, False
+
+
+async def serve(games, seconds, size, port=26711):
+    done = asyncio.Event()
+    results = []
+
+    async def handle(reader, writer):
+        ids = iter(range(2, 1 << 30, 2))
+        writer.write(b"kgp 1 0 0\r\n")
+        async for line in reader:
+            if b"mode" in line:
+                break
+        writer.write(f"{next(ids)} set time:mode absolute\r\n".encode())
+        for seed in range(games):
+            results.append(await play(reader, writer, ids, seed, seconds, size))
+        writer.write(f"{next(ids)} goodbye\r\n".encode())
+        await writer.drain()
+        writer.close()
+        done.set()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', port)
+    proc = mp.Process(target=client, args=(port,))
+    proc.start()
+    async with server:
+        await done.wait()
+    proc.join()
+    return results
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    size = int(sys.argv[3]) if len(sys.argv) > 3 else 6
+
+    results = asyncio.run(serve(games, seconds, size))
+    for game, (spent, flagged) in enumerate(results):
+        print(f"game {game}: {len(spent):>3} moves, {sum(spent):6.2f}s used, "
+              f"{seconds - sum(spent):6.2f}s left, "
+              f"longest move {max(spent):5.2f}s{', lost on time' if flagged else ''}")
+    flags = sum(flagged for _, flagged in results)
+    used = sum(sum(spent) for spent, _ in results) / (games * seconds)
+    print(f"{flags} of {games} games lost on time, {used:.1%} of the clock used")
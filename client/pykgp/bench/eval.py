@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# Generate load for a client in the mode eval, and report the
+# evaluations per second and their latency.  A stand-in server streams
+# states to a client connected by connect_eval in another process,
+# keeping up to a number of states outstanding, as a server evaluating
+# the moves of many games would.  The client evaluates one board at a
+# time, without and with collecting the states into batches, and all
+# boards of a batch at once with a BoardBatch, if numpy is available.
+#
+#     PYTHONPATH=. python3 bench/eval.py [states] [outstanding] [window]
+
+import asyncio
+import multiprocessing as mp
+import random
+import sys
+import time
+
+import kgp
+
+
+def evaluate(board):
+    n = board.size
+    pits = sum(board._data[:n]) - sum(board._data[n+1:2*n+1])
+    return board.south - board.north + 0.25 * pits
+
+
+def evaluate_batch(boards):
+    batch = kgp.BoardBatch.from_boards(boards)
+    n = batch.size
+    pits = batch.data[:, :n].sum(axis=1) - batch.data[:, n+1:2*n+1].sum(axis=1)
+    return (batch.evaluate() + 0.25 * pits).tolist()
+
+
+def client(port, batch, window, limit):
+    asyncio.run(kgp.connect_eval(evaluate_batch if batch else evaluate,
+                                 host='127.0.0.1', port=port, batch=batch,
+                                 window=window, limit=limit))
+
+
+def boards(count, size=6, seed=2671):
+    """Generate COUNT random boards of SIZE, encoded as for state commands."""
+    rng = random.Random(seed)
+    result = []
+    while len(result) < count:
+        b = kgp.Board(0, 0, [size] * size, [size] * size)
+        side = kgp.SOUTH
+        for _ in range(rng.randint(0, 20)):
+            if b.is_final():
+                break
+            b, again = b.sow(side, rng.choice(b.legal_moves(side)))
+            if not again:
+                side = not side
+        result.append(str(b))
+    return result
+
+
+async def serve(states, outstanding, args, port=26712):
+    """
+    Stream STATES to a client started with ARGS, returning the latency
+    of each evaluation and the time from the first state to the last
+    evaluation.
+    """
+    done = asyncio.get_running_loop().create_future()
+
+    async def handle(reader, writer):
+        writer.write(b"kgp 1 0 0\r\n")
+        async for line in reader:
+            if b"mode" in line:
+                break
+        sent = {}
+        latencies = []
+        slots = asyncio.Semaphore(outstanding)
+
+        async def stream():
+            for i, state in enumerate(states):
+                await slots.acquire()
+                cid = 2 * i + 2
+                sent[cid] = time.perf_counter()
+                writer.write(f"{cid} state {state}\r\n".encode())
+                await writer.drain()
+
+        start = time.perf_counter()
+        streamer = asyncio.create_task(stream())
+        while len(latencies) < len(states):
+            command = kgp._parse((await reader.readline()).decode())
+            if command is None or command[2] != "eval":
+                continue
+            latencies.append(time.perf_counter() - sent.pop(command[1]))
+            slots.release()
+        elapsed = time.perf_counter() - start
+        await streamer
+        writer.write(f"{2 * len(states) + 2} goodbye\r\n".encode())
+        await writer.drain()
+        writer.close()
+        done.set_result((latencies, elapsed))
+
+    server = await asyncio.start_server(handle, '127.0.0.1', port)
+    proc = mp.Process(target=client, args=(port, *args))
+    proc.start()
+    async with server:
+        result = await done
+    proc.join()
+    return result
+
+
+def run(label, states, outstanding, batch, window, limit):
+    latencies, elapsed = asyncio.run(
+        serve(states, outstanding, (batch, window, limit)))
+    latencies.sort()
+    print(f"  {label:<28} {len(states) / elapsed:9.0f} evals/s, latency "
+          f"median {latencies[len(latencies) // 2] * 1000:6.2f}ms, "
+          f"99% {latencies[int(len(latencies) * 0.99)] * 1000:6.2f}ms")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    outstanding = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    window = float(sys.argv[3]) if len(sys.argv) > 3 else 0.001
+    states = boards(count)
+
+    print(f"{count} states, up to {outstanding} outstanding:")
+    run("one at a time", states, outstanding, False, 0, 1)
+    run(f"batches of {window * 1000:g}ms", states, outstanding, False, window, 1024)
+    if 'numpy' in sys.modules:
+        run(f"BoardBatch, {window * 1000:g}ms", states, outstanding, True, window, 1024)
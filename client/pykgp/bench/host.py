@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Measure the aggregate throughput of a Host running many clients in
+# one process.  A stand-in server in another process accepts every
+# client and sends it states for a few seconds, each answered by a
+# shallow minimax search.  The memory allocated per client is measured
+# with tracemalloc once all clients are connected.
+#
+#     PYTHONPATH=. python3 bench/host.py [seconds]
+
+import asyncio
+import multiprocessing as mp
+import sys
+import time
+import tracemalloc
+
+import kgp
+
+BOARDS = [kgp.Board(0, 0, [s] * s, [s] * s) for s in (4, 6, 8)]
+
+
+def minimax(state, depth, side):
+    if depth == 0 or state.is_final():
+        return state.south - state.north
+    values = []
+    for move in state.legal_moves(side):
+        after, again = state.sow(side, move)
+        values.append(minimax(after, depth - 1, side if again else not side))
+    return max(values) if side == kgp.SOUTH else min(values)
+
+
+def agent(state):
+    def value(move):
+        after, again = state.sow(kgp.SOUTH, move)
+        return minimax(after, 2, kgp.SOUTH if again else kgp.NORTH)
+    yield max(state.legal_moves(kgp.SOUTH), key=value)
+
+
+def server(port, clients, seconds):
+    connected = asyncio.Event()
+    count = 0
+
+    async def serve(reader, writer):
+        nonlocal count
+        writer.write(b"kgp 1 0 0\r\n")
+        async for line in reader:
+            if b"mode" in line:
+                break
+        count += 1
+        if count == clients:
+            connected.set()
+        await connected.wait()
+
+        cid = 2
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            writer.write(f"{cid} state {BOARDS[cid % 3]}\r\n".encode())
+            async for line in reader:
+                if f"@{cid} yield".encode() in line:
+                    break
+            cid += 2
+        writer.write(f"{cid} goodbye\r\n".encode())
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        srv = await asyncio.start_server(serve, '127.0.0.1', port)
+        async with srv:
+            await srv.serve_forever()
+
+    asyncio.run(main())
+
+
+def measure(clients, seconds, port=26710):
+    proc = mp.Process(target=server, args=(port, clients, seconds),
+                      daemon=True)
+    proc.start()
+    time.sleep(0.5)
+
+    host = kgp.Host()
+    for i in range(clients):
+        host.add(agent, host='127.0.0.1', port=port, name=f"bot-{i}",
+                 token=f"token-{i}")
+
+    async def main():
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        serving = asyncio.create_task(host.serve())
+        while host.stats()['states'] < clients:
+            await asyncio.sleep(0.01)
+        per_client = (tracemalloc.get_traced_memory()[0] - before) / clients
+        tracemalloc.stop()
+        await serving
+        return per_client
+
+    try:
+        per_client = asyncio.run(main())
+    finally:
+        host.close()
+        proc.terminate()
+    return host.stats(), per_client
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for clients in (1, 8, 32, 64):
+        stats, per_client = measure(clients, seconds)
+        print(f"{clients:>3} clients: {stats['moves_per_sec']:8.1f} moves/sec, "
+              f"{stats['moves']:>6} moves, {per_client / 1024:6.1f} KiB/client")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Measure the time from sending a state command to receiving the first
+# move, for a client that starts a process for every state command, for
+# one that uses a pool of pre-started workers and for the asyncio
+# client.  A stand-in server on localhost sends a sequence of states,
+# pings the client while it is searching and stops each request
+# shortly after the first move arrived.
+#
+#     PYTHONPATH=. python3 bench/latency.py [states]
+
+import asyncio
+import multiprocessing as mp
+import random
+import socket
+import statistics
+import sys
+import time
+
+import kgp
+
+BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def agent(state):
+    moves = state.legal_moves(kgp.SOUTH)
+    yield moves[0]
+    # keep searching until the request is stopped
+    while True:
+        time.sleep(0.01)
+        yield moves[0]
+
+
+def states(count, seed=2671):
+    """Generate COUNT random non-final boards."""
+    rng = random.Random(seed)
+    result = []
+    while len(result) < count:
+        size = rng.randint(6, 12)
+        b = kgp.Board(0, 0, [size] * size, [size] * size)
+        side = kgp.SOUTH
+        for _ in range(rng.randint(0, 20)):
+            if b.is_final():
+                break
+            again, _ = b.make_move(side, rng.choice(b.legal_moves(side)))
+            if not again:
+                side = not side
+        if not b.is_final():
+            result.append(b)
+    return result
+
+
+def serve(server, boards):
+    """
+    Send BOARDS to the client.
+
+    Returns the latencies of the first moves and of the pongs.
+    """
+    conn, _ = server.accept()
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    latencies = []
+    pongs = []
+    with conn, conn.makefile('rw', newline='') as io:
+        io.write("kgp 1 0 0\r\n")
+        io.flush()
+        for line in io:
+            if "mode" in line:
+                break
+
+        cid = 2
+        for board in boards:
+            io.write(f"{cid} state {board}\r\n")
+            io.flush()
+            start = time.perf_counter()
+            for line in io:
+                if f"@{cid} move" in line:
+                    break
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.005)
+            io.write(f"{cid + 2} ping\r\n")
+            io.flush()
+            start = time.perf_counter()
+            for line in io:
+                if f"@{cid + 2} pong" in line:
+                    break
+            pongs.append((time.perf_counter() - start) * 1000)
+            io.write(f"{cid + 4}@{cid} stop\r\n")
+            io.flush()
+            cid += 6
+        io.write(f"{cid} goodbye\r\n")
+        io.flush()
+        for line in io:
+            pass
+    return latencies, pongs
+
+
+def connect_async(*args, **kwargs):
+    asyncio.run(kgp.connect_async(*args, **kwargs))
+
+
+def measure(boards, workers, connect=kgp.connect):
+    server = socket.create_server(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    kwargs = dict(host='localhost', port=port)
+    if workers:
+        kwargs['workers'] = workers
+    client = mp.Process(target=connect, args=(agent,), kwargs=kwargs)
+    client.start()
+    try:
+        return serve(server, boards)
+    finally:
+        client.join(timeout=1)
+        if client.is_alive():
+            client.terminate()
+        server.close()
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    quantile = lambda q: latencies[int(q * (len(latencies) - 1))]
+    print(f"{label}: mean {statistics.mean(latencies):.2f}ms, "
+          f"p50 {quantile(0.5):.2f}ms, p90 {quantile(0.9):.2f}ms, "
+          f"p99 {quantile(0.99):.2f}ms")
+    low = 0
+    for high in BUCKETS + (float('inf'),):
+        count = sum(low <= l < high for l in latencies)
+        print(f"  {low:>7} - {high:<7} ms {count:>5} {'#' * (60 * count // len(latencies))}")
+        low = high
+    print()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    boards = states(count)
+    for label, workers, connect in (("process per state", 0, kgp.connect),
+                                    ("worker pool (2 workers)", 2, kgp.connect),
+                                    ("asyncio", 0, connect_async)):
+        moves, pongs = measure(boards, workers, connect)
+        report(f"{label}, first move", moves)
+        report(f"{label}, pong", pongs)
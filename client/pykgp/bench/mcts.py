@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Measure the playouts per second of MonteCarlo on a single core, with
+# and without numpy, and play games against the agent of
+# examples/minmax.py with the same time per move.  Like the server,
+# the minmax agent is run in a process that is killed when the time is
+# up, using the last move it produced.  MonteCarlo runs in this
+# process, so that it keeps its tree, and is no longer asked for
+# moves when the time is up.
+#
+#     PYTHONPATH=. python3 bench/mcts.py [games] [seconds]
+
+import multiprocessing as mp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'examples'))
+
+import kgp
+import minmax
+
+
+def rate(batched, seconds=2):
+    mcts = kgp.MonteCarlo(seed=0)
+    if not batched:
+        mcts._numpy_rng = None
+    state = kgp.Board(0, 0, [6] * 6, [6] * 6)
+    start = time.perf_counter()
+    for _ in mcts.agent(state):
+        if time.perf_counter() - start > seconds:
+            break
+    return mcts.playouts / (time.perf_counter() - start)
+
+
+def run(conn, state):
+    for move in minmax.agent(state):
+        conn.send(move)
+
+
+def minmax_move(state, seconds):
+    conn, child = mp.Pipe()
+    proc = mp.Process(target=run, args=(child, state))
+    proc.start()
+    move = None
+    deadline = time.monotonic() + seconds
+    while proc.is_alive() or conn.poll():
+        timeout = deadline - time.monotonic()
+        if timeout <= 0 or not conn.poll(timeout):
+            break
+        move = conn.recv()
+    proc.kill()
+    proc.join()
+    return move if move is not None else state.legal_moves(kgp.SOUTH)[0]
+
+
+def mcts_move(mcts, state, seconds):
+    deadline = time.monotonic() + seconds
+    for move in mcts.agent(state):
+        if time.monotonic() > deadline:
+            break
+    return move
+
+
+def play(mcts_side, seconds, size=6):
+    """Play a game, returning the difference of the stores for MonteCarlo."""
+    mcts = kgp.MonteCarlo()
+    state = kgp.Board(0, 0, [size] * size, [size] * size)
+    side = kgp.SOUTH
+    while not state.is_final():
+        # both agents play south
+        view = state if side == kgp.SOUTH else state.mirror()
+        if side == mcts_side:
+            move = mcts_move(mcts, view, seconds)
+        else:
+            move = minmax_move(view, seconds)
+        state, again = state.sow(side, move)
+        if not again:
+            side = not side
+    diff = state.south - state.north
+    return diff if mcts_side == kgp.SOUTH else -diff
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.25
+
+    if 'numpy' in sys.modules:
+        print(f"playouts/sec with numpy:    {rate(True):8.0f}")
+    print(f"playouts/sec without numpy: {rate(False):8.0f}")
+
+    results = [play(kgp.SOUTH if game % 2 == 0 else kgp.NORTH, seconds)
+               for game in range(games)]
+    wins = sum(diff > 0 for diff in results)
+    draws = sum(diff == 0 for diff in results)
+    print(f"MonteCarlo vs minmax at {seconds}s/move: {wins} won, {draws} drawn, "
+          f"{games - wins - draws} lost (store differences {results})")
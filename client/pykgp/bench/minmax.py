@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# Benchmark the search from examples/minmax.py, comparing the
+# list-based board kgp.py used to ship (copied with copy.deepcopy on
+# every sow) with the array-backed board, both when sowing into
+# copies and when using make_move/unmake_move.
+#
+# Run from the pykgp directory:
+#
+#     PYTHONPATH=. python3 bench/minmax.py [depth]
+
+import copy
+import sys
+import time
+
+import kgp
+
+
+class LegacyBoard:
+    """The board representation kgp.py used before the array rewrite."""
+
+    def __init__(self, south, north, south_pits, north_pits):
+        self.north = north
+        self.south = south
+        self.north_pits = north_pits
+        self.south_pits = south_pits
+        self.size = len(north_pits)
+
+    def __getitem__(self, key):
+        if key == kgp.NORTH:
+            return self.north
+        elif key == kgp.SOUTH:
+            return self.south
+        side, pit = key
+        return self.pit(side, pit)
+
+    def __setitem__(self, key, value):
+        if key == kgp.NORTH:
+            self.north = value
+        elif key == kgp.SOUTH:
+            self.south = value
+        else:
+            side, pit = key
+            self.side(side)[pit] = value
+
+    def side(self, side):
+        assert side in (kgp.NORTH, kgp.SOUTH)
+        return self.north_pits if side == kgp.NORTH else self.south_pits
+
+    def pit(self, side, pit):
+        assert 0 <= pit < self.size
+        return self.side(side)[pit]
+
+    def is_legal(self, side, move):
+        return self.pit(side, move) > 0
+
+    def legal_moves(self, side):
+        return [move for move in range(self.size)
+                if self.is_legal(side, move)]
+
+    def is_final(self):
+        return (not self.legal_moves(kgp.NORTH)) or (not self.legal_moves(kgp.SOUTH))
+
+    def _collect(self):
+        self.north += sum(self.north_pits)
+        self.north_pits = [0] * len(self.north_pits)
+        self.south += sum(self.south_pits)
+        self.south_pits = [0] * len(self.south_pits)
+        return self, False
+
+    def sow(self, side, pit):
+        b = copy.deepcopy(self)
+        me = side
+        pos = pit + 1
+        stones = b[side, pit]
+        b[side, pit] = 0
+
+        while stones > 0:
+            if pos == self.size:
+                if side == me:
+                    b[me] += 1
+                    stones -= 1
+                side = not side
+                pos = 0
+            else:
+                b[side, pos] += 1
+                pos += 1
+                stones -= 1
+
+        if pos == 0 and not me == side:
+            if b.is_final():
+                return b._collect()
+            return b, True
+        elif side == me and pos > 0:
+            last = pos - 1
+            other = self.size - 1 - last
+            if b[side, last] == 1 and b[not side, other] > 0:
+                b[side] += b[not side, other] + 1
+                b[not side, other] = 0
+                b[side, last] = 0
+
+        if b.is_final():
+            b._collect()
+        return b, False
+
+
+nodes = 0
+
+
+def evaluate(state):
+    return state[kgp.SOUTH] - state[kgp.NORTH]
+
+
+def search(state, depth, side):
+    """The search from examples/minmax.py, counting nodes."""
+    global nodes
+    nodes += 1
+
+    def child(move):
+        if depth <= 0:
+            return (evaluate(state), move)
+
+        after, again = state.sow(side, move)
+        if after.is_final():
+            return (evaluate(after), move)
+        if again:
+            return (search(after, depth, side)[0], move)
+        else:
+            return (search(after, depth-1, not side)[0], move)
+
+    choose = max if side == kgp.SOUTH else min
+    return choose((child(move) for move in state.legal_moves(side)),
+                  key=lambda ent: ent[0])
+
+
+def search_inplace(state, depth, side):
+    """The same search, using make_move and unmake_move."""
+    global nodes
+    nodes += 1
+
+    best = None
+    for move in state.legal_moves(side):
+        if depth <= 0:
+            value = evaluate(state)
+        else:
+            again, undo = state.make_move(side, move)
+            if state.is_final():
+                value = evaluate(state)
+            elif again:
+                value = search_inplace(state, depth, side)[0]
+            else:
+                value = search_inplace(state, depth-1, not side)[0]
+            state.unmake_move(undo)
+        if (best is None or
+                (value > best[0] if side == kgp.SOUTH else value < best[0])):
+            best = (value, move)
+    return best
+
+
+def measure(label, fn, state, depth):
+    global nodes
+    nodes = 0
+    start = time.perf_counter()
+    result = fn(state, depth, kgp.SOUTH)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {nodes:>9} nodes {elapsed:8.3f}s "
+          f"{nodes / elapsed:>10.0f} nodes/s  -> {result}")
+    return nodes / elapsed
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    for size, seeds in ((6, 4), (8, 8)):
+        print(f"board <{size},{seeds}>, depth {depth}")
+        pits = lambda: [seeds] * size
+        legacy = measure("legacy board, sow", search,
+                         LegacyBoard(0, 0, pits(), pits()), depth)
+        measure("array board, sow", search,
+                kgp.Board(0, 0, pits(), pits()), depth)
+        inplace = measure("array board, make/unmake", search_inplace,
+                          kgp.Board(0, 0, pits(), pits()), depth)
+        print(f"speedup: {inplace / legacy:.1f}x\n")
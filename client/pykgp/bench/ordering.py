@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# Count the nodes an alpha-beta search visits to a fixed depth with
+# different move orderings: the natural order of the pits, sorting the
+# moves by the board after sowing each of them, as the niklas client
+# used to, and MoveOrdering, with and without the best moves of
+# the previous depth taken from a transposition table.  For every
+# depth, the nodes saved compared to the natural order and how often
+# the first move caused the cutoff are reported.
+#
+#     PYTHONPATH=. python3 bench/ordering.py [depth] [positions]
+
+import random
+import sys
+import time
+
+import kgp
+
+
+class Search:
+    def __init__(self, order, ordering=None, table=None):
+        self.order = order
+        self.ordering = ordering
+        self.table = table
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+
+    def alphabeta(self, state, depth, side, alpha, beta, ply=0):
+        self.nodes += 1
+        if depth == 0 or state.is_final():
+            return state.south - state.north
+        best = -1
+        if self.table is not None:
+            entry = self.table.probe(state.key ^ side)
+            if entry is not None:
+                best = entry[3]
+        result, found = None, -1
+        for index, move in enumerate(self.order(self, state, side, ply, best)):
+            again, undo = state.make_move(side, move)
+            value = self.alphabeta(state, depth - (not again),
+                                   side if again else not side,
+                                   alpha, beta, ply + 1)
+            state.unmake_move(undo)
+            if result is None or (value > result if side == kgp.SOUTH
+                                  else value < result):
+                result, found = value, move
+            if side == kgp.SOUTH:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.cutoffs += 1
+                self.first_cutoffs += index == 0
+                if self.ordering is not None:
+                    self.ordering.cutoff(side, move, ply, depth, index)
+                break
+        if self.table is not None:
+            # only the move is used, for ordering
+            self.table.store(state.key ^ side, result, depth, kgp.EXACT, found)
+        return result
+
+
+def natural(search, state, side, ply, best):
+    return state.legal_moves(side)
+
+
+def sowing(search, state, side, ply, best):
+    def value(move):
+        after, again = state.sow(side, move)
+        return after[side] - after[not side] + int(again) * 3
+    return sorted(state.legal_moves(side), key=lambda move: -value(move))
+
+
+def ordered(search, state, side, ply, best):
+    return search.ordering.order(state, side, ply, best)
+
+
+def positions(count, size=6, seed=2671):
+    rng = random.Random(seed)
+    result = []
+    while len(result) < count:
+        b = kgp.Board(0, 0, [size] * size, [size] * size)
+        side = kgp.SOUTH
+        for _ in range(rng.randint(2, 8)):
+            if b.is_final():
+                break
+            b, again = b.sow(side, rng.choice(b.legal_moves(side)))
+            if not again:
+                side = not side
+        if not b.is_final():
+            result.append(b if side == kgp.SOUTH else b.mirror())
+    return result
+
+
+def run(label, make, boards, depths):
+    """Search BOARDS to every depth, returning the nodes per depth."""
+    nodes = []
+    for depth in depths:
+        total = cutoffs = first = 0
+        start = time.perf_counter()
+        for board in boards:
+            search = make(board)
+            if search.table is not None:
+                # iterative deepening fills in the best moves, only
+                # the last iteration is counted
+                for d in range(1, depth):
+                    search.alphabeta(board, d, kgp.SOUTH, -1000, 1000)
+                    search.ordering.new_search()
+            search.nodes = search.cutoffs = search.first_cutoffs = 0
+            search.alphabeta(board, depth, kgp.SOUTH, -1000, 1000)
+            total += search.nodes
+            cutoffs += search.cutoffs
+            first += search.first_cutoffs
+        elapsed = time.perf_counter() - start
+        nodes.append(total)
+        print(f"  {label:<24} depth {depth:>2}: {total:>9} nodes, "
+              f"first move cutoffs {first / max(cutoffs, 1):6.1%}, "
+              f"{elapsed:6.2f}s")
+    return nodes
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    boards = positions(count)
+    depths = range(1, depth + 1)
+
+    results = {
+        'natural': run('natural order', lambda b: Search(natural), boards, depths),
+        'sowing': run('sorted after sowing', lambda b: Search(sowing), boards, depths),
+        'ordering': run('MoveOrdering', lambda b: Search(
+            ordered, kgp.MoveOrdering(b.size)), boards, depths),
+        'table': run('MoveOrdering and TT', lambda b: Search(
+            ordered, kgp.MoveOrdering(b.size), kgp.TranspositionTable(4)),
+                     boards, depths),
+    }
+    print("nodes saved compared to the natural order:")
+    for label, nodes in results.items():
+        saved = [1 - n / base for n, base in zip(nodes, results['natural'])]
+        print(f"  {label:<10}" + "".join(f" {s:6.1%}" for s in saved))
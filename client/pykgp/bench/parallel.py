@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Measure how the root-parallel kgp.SearchPool scales with the number
+# of worker processes, by searching a few fixed positions to a fixed
+# depth with the plain minimax search of examples/minmax.py.
+#
+#     PYTHONPATH=. python3 bench/parallel.py [depth]
+
+import os
+import sys
+import time
+
+import kgp
+
+POSITIONS = ("<6,0,0,4,4,4,4,4,4,4,4,4,4,4,4>",
+             "<6,5,3,0,6,6,5,1,5,5,0,5,1,6,0>",
+             "<8,10,12,2,0,9,9,1,9,0,8,8,3,0,4,9,1,3,1>")
+
+
+def evaluate(state):
+    return state[kgp.SOUTH] - state[kgp.NORTH]
+
+
+def search(state, depth, side):
+    if depth <= 0 or state.is_final():
+        return evaluate(state)
+    choose = max if side == kgp.SOUTH else min
+    values = []
+    for move in state.legal_moves(side):
+        again, undo = state.make_move(side, move)
+        values.append(search(state, depth - 1, side if again else not side))
+        state.unmake_move(undo)
+    return choose(values)
+
+
+def serial(state, depth):
+    results = []
+    for move in state.legal_moves(kgp.SOUTH):
+        after, again = state.sow(kgp.SOUTH, move)
+        results.append((search(after, depth - 1,
+                               kgp.SOUTH if again else kgp.NORTH), move))
+    return results
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    boards = [kgp.Board.parse(p) for p in POSITIONS]
+    print(f"depth {depth}, {len(boards)} positions, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    expected = [serial(b, depth) for b in boards]
+    base = time.perf_counter() - start
+    print(f"{'serial':>10}: {base:7.3f}s")
+
+    for workers in (1, 2, 4, 8):
+        pool = kgp.SearchPool(search, workers=workers)
+        start = time.perf_counter()
+        results = [pool.search_moves(b, depth) for b in boards]
+        elapsed = time.perf_counter() - start
+        pool.close()
+        assert results == expected
+        print(f"{workers:>2} workers: {elapsed:7.3f}s, speedup {base / elapsed:.2f}x")
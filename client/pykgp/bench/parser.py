@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Compare the single-pass command parser with the parser kgp.py used
+# to have, which tried four regular expressions on a copy of the rest
+# of the line for every argument and parsed boards twice.
+#
+# The transcripts are the lines a client receives during a game.  By
+# default they are generated for boards of size 6 to 64, but the
+# output of a client connected with debug=True can be passed instead,
+# in which case the received lines, starting with "<", are used.
+#
+#     PYTHONPATH=. python3 bench/parser.py [transcript ...]
+
+import random
+import re
+import sys
+import time
+
+import kgp
+
+COMMAND_PATTERN = re.compile(r"""
+^\s*(?:(?P<id>\d+)(?:@(?P<ref>\d+))?\s+)?(?P<cmd>\w+)(?:\s+(?P<args>.*?))?\s*$
+""", re.VERBOSE)
+STRING_PATTERN = re.compile(r'^"((?:\\.|[^"])*)"\s*')
+INTEGER_PATTERN = re.compile(r'^(\d+)\s*')
+FLOAT_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*')
+BOARD_PATTERN = re.compile(r'^(<(\d+(?:,\d+){4,})>)\s*')
+
+
+def legacy_parse(raw):
+    match = BOARD_PATTERN.match(raw)
+    data = [int(d) for d in match.group(2).split(',')]
+    size, south, north, *rest = data
+    if len(data) != data[0] * 2 + 2 + 1:
+        return None
+    return kgp.Board(south, north, rest[:size], rest[size:])
+
+
+def legacy_split(args):
+    upto = 0
+    parsed = []
+
+    while True:
+        for pat in (STRING_PATTERN,
+                    INTEGER_PATTERN,
+                    FLOAT_PATTERN,
+                    BOARD_PATTERN):
+            match = pat.search(args[upto:])
+            if not match:
+                continue
+
+            arg = match.group(1)
+            if pat == STRING_PATTERN:
+                parsed.append(re.sub(r'\\(.)', '\\1', arg))
+            elif pat == INTEGER_PATTERN:
+                parsed.append(int(arg))
+            elif pat == FLOAT_PATTERN:
+                parsed.append(float(arg))
+            elif pat == BOARD_PATTERN:
+                parsed.append(legacy_parse(arg))
+
+            upto += match.end(0)
+            break
+        else:
+            return parsed
+
+
+def legacy(line):
+    match = COMMAND_PATTERN.match(line)
+    cid = match.group('id') and int(match.group('id'))
+    ref = match.group('ref') and int(match.group('ref'))
+    return cid, ref, match.group('cmd'), legacy_split(match.group('args') or '')
+
+
+def transcript(size, states=200, seed=2671):
+    """Generate the lines a client receives in games on boards of SIZE."""
+    rng = random.Random(seed + size)
+    lines = ["kgp 1 0 0\r\n", '1@3 ok\r\n']
+    cid = 5
+    while states > 0:
+        b = kgp.Board(0, 0, [size] * size, [size] * size)
+        side = kgp.SOUTH
+        while not b.is_final() and states > 0:
+            if side == kgp.SOUTH:
+                lines.append(f"{cid} state {b}\r\n")
+                lines.append(f"{cid + 2}@{cid} stop\r\n")
+                if cid % 7 == 0:
+                    lines.append(f'{cid + 4} ping "{cid}"\r\n')
+                cid += 6
+                states -= 1
+            again, _ = b.make_move(side, rng.choice(b.legal_moves(side)))
+            if not again:
+                side = not side
+    lines.append(f"{cid} goodbye\r\n")
+    return lines
+
+
+def recorded(path):
+    with open(path) as f:
+        return [line[2:] for line in f if line.startswith("< ")]
+
+
+def measure(parse, lines, rounds=5):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best
+
+
+def report(label, lines):
+    for line in lines:
+        assert kgp._parse(line) == legacy(line), line
+    old = measure(legacy, lines)
+    new = measure(kgp._parse, lines)
+    chars = sum(map(len, lines)) / len(lines)
+    print(f"{label:>12}: {chars:7.1f} chars/line, legacy {old:9.0f} lines/s, "
+          f"single-pass {new:9.0f} lines/s ({new / old:4.2f}x)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            report(path, recorded(path))
+    else:
+        for size in (6, 8, 12, 16, 24, 32, 48, 64):
+            report(f"size {size}", transcript(size))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Play games between an agent that ponders and one that does not, both
+# using the same alpha-beta search and time budget per move, and
+# report the ponder hit rate and the depth gained by pondering.  The
+# opponent's search runs in this process while the pondering process
+# searches the expected next state.
+#
+#     PYTHONPATH=. python3 bench/ponder.py [games] [budget]
+
+import random
+import sys
+
+import kgp
+
+
+def alphabeta(state, depth, side, alpha, beta, nodes):
+    nodes[0] += 1
+    if depth == 0 or state.is_final():
+        return state.south - state.north
+    for move in state.legal_moves(side):
+        after, again = state.sow(side, move)
+        value = alphabeta(after, depth - (not again), side if again else not side,
+                          alpha, beta, nodes)
+        if side == kgp.SOUTH:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            break
+    return alpha if side == kgp.SOUTH else beta
+
+
+def search(state, depth):
+    nodes = [0]
+    best = None
+    for move in state.legal_moves(kgp.SOUTH):
+        after, again = state.sow(kgp.SOUTH, move)
+        value = alphabeta(after, depth - (not again),
+                          kgp.SOUTH if again else kgp.NORTH,
+                          -1000, 1000, nodes)
+        if best is None or value > best[0]:
+            best = (value, move)
+    return best[0], best[1], nodes[0]
+
+
+def play(ponder, opponent, rng):
+    """Play a game, returning the depths reached by both agents."""
+    size = 6
+    state = kgp.Board(0, 0, [size] * size, [size] * size)
+    # a few random moves, so that the games differ
+    side = kgp.SOUTH
+    for _ in range(4):
+        state, again = state.sow(side, rng.choice(state.legal_moves(side)))
+        if not again:
+            side = not side
+    depths = ([], [])
+    while not state.is_final():
+        if side == kgp.SOUTH:
+            move = list(ponder.agent(state))[-1]
+            depths[0].append(ponder.driver.iterations[-1]['depth'])
+        else:
+            move = list(opponent.agent(state.mirror()))[-1]
+            depths[1].append(opponent.iterations[-1]['depth'])
+        state, again = state.sow(side, move)
+        if not again:
+            side = not side
+    return depths
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    ponder = kgp.Ponder(search, budget)
+    opponent = kgp.IterativeDeepening(search, budget)
+    rng = random.Random(2671)
+    try:
+        pondering, plain = [], []
+        for _ in range(games):
+            depths = play(ponder, opponent, rng)
+            pondering += depths[0]
+            plain += depths[1]
+    finally:
+        ponder.close()
+
+    stats = ponder.stats()
+    print(f"{stats['moves']} moves, {stats['hits']} ponder hits "
+          f"({stats['hit_rate']:.1%}), depth gained {stats['depth_gained']:.2f} "
+          f"per move")
+    print(f"mean depth {sum(pondering) / len(pondering):.2f} with pondering, "
+          f"{sum(plain) / len(plain):.2f} without")
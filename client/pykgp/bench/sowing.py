@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Compare make_move and unmake_move with a naive make_move, that sows
+# stone by stone on the board array and updates the key for every
+# stone.  Both are timed making and unmaking the move of the first
+# pit of south, for piles of 1 to 40 stones, on boards of size 6 and
+# 12 with 4 stones in every other pit.  The implementations run in
+# turns and the best of several rounds is reported, as the timings of
+# single runs vary a lot on a busy machine.
+#
+#     PYTHONPATH=. python3 bench/sowing.py [rounds]
+
+import sys
+import timeit
+
+import kgp
+
+
+def naive_make(board, side, pit):
+    d = board._data
+    n = board.size
+    w = board._weights
+    if side == kgp.SOUTH:
+        start, store, skip = pit, n, 2*n + 1
+    else:
+        start, store, skip = n + 1 + pit, 2*n + 1, n
+
+    undo = d[:], board._key
+    stones = d[start]
+    d[start] = 0
+    key = board._key - stones * w[start]
+    pos = start
+    for _ in range(stones):
+        pos = (pos + 1) % (2*n + 2)
+        if pos == skip:
+            pos = (pos + 1) % (2*n + 2)
+        d[pos] += 1
+        key += w[pos]
+    board._key = key & kgp._KEY_MASK
+
+    again = pos == store
+    if (not again and d[pos] == 1 and
+            (pos < n if side == kgp.SOUTH else n < pos < store)):
+        captured = d[2*n - pos]
+        if captured > 0:
+            d[store] += captured + 1
+            d[2*n - pos] = 0
+            d[pos] = 0
+            board._key = (board._key + captured * (w[store] - w[2*n - pos]) +
+                          w[store] - w[pos]) & kgp._KEY_MASK
+    if board.is_final():
+        board._collect()
+        again = False
+    return again, undo
+
+
+def naive_unmake(board, undo):
+    board._data[:], board._key = undo
+
+
+def timer(make, unmake, size, stones):
+    board = kgp.Board(0, 0, [stones] + [4] * (size - 1), [4] * size)
+    copy = board.copy()
+    assert make(copy, kgp.SOUTH, 0)[0] == board.copy().make_move(kgp.SOUTH, 0)[0]
+
+    def move():
+        unmake(board, make(board, kgp.SOUTH, 0)[1])
+    return move
+
+
+def measure(moves, rounds, number=20000):
+    best = [float('inf')] * len(moves)
+    for _ in range(rounds):
+        for i, move in enumerate(moves):
+            best[i] = min(best[i], timeit.timeit(move, number=number) / number)
+    return best
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+    for size in (6, 12):
+        for stones in (1, 2, 4, 8, 13, 20, 40):
+            naive, table = measure([
+                timer(naive_make, naive_unmake, size, stones),
+                timer(kgp.Board.make_move, kgp.Board.unmake_move, size, stones),
+            ], rounds)
+            print(f"size {size:2}, {stones:2} stones: naive {naive * 1e6:5.2f} µs, "
+                  f"make_move {table * 1e6:5.2f} µs ({naive / table:4.2f}x)")
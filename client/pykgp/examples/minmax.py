@@ -14,6 +14,18 @@ import kgp
 def evaluate(state):
     return state[kgp.SOUTH] - state[kgp.NORTH]
 
+# When only a few stones are left in the pits, the rest of the game
+# can be looked up instead of searched.  Build a table of all such
+# boards once, e.g. for boards of size 6 with up to 10 stones, using
+#
+#     PYTHONPATH=. python3 tools/endgame.py 6 10
+#
+# and map it into memory by setting ENDGAME to
+#
+#     kgp.EndgameTable.load("endgame-6-10.bin")
+
+endgame = None
+
 # The following procedure implements the actual search.  We
 # recursively traverse the search space, using EVALUATE from above to
 # find our best/the opponents worst move.
@@ -28,6 +40,9 @@ def search(state, depth, side):
         after, again = state.sow(side, move)
         if after.is_final():
             return (evaluate(after), move)
+        exact = endgame and endgame.lookup(after, side if again else not side)
+        if exact is not None:
+            return (exact, move)
         if again:
             return (search(after, depth, side)[0], move)
         else:
@@ -57,7 +72,14 @@ def search(state, depth, side):
 # abruptly killed as soon as it's time has come.  By default you
 # cannot share resources between invocation.
 #
-# If you need to synchronise state between searches, use the
+# If you want to keep search results between searches, create a
+# transposition table in shared memory before connecting:
+#
+#     table = kgp.TranspositionTable(64, shared=True)
+#
+# All search processes can then read and write TABLE using the board
+# key (state.key), so results from the last move are available
+# when searching the next one.  For anything else, use the
 # multiprocessing module (specifically multiprocessing.Value or
 # multiprocessing.Array might be of interest).
 
@@ -65,6 +87,20 @@ def agent(state):
     for depth in range(1, 16):
         yield search(state, depth, kgp.SOUTH)[1]
 
+# This agent searches deeper and deeper until the server stops it,
+# wasting the time spent on the last, unfinished depth.  If you know
+# how much time a move may take (the server defaults to 5 seconds),
+# kgp.IterativeDeepening can end the search as soon as the next depth
+# is not expected to finish in time.  REPORT is called with the
+# depth, time and (if SEARCH returns them) the nodes of every depth:
+
+deepening = kgp.IterativeDeepening(
+    lambda state, depth: search(state, depth, kgp.SOUTH),
+    budget=4.5, report=print)
+
+# deepening.agent is a generator function too, and can be used instead
+# of AGENT.
+
 # We can now use the generator function as an agent, as seen below.
 #
 # By default the client will connect to our training server, but you
@@ -91,4 +127,4 @@ def agent(state):
 
 if __name__ == "__main__":
     import os
-    kgp.connect(agent, host="localhost", debug=True, token=os.getenv("TOKEN"), name="Minmax 16")
+    kgp.connect(deepening.agent, host="localhost", debug=True, token=os.getenv("TOKEN"), name="Minmax 16")
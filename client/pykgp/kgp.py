@@ -16,20 +16,40 @@
 # TORTIOUS ACTION,  ARISING OUT OF  OR IN  CONNECTION WITH THE  USE OR
 # PERFORMANCE OF THIS SOFTWARE.
 
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import functools
 import inspect
+import itertools
+import json
+import math
 import re
 import os
 import sys
+import signal
 import socket
 import threading
+import time
+import traceback
+import mmap
 import multiprocessing as mp
-import copy
+import multiprocessing.connection
+from multiprocessing import shared_memory
+import random
+from array import array
 
 try:
     import websocket
 except ModuleNotFoundError:
     pass
 
+try:
+    import numpy
+except ModuleNotFoundError:
+    pass
+
 
 _BOARD_PATTERN = re.compile(r'^(<(\d+(?:,\d+){4,})>)\s*')
 
@@ -38,8 +58,91 @@ NORTH = True
 SOUTH = not NORTH
 
 
+_SOWING_TABLES = {}
+_KEY_WEIGHTS = {}
+_KEY_MASK = (1 << 64) - 1
+
+
+def _key_weights(size):
+    """
+    Return the random key weights for the positions of a board of SIZE.
+
+    The weights are derived from a fixed seed, so that the keys of
+    equal boards agree across processes and runs.
+    """
+    try:
+        return _KEY_WEIGHTS[size]
+    except KeyError:
+        rng = random.Random(0x6b6770 + size)
+        weights = tuple(rng.getrandbits(64) for _ in range(2*size + 2))
+        return _KEY_WEIGHTS.setdefault(size, weights)
+
+
+def _sowing_table(size):
+    """
+    Return the sowing table for boards of SIZE.
+
+    The table maps the board array position a move starts at and the
+    number of stones in that pit, to a tuple of (position, count)
+    pairs, listing how many stones each position receives, the
+    position the last stone lands in and the change of the board key.
+    Entries are computed by _sowing_path the first time they are
+    needed.
+    """
+    try:
+        return _SOWING_TABLES[size]
+    except KeyError:
+        return _SOWING_TABLES.setdefault(size, {})
+
+
+def _sowing_path(size, start, stones):
+    """Compute the sowing table entry for STONES sown from START."""
+    end = 2*size + 2
+    skip = 2*size + 1 if start < size else size
+
+    # The positions a stone passes through, in order, ending with
+    # START itself after a complete round.
+    path = []
+    pos = start
+    while len(path) < end - 1:
+        pos = (pos + 1) % end
+        if pos != skip:
+            path.append(pos)
+
+    rounds, rest = divmod(stones, len(path))
+    cells = tuple((pos, rounds + (i < rest))
+                  for i, pos in enumerate(path)
+                  if rounds + (i < rest) > 0)
+
+    weights = _key_weights(size)
+    delta = sum(count * weights[pos] for pos, count in cells)
+    delta -= stones * weights[start]
+
+    return cells, path[(stones - 1) % len(path)], delta
+
+
 class Board:
-    """Board state representation."""
+    """
+    Board state representation.
+
+    The stones are kept in a single flat array, ordered the way stones
+    travel when sowing:
+
+        south pits | south store | north pits  | north store
+        0 ... n-1  | n           | n+1 ... 2n  | 2n+1
+
+    The pits opposite of each other always add up to 2n.
+
+    Each board also maintains a 64-bit key, that can be used to index
+    hash tables.  It is a Zobrist-style hash, but instead of XOR-ing a
+    random value for every (position, stones) pair, each position has
+    a single random weight that is multiplied with the stones in it
+    and the products are summed up.  This way the change of the key
+    caused by a move only depends on the pit and the number of stones
+    sown, and is part of the precomputed sowing table.
+    """
+
+    __slots__ = ('size', '_data', '_sowing', '_weights', '_key')
 
     @staticmethod
     def parse(raw):
@@ -47,43 +150,135 @@ class Board:
         match = _BOARD_PATTERN.match(raw)
         assert match
 
-        try:
-            data = [int(d) for d in match.group(2).split(',')]
-            size, south, north, *rest = data
-            if len(data) != data[0] * 2 + 2 + 1:
-                return None
+        return Board._decode(match.group(2))
+
+    @classmethod
+    def _decode(cls, digits):
+        """
+        Turn the comma separated numbers DIGITS of a board into a board.
 
-            return Board(south, north, rest[:size], rest[size:])
-        except ValueError:
+        The numbers are read straight into the array of the board.
+        Returns None if they do not describe a board.
+        """
+        try:
+            raw = array('i', map(int, digits.split(',')))
+        except (ValueError, OverflowError):
             return None
+        size = raw[0]
+        if size < 1 or len(raw) != size * 2 + 2 + 1:
+            return None
+
+        data = raw[3:]
+        data.insert(size, raw[1])
+        data.append(raw[2])
+
+        board = cls.__new__(cls)
+        board.size = size
+        board._data = data
+        board._sowing = _sowing_table(size)
+        board._weights = _key_weights(size)
+        board._rehash()
+        return board
 
     def __init__(self, south, north, south_pits, north_pits):
         """Create a new board."""
         assert len(north_pits) == len(south_pits)
 
-        self.north = north
-        self.south = south
-        self.north_pits = north_pits
-        self.south_pits = south_pits
         self.size = len(north_pits)
+        self._data = array('i', [*south_pits, south, *north_pits, north])
+        self._sowing = _sowing_table(self.size)
+        self._weights = _key_weights(self.size)
+        self._rehash()
+
+    def __reduce__(self):
+        return (Board, (self.south, self.north,
+                        self.south_pits, self.north_pits))
 
     def __eq__(self, other):
         """True if the same board as OTHER."""
-        return (self.north == other.north and
-                self.south == other.south and
-                self.north_pits == other.north_pits and
-                self.south_pits == other.south_pits)
+        if not isinstance(other, Board):
+            return NotImplemented
+        return self._data == other._data
+
+    def mirror(self):
+        """Return the board as seen by the other side."""
+        return Board(self.north, self.south, self.north_pits, self.south_pits)
 
     def __str__(self):
         """Return board in KGP board representation."""
-        data = [self.size,
-                self.south,
-                self.north,
-                *self.south_pits,
-                *self.north_pits]
+        n = self.size
+        d = self._data
+        data = [n, d[n], d[2*n+1], *d[:n], *d[n+1:2*n+1]]
 
         return '<{}>'.format(','.join(map(str, data)))
 
+    def _rehash(self):
+        """Recompute the board key from scratch."""
+        self._key = sum(map(int.__mul__, self._data, self._weights)) & _KEY_MASK
+
+    def _set(self, pos, value):
+        """Set the board array at POS to VALUE, updating the key."""
+        self._key = (self._key + (value - self._data[pos]) *
+                     self._weights[pos]) & _KEY_MASK
+        self._data[pos] = value
+
+    @property
+    def key(self):
+        """
+        A 64-bit hash of the board.
+
+        Equal boards of the same size have equal keys.  The key does not
+        encode what side is to move.
+        """
+        return self._key
+
+    @property
+    def north(self):
+        """Number of stones in the north store."""
+        return self._data[2*self.size+1]
+
+    @north.setter
+    def north(self, value):
+        self._set(2*self.size+1, value)
+
+    @property
+    def south(self):
+        """Number of stones in the south store."""
+        return self._data[self.size]
+
+    @south.setter
+    def south(self, value):
+        self._set(self.size, value)
+
+    @property
+    def north_pits(self):
+        """A list of the stones in the north pits."""
+        return self.side(NORTH)
+
+    @north_pits.setter
+    def north_pits(self, pits):
+        assert len(pits) == self.size
+        self._data[self.size+1:2*self.size+1] = array('i', pits)
+        self._rehash()
+
+    @property
+    def south_pits(self):
+        """A list of the stones in the south pits."""
+        return self.side(SOUTH)
+
+    @south_pits.setter
+    def south_pits(self, pits):
+        assert len(pits) == self.size
+        self._data[:self.size] = array('i', pits)
+        self._rehash()
+
+    def _index(self, side, pit):
+        """Return the position of PIT on SIDE in the board array."""
+        assert 0 <= pit < self.size
+        if side == SOUTH:
+            return pit
+        return self.size + 1 + pit
+
     def __getitem__(self, key):
         """
         Convenience assessor for stores and pits.
@@ -117,21 +312,25 @@ class Board:
             self.south = value
         else:
             side, pit = key
-            self.side(side)[pit] = value
+            self._set(self._index(side, pit), value)
 
     def side(self, side):
-        """Return the pits for SIDE."""
+        """
+        Return the pits for SIDE.
+
+        The result is a fresh list, changing it does not modify the
+        board.
+        """
         assert side in (NORTH, SOUTH)
 
         if side == NORTH:
-            return self.north_pits
+            return self._data[self.size+1:2*self.size+1].tolist()
         elif side == SOUTH:
-            return self.south_pits
+            return self._data[:self.size].tolist()
 
     def pit(self, side, pit):
         """Return number of seeds in PIT on SIDE."""
-        assert 0 <= pit < self.size
-        return self.side(side)[pit]
+        return self._data[self._index(side, pit)]
 
     def is_legal(self, side, move):
         """Check if side can make move."""
@@ -139,24 +338,103 @@ class Board:
 
     def legal_moves(self, side):
         """Return a list of legal moves for side."""
-        return [move for move in range(self.size)
-                if self.is_legal(side, move)]
+        d = self._data
+        base = 0 if side == SOUTH else self.size + 1
+        return [move for move in range(self.size) if d[base + move]]
+
+    def repeats(self, side, pit):
+        """
+        Check if the last stone sown from PIT on SIDE lands in its store.
+
+        This is decided from the number of stones in PIT alone, without
+        sowing, as a stone reaches the store again every 2n+1 steps.
+        Note that a move that ends the game does not repeat, even if it
+        ends in the store.
+        """
+        n = self.size
+        stones = self._data[self._index(side, pit)]
+        return stones > 0 and stones % (2*n + 1) == n - pit
 
     def is_final(self):
-        return (not self.legal_moves(NORTH)) or (not self.legal_moves(SOUTH))
+        """Check if either side has no more legal moves."""
+        d = self._data
+        n = self.size
+        return not any(d[:n]) or not any(d[n+1:2*n+1])
 
     def copy(self):
-        """Return a deep copy of the current board state."""
-        return copy.deepcopy(self)
+        """Return a copy of the current board state."""
+        b = Board.__new__(Board)
+        b.size = self.size
+        b._data = self._data[:]
+        b._sowing = self._sowing
+        b._weights = self._weights
+        b._key = self._key
+        return b
 
     def _collect(self):
-        self.north += sum(self.north_pits)
-        self.north_pits = [0] * len(self.north_pits)
-        self.south += sum(self.south_pits)
-        self.south_pits = [0] * len(self.south_pits)
+        """Move all remaining stones into the store of their side."""
+        d = self._data
+        n = self.size
+        d[n] += sum(d[:n])
+        d[2*n+1] += sum(d[n+1:2*n+1])
+        d[:n] = array('i', [0]) * n
+        d[n+1:2*n+1] = array('i', [0]) * n
+        self._rehash()
 
         return self, False
 
+    def make_move(self, side, pit):
+        """
+        Sow the stones from PIT on SIDE, modifying the board in place.
+
+        Returns a boolean to indicate a repeat move and an undo
+        record, that can be passed to unmake_move to restore the
+        board state before the move was made.  The record holds a
+        copy of the board array, that unmake_move restores at once.
+        """
+        d = self._data
+        n = self.size
+        if side == SOUTH:
+            start, store = pit, n
+        else:
+            start, store = n + 1 + pit, 2*n + 1
+
+        stones = d[start]
+        assert stones > 0
+        try:
+            cells, last, delta = self._sowing[start, stones]
+        except KeyError:
+            cells, last, delta = self._sowing[start, stones] = \
+                _sowing_path(n, start, stones)
+
+        undo = d[:], self._key
+        d[start] = 0
+        for pos, count in cells:
+            d[pos] += count
+        self._key = (undo[1] + delta) & _KEY_MASK
+
+        again = last == store
+        if (not again and d[last] == 1 and
+                (last < n if side == SOUTH else n < last < store)):
+            captured = d[2*n - last]
+            if captured > 0:
+                d[store] += captured + 1
+                d[2*n - last] = 0
+                d[last] = 0
+                w = self._weights
+                self._key = (self._key + captured * (w[store] - w[2*n - last]) +
+                             w[store] - w[last]) & _KEY_MASK
+
+        if not any(d[:n]) or not any(d[n+1:2*n+1]):
+            self._collect()
+            again = False
+
+        return again, undo
+
+    def unmake_move(self, undo):
+        """Revert a move made by make_move, using the UNDO record."""
+        self._data[:], self._key = undo
+
     def sow(self, side, pit, pure=True):
         """
         Sow the stones from pit on side.
@@ -171,261 +449,3076 @@ class Board:
 
         assert b.is_legal(side, pit)
 
-        me = side
-        pos = pit + 1
-        stones = b[side, pit]
-        b[side, pit] = 0
+        again, _ = b.make_move(side, pit)
+        return b, again
 
-        while stones > 0:
-            if pos == self.size:
-                if side == me:
-                    b[me] += 1
-                    stones -= 1
-                side = not side
-                pos = 0
-            else:
-                b[side, pos] += 1
-                pos += 1
-                stones -= 1
 
-        if pos == 0 and not me == side:
-            if b.is_final():
-                return b._collect()
-            return b, True
-        elif side == me and pos > 0:
-            last = pos - 1
-            other = self.size - 1 - last
-            if b[side, last] == 1 and b[not side, other] > 0:
-                b[side] += b[not side, other] + 1
-                b[not side, other] = 0
-                b[side, last] = 0
+EXACT = 1
+LOWERBOUND = 2
+UPPERBOUND = 3
+
 
-        if b.is_final():
-            b._collect()
+class BoardBatch:
+    """
+    Many boards of the same size, stored as the rows of an array.
+
+    Each row of DATA has the layout of a Board: the south pits, the
+    south store, the north pits and the north store.  Legal moves,
+    final boards, moves and evaluations are computed for all rows at
+    once.  DATA is not copied, if it already is an array of 64 bit
+    integers.  Requires numpy.
+    """
+
+    def __init__(self, data):
+        assert 'numpy' in sys.modules, "numpy couldn't be loaded"
+        self.data = numpy.atleast_2d(numpy.asarray(data, dtype=numpy.int64))
+        self.size = (self.data.shape[1] - 2) // 2
+
+    @classmethod
+    def from_boards(cls, boards):
+        """Create a batch of BOARDS, that must all have the same size."""
+        return cls([board._data for board in boards])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        """Return the board in row I."""
+        n = self.size
+        row = self.data[i].tolist()
+        return Board(row[n], row[2*n+1], row[:n], row[n+1:2*n+1])
+
+    def _pits(self, side):
+        n = self.size
+        return self.data[:, :n] if side == SOUTH else self.data[:, n+1:2*n+1]
+
+    def legal_moves(self, side):
+        """Return a boolean array of the legal moves of SIDE in each row."""
+        return self._pits(side) > 0
+
+    def is_final(self):
+        """Return a boolean array of the rows in which the game is over."""
+        return ~self._pits(SOUTH).any(axis=1) | ~self._pits(NORTH).any(axis=1)
+
+    def evaluate(self, side=SOUTH):
+        """Return the difference of the stores from the perspective of SIDE."""
+        n = self.size
+        diff = self.data[:, n] - self.data[:, 2*n+1]
+        return diff if side == SOUTH else -diff
+
+    def mirror(self):
+        """Return the batch as seen by the other side."""
+        return BoardBatch(numpy.roll(self.data, self.size + 1, axis=1))
+
+    def sow(self, side, moves):
+        """
+        Sow the stones from the pits MOVES on SIDE in every row.
 
-        return b, False
+        MOVES is a pit or an array with a pit for every row, that must
+        be legal.  Returns a new batch and a boolean array of the rows
+        with a repeat move, like Board.sow.
+        """
+        n = self.size
+        data = self.data.copy()
+        rows = numpy.arange(len(data))
+        moves = numpy.broadcast_to(numpy.asarray(moves), rows.shape)
+        if side == SOUTH:
+            start, store, skip = moves, n, 2*n + 1
+        else:
+            start, store, skip = moves + n + 1, 2*n + 1, n
+
+        # The positions stones are sown into, in board order, and the
+        # index of each position on the path of the stones from START.
+        ring = numpy.delete(numpy.arange(2*n + 2), skip)
+        width = len(ring)
+        first = numpy.searchsorted(ring, start)
+        order = (numpy.arange(width) - first[:, None] - 1) % width
+
+        stones = data[rows, start]
+        assert (stones > 0).all()
+        rounds, rest = numpy.divmod(stones, width)
+        data[rows, start] = 0
+        data[:, ring] += rounds[:, None] + (order < rest[:, None])
+        last = ring[(first + 1 + (stones - 1) % width) % width]
+
+        again = last == store
+        if side == SOUTH:
+            own = last < n
+        else:
+            own = (n < last) & (last < store)
+        opposite = 2*n - last
+        capture = ~again & own & (data[rows, last] == 1) & \
+            (data[rows, numpy.where(own, opposite, 0)] > 0)
+        captured = rows[capture]
+        data[captured, store] += data[captured, opposite[capture]] + 1
+        data[captured, opposite[capture]] = 0
+        data[captured, last[capture]] = 0
+
+        batch = BoardBatch(data)
+        final = batch.is_final()
+        if final.any():
+            data[final, n] += data[final, :n].sum(axis=1)
+            data[final, 2*n+1] += data[final, n+1:2*n+1].sum(axis=1)
+            data[final, :n] = 0
+            data[final, n+1:2*n+1] = 0
+        return batch, again & ~final
+
+    def children(self, side):
+        """
+        Make every legal move of SIDE in every row.
 
+        Returns a batch of the resulting boards, arrays of the row and
+        the move each of them was made from, and of the repeat moves.
+        """
+        parents, moves = numpy.nonzero(self.legal_moves(side))
+        batch, again = BoardBatch(self.data[parents]).sow(side, moves)
+        return batch, parents, moves, again
+
+    def playout(self, side=SOUTH, rng=None):
+        """
+        Play random moves in every row until the game is over.
 
-def connect(agent, host='wss://kalah.kwarc.info/socket', port=2671, token=None, name=None, authors=[], debug=False):
+        SIDE is to move in all rows, and RNG a numpy random generator.
+        Returns the final difference of the stores in every row, from
+        the perspective of SIDE.
+        """
+        if rng is None:
+            rng = numpy.random.default_rng()
+        batch = self if side == SOUTH else self.mirror()
+        data = batch.data.copy()
+        # every row is kept with the side to move as south
+        flipped = numpy.zeros(len(data), dtype=bool)
+        active = ~BoardBatch(data).is_final()
+        while active.any():
+            playing = BoardBatch(data[active])
+            legal = playing.legal_moves(SOUTH)
+            moves = numpy.argmax((rng.random(legal.shape) + 1) * legal, axis=1)
+            after, again = playing.sow(SOUTH, moves)
+            after.data[~again] = numpy.roll(after.data[~again], self.size + 1, axis=1)
+            data[active] = after.data
+            flipped[active] ^= ~again
+            active[active] = ~after.is_final()
+        # boards that were final from the start are not collected yet
+        n = self.size
+        values = data[:, :n+1].sum(axis=1) - data[:, n+1:].sum(axis=1)
+        return numpy.where(flipped, -values, values)
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table for search results, indexed by board keys.
+
+    The table is allocated once, with a capacity of MEGABYTES, and is
+    organised in buckets of two 16 byte entries.  The first entry of a
+    bucket is depth-preferred and only replaced by results of at least
+    the same depth or by results of a newer search.  The second entry
+    is always replaced.
+
+    Each entry consists of two 64-bit words.  The data word packs a
+    32-bit value, a 16-bit move, an 8-bit depth, the flag (EXACT,
+    LOWERBOUND or UPPERBOUND) and the generation of the search that
+    stored the entry.  The check word is the key XOR-ed with the data
+    word, so that an entry that is torn by concurrent writes does not
+    match any key.  An entry with a data word of 0 is unused.
+
+    If SHARED is true, the table is allocated in shared memory and
+    can be used concurrently by all processes forked after it was
+    created, without any locking.  Other processes can attach to it
+    by passing the table or its name (see attach).
+
+    The optional SIZE and SEEDS describe the boards the table is used
+    for.  A table can be written to a file using persist, and mapped
+    back into memory using load, which rejects files written by a
+    different version of this module or for different boards.
     """
-    Connect to KGP server at host:port as agent.
 
-    Agent is a generator function, that produces as many moves as it
-    can until the server ends a search request.
+    ENTRY_SIZE = 16
+    HEADER_SIZE = 64
+    MAGIC = int.from_bytes(b'KGP-TT\0\0', 'little')
+    VERSION = 1
+
+    def __init__(self, megabytes=16, shared=False, size=0, seeds=0):
+        """Create a new, empty table using up to MEGABYTES of memory."""
+        buckets = 1
+        while (self.HEADER_SIZE + buckets * 4 * self.ENTRY_SIZE
+               <= megabytes * 2**20):
+            buckets *= 2
+        length = self.HEADER_SIZE + buckets * 2 * self.ENTRY_SIZE
+
+        self._shm = self._mmap = None
+        if shared:
+            self._shm = shared_memory.SharedMemory(create=True, size=length)
+            self._owner = True
+            buf = self._shm.buf
+        else:
+            buf = bytearray(length)
+        self._attach(buf)
+
+        header = self._header
+        header[0] = self.MAGIC
+        header[1] = self.VERSION
+        header[2] = self.entries
+        header[3] = 1
+        header[4] = size
+        header[5] = seeds
+        self.reset_stats()
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to the shared table with the shared memory NAME."""
+        table = cls.__new__(cls)
+        table._mmap = None
+        table._shm = shared_memory.SharedMemory(name=name)
+        table._owner = False
+        table._attach(table._shm.buf)
+        if table._header[0] != cls.MAGIC:
+            table.close()
+            raise ValueError(f"{name} is not a transposition table")
+        table.reset_stats()
+        return table
+
+    @classmethod
+    def load(cls, path, size=0, seeds=0):
+        """
+        Map the table stored in the file PATH into memory.
 
-    The optional arguments TOKEN, NAME and AUTHORS are used to send
-    the server optional information about the client implementation.
+        The file is mapped copy-on-write, entries are only read from the
+        disk when they are accessed and changes are not written back
+        until the table is persisted.  A ValueError is raised if the
+        file was not written by persist for boards of SIZE with SEEDS.
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(mapping) < cls.HEADER_SIZE:
+            mapping.close()
+            raise ValueError(f"{path} is not a transposition table")
+        header = memoryview(mapping)[:cls.HEADER_SIZE].cast('Q')
+        magic = header[0]
+        header.release()
+        if magic != cls.MAGIC:
+            mapping.close()
+            raise ValueError(f"{path} is not a transposition table")
+
+        table = cls.__new__(cls)
+        table._shm = None
+        table._mmap = mapping
+        table._attach(mapping)
+        header = table._header
+        if header[1] != cls.VERSION:
+            table.close()
+            raise ValueError(f"{path} has an unsupported version")
+        if header[2] != table.entries or table.entries & (table.entries - 1):
+            table.close()
+            raise ValueError(f"{path} is truncated")
+        if (header[4], header[5]) != (size, seeds):
+            table.close()
+            raise ValueError(f"{path} was created for other boards")
+        table.reset_stats()
+        return table
+
+    def persist(self, path):
+        """
+        Write the table to the file PATH.
 
-    If DEBUG has a true value, the network communication is printed on
-    to the standard error stream.
+        The file is replaced atomically, so that it is safe to persist
+        a table that was loaded from the same file.
+        """
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.buffer)
+        os.replace(tmp, path)
+
+    def __reduce__(self):
+        if self._shm is None:
+            raise TypeError("only shared tables can be passed between processes")
+        return (type(self).attach, (self._shm.name,))
+
+    @property
+    def name(self):
+        """Name of the shared memory block, or None if not shared."""
+        return self._shm.name if self._shm else None
+
+    def close(self):
+        """
+        Release the table.
+
+        The shared memory of a shared table is removed, when it is
+        closed by the process that created it.
+        """
+        for view in (self._header, self._checks, self._data, self._view):
+            view.release()
+        self._header = self._checks = self._data = self._view = None
+        self.buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+
+    def _attach(self, buf):
+        """Lay out the arrays of the table over the buffer BUF."""
+        self.buffer = buf
+        self.entries = (len(buf) - self.HEADER_SIZE) // self.ENTRY_SIZE
+        self.mask = self.entries // 2 - 1
+
+        mem = self._view = memoryview(buf)
+        start = self.HEADER_SIZE
+        middle = start + 8 * self.entries
+        self._header = mem[:start].cast('Q')
+        self._checks = mem[start:middle].cast('Q')
+        self._data = mem[middle:middle + 8 * self.entries].cast('Q')
+
+    @property
+    def size(self):
+        """The board size this table is used for, or 0."""
+        return self._header[4]
+
+    @property
+    def seeds(self):
+        """The initial number of seeds per pit this table is used for, or 0."""
+        return self._header[5]
+
+    @property
+    def generation(self):
+        """The generation of the current search, between 1 and 63."""
+        return self._header[3]
+
+    def reset_stats(self):
+        """Reset the counters reported by stats."""
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+
+    def new_search(self):
+        """
+        Start a new search generation.
+
+        Entries stored by previous searches remain available, but are
+        replaced in favour of entries of the current generation.  For
+        shared tables, the generation is shared by all processes.
+        """
+        self._header[3] = self._header[3] % 63 + 1
+
+    def probe(self, key):
+        """
+        Look up KEY in the table.
+
+        Returns a tuple (value, depth, flag, move) or None, if KEY was
+        not found.
+        """
+        self.probes += 1
+        i = (key & self.mask) << 1
+        data = self._data[i]
+        if self._checks[i] ^ data != key or not data:
+            i += 1
+            data = self._data[i]
+            if self._checks[i] ^ data != key or not data:
+                return None
+        self.hits += 1
+
+        value = data & 0xFFFFFFFF
+        move = data >> 32 & 0xFFFF
+        return (value - (value >> 31 << 32), data >> 48 & 0xFF,
+                data >> 56 & 3, move - (move >> 15 << 16))
+
+    def store(self, key, value, depth, flag, move=-1):
+        """Store a search result for KEY in the table."""
+        i = (key & self.mask) << 1
+        generation = self._header[3]
+        old = self._data[i]
+        if (old and self._checks[i] ^ old != key and
+                old >> 58 == generation and old >> 48 & 0xFF > depth):
+            i += 1
+            old = self._data[i]
+        if old and self._checks[i] ^ old != key:
+            self.collisions += 1
+
+        data = (value & 0xFFFFFFFF |
+                (move & 0xFFFF) << 32 |
+                min(max(depth, 0), 255) << 48 |
+                flag << 56 |
+                generation << 58)
+        self._checks[i] = key ^ data
+        self._data[i] = data
+
+    def clear(self):
+        """Remove all entries from the table."""
+        start = self.HEADER_SIZE + 8 * self.entries
+        self.buffer[start:start + 8 * self.entries] = bytes(8 * self.entries)
+
+    def stats(self):
+        """
+        Return a dictionary with statistics about the table.
+
+        The counters are collected since the last call to reset_stats.
+        A collision is counted whenever an entry is replaced by an entry
+        for a different board.  The fill ratio is the fraction of
+        used entries, estimated from the first few thousand entries.
+        """
+        sample = self._data[:min(self.entries, 4096)]
+        used = sum(1 for data in sample if data)
+        return {'probes': self.probes,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.probes if self.probes else 0.0,
+                'collisions': self.collisions,
+                'fill': used / len(sample)}
+
+
+class MoveOrdering:
+    """
+    Order the moves of a search, so that the best move is tried first.
+
+    Moves are tried in the following order: the best move known from a
+    previous search, such as the move of a transposition table entry,
+    moves that end in the store and repeat, closest to the store
+    first, captures, the most stones first, the two killer moves of
+    the ply, i.e. the last moves that caused a cutoff at the same
+    distance from the root, and all other moves by their history, the
+    sum of the squared depths of all cutoffs they caused.  Killer
+    moves are kept for up to PLIES plies.  Repeats and captures are
+    recognised from the number of stones in the pits, without sowing.
+
+    A search calls order for every node and cutoff whenever a move
+    causes one.  The counters reported by stats show how often the
+    first move already caused the cutoff, which is the ratio a good
+    ordering approaches.
     """
-    assert inspect.isgeneratorfunction(agent)
 
-    COMMAND_PATTERN = re.compile(r"""
-^                   # beginning of line
-\s*                 # preceding white space is ignored
-(?:                 # the optional ID segment
-(?P<id>\d+)         # ... must consist of an ID
-(?:@(?P<ref>\d+))?  # ... and may consist of a reference
-\s+                 # ... and must have trailing white space
-)?
-(?P<cmd>\w+)        # the command is just a alphanumeric word
-(?:                 # the optional argument segment
-\s+                 # ... ignores preceding white space
-(?P<args>.*?)       # ... and matches the rest of the line
-)?
-\s*$                # trailing white space is ignored
-""", re.VERBOSE)
+    def __init__(self, size, plies=128):
+        """Create an ordering for boards of SIZE."""
+        self.size = size
+        self.killers = [[-1, -1] for _ in range(plies)]
+        self.history = ([0] * size, [0] * size)
+        self.reset_stats()
+
+    def order(self, board, side, ply, best=-1):
+        """
+        Return the legal moves for SIDE on BOARD, the most promising first.
+
+        PLY is the distance from the root of the search and BEST the
+        best move known, or -1.
+        """
+        d = board._data
+        n = board.size
+        base, other = (0, n + 1) if side == SOUTH else (n + 1, 0)
+        cycle = 2*n + 1
+        history = self.history[side]
+        first, second = self.killers[ply] if ply < len(self.killers) else (-1, -1)
+
+        def rank(move):
+            if move == best:
+                return (4, 0)
+            stones = d[base + move]
+            if stones % cycle == n - move:
+                return (3, move)
+            if stones < cycle:
+                # the last stone lands in an empty pit of SIDE, if the
+                # pit is passed only once, after a round for every
+                # pit of the opponent
+                last, rounds = move + stones, 0
+                if last >= cycle:
+                    last, rounds = last - cycle, 1
+                if last < n and d[base + last] == 0:
+                    captured = d[other + n - 1 - last] + rounds
+                    if captured:
+                        return (2, captured)
+            if move == first:
+                return (1, 1)
+            if move == second:
+                return (1, 0)
+            return (0, history[move])
+
+        moves = [move for move in range(n) if d[base + move]]
+        moves.sort(key=rank, reverse=True)
+        return moves
+
+    def cutoff(self, side, move, ply, depth, index=0):
+        """
+        Record that MOVE of SIDE caused a cutoff.
+
+        PLY is the distance from the root, DEPTH the remaining depth of
+        the search and INDEX the position of MOVE in the order tried.
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_cutoffs += 1
+        if ply < len(self.killers):
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history[side][move] += depth * depth
+
+    def new_search(self):
+        """
+        Start a new search.
+
+        The killer moves are forgotten and the history is halved, so
+        that it follows the changes of the position.
+        """
+        for killers in self.killers:
+            killers[0] = killers[1] = -1
+        for history in self.history:
+            history[:] = [value >> 1 for value in history]
+
+    def reset_stats(self):
+        """Reset the counters reported by stats."""
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+
+    def stats(self):
+        """
+        Return a dictionary with statistics about the ordering.
+
+        The counters are collected since the last call to reset_stats.
+        """
+        return {'cutoffs': self.cutoffs,
+                'first_cutoffs': self.first_cutoffs,
+                'first_cutoff_rate': (self.first_cutoffs / self.cutoffs
+                                      if self.cutoffs else 0.0)}
 
-    if os.getenv("KGP_PORT"):
-        port = int(os.getenv("KGP_PORT"))
-    host = os.getenv("KGP_HOST", host)
 
-    STRING_PATTERN = re.compile(r'^"((?:\\.|[^"])*)"\s*')
-    INTEGER_PATTERN = re.compile(r'^(\d+)\s*')
-    FLOAT_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*')
-    BOARD_PATTERN = _BOARD_PATTERN
+class EndgameTable:
+    """
+    Exact values of all boards with up to STONES stones in the pits.
+
+    As the stores do not influence the rest of a game, a board is
+    described by its pits alone.  The table holds the difference of
+    the stones the side to move will still put into its store and
+    those the opponent will, if both play perfectly, as a signed byte.
+    All pit configurations with the same number of stones are ranked
+    using the combinatorial number system, and configurations with
+    fewer stones come first.
+
+    A table is computed by build, as moves never add stones to the
+    pits, starting with the boards with the least stones.  It can be
+    written to a file using persist, and mapped back into memory
+    using load.
+    """
 
-    queue = mp.Queue()
+    HEADER_SIZE = 64
+    MAGIC = int.from_bytes(b'KGP-EGTB', 'little')
+    VERSION = 1
+    UNKNOWN = -128
+
+    def __init__(self, size, stones):
+        """Create a table for boards of SIZE, with all values unknown."""
+        assert stones < -self.UNKNOWN
+        self._init(size, stones)
+        buf = bytearray(self.HEADER_SIZE) + \
+            bytes([self.UNKNOWN & 0xff]) * self.entries
+        self._mmap = None
+        self._attach(buf)
+        header = self._header
+        header[0] = self.MAGIC
+        header[1] = self.VERSION
+        header[2] = size
+        header[3] = stones
+        header[4] = self.entries
+
+    def _init(self, size, stones):
+        self.size = size
+        self.stones = stones
+        pits = 2 * size
+        # _binomial[a][b] is a choose b
+        self._binomial = [[math.comb(a, b) for b in range(pits + 1)]
+                          for a in range(stones + pits + 1)]
+        # _offsets[k] is the number of boards with less than k stones
+        self._offsets = [math.comb(k - 1 + pits, pits) for k in range(stones + 2)]
+        self.entries = self._offsets[stones + 1]
+
+    def _attach(self, buf):
+        """Lay out the header and values of the table over BUF."""
+        mem = self._view = memoryview(buf)
+        self._header = mem[:self.HEADER_SIZE].cast('Q')
+        self._values = mem[self.HEADER_SIZE:self.HEADER_SIZE + self.entries].cast('b')
+        self.buffer = buf
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map the table stored in the file PATH into memory.
 
-    def split(args):
+        A ValueError is raised if the file was not written by persist.
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapping) < cls.HEADER_SIZE:
+            mapping.close()
+            raise ValueError(f"{path} is not an endgame table")
+
+        header = memoryview(mapping)[:cls.HEADER_SIZE].cast('Q')
+        magic, version, size, stones, entries = header[:5]
+        header.release()
+        if magic != cls.MAGIC:
+            mapping.close()
+            raise ValueError(f"{path} is not an endgame table")
+        if version != cls.VERSION:
+            mapping.close()
+            raise ValueError(f"{path} has an unsupported version")
+
+        table = cls.__new__(cls)
+        table._init(size, stones)
+        if entries != table.entries or len(mapping) < cls.HEADER_SIZE + entries:
+            mapping.close()
+            raise ValueError(f"{path} is truncated")
+        table._mmap = mapping
+        table._attach(mapping)
+        return table
+
+    def persist(self, path):
+        """Write the table to the file PATH, replacing it atomically."""
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.buffer)
+        os.replace(tmp, path)
+
+    def close(self):
+        """Release the table."""
+        for view in (self._header, self._values, self._view):
+            view.release()
+        self._header = self._values = self._view = None
+        self.buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def index(self, board, side=SOUTH):
         """
-        Parse ARGS as far as possible.
+        Return the index of BOARD with SIDE to move in the table.
 
-        Returns a list of python objects, each equivalent to the
-        elements of ARGS as parsed in order.
+        Returns None if there are too many stones in the pits.
         """
+        d = board._data
+        n = self.size
+        assert board.size == n
+        if side == SOUTH:
+            pits = [*d[:n], *d[n+1:2*n+1]]
+        else:
+            pits = [*d[n+1:2*n+1], *d[:n]]
+        stones = sum(pits)
+        if stones > self.stones:
+            return None
+
+        # The pits are the gaps between 2n-1 bars, placed among the
+        # stones, whose positions are ranked as a combination.
+        binomial = self._binomial
+        rank = self._offsets[stones]
         upto = 0
-        parsed = []
+        for bar in range(2*n - 1):
+            upto += pits[bar]
+            rank += binomial[upto + bar][bar + 1]
+        return rank
 
-        while True:
-            for pat in (STRING_PATTERN,
-                        INTEGER_PATTERN,
-                        FLOAT_PATTERN,
-                        BOARD_PATTERN):
-                match = pat.search(args[upto:])
-                if not match:
-                    continue
+    def lookup(self, board, side=SOUTH):
+        """
+        Return the final difference of the stores of BOARD.
 
-                arg = match.group(1)
-                if pat == STRING_PATTERN:
-                    parsed.append(re.sub(r'\\(.)', '\\1', arg))
-                elif pat == INTEGER_PATTERN:
-                    parsed.append(int(arg))
-                elif pat == FLOAT_PATTERN:
-                    parsed.append(float(arg))
-                elif pat == BOARD_PATTERN:
-                    parsed.append(Board.parse(arg))
+        SIDE is to move, and the difference is from the perspective of
+        south, like the value of a search.  Returns None if BOARD is
+        not in the table.
+        """
+        index = self.index(board, side)
+        if index is None:
+            return None
+        value = self._values[index]
+        if value == self.UNKNOWN:
+            return None
+        if side == NORTH:
+            value = -value
+        return board.south - board.north + value
+
+    def _solve(self, board):
+        """Return the value of BOARD with south to move, filling the table."""
+        index = self.index(board)
+        value = self._values[index]
+        if value != self.UNKNOWN:
+            return value
+
+        d = board._data
+        n = self.size
+        if board.is_final():
+            value = sum(d[:n]) - sum(d[n+1:2*n+1])
+        else:
+            value = -self.stones - 1
+            for move in board.legal_moves(SOUTH):
+                before = d[n] - d[2*n+1]
+                again, undo = board.make_move(SOUTH, move)
+                gain = d[n] - d[2*n+1] - before
+                if again:
+                    gain += self._solve(board)
                 else:
-                    assert(False)
+                    gain -= self._solve(board.mirror())
+                board.unmake_move(undo)
+                value = max(value, gain)
 
-                upto += match.end(0)
-                break
-            else:
-                return parsed
+        self._values[index] = value
+        return value
 
-    def handle(read, write):
-        id = mp.Value('d', 1)
+    @classmethod
+    def build(cls, size, stones):
+        """Compute the table for boards of SIZE with up to STONES stones."""
+        table = cls(size, stones)
 
-        def send(cmd, *args, ref=None):
-            """
-            Send cmd with args to server.
+        def distribute(stones, pits):
+            if pits == 1:
+                yield (stones,)
+                return
+            for first in range(stones + 1):
+                for rest in distribute(stones - first, pits - 1):
+                    yield (first, *rest)
 
-            If ref is not None, add a reference.
-            """
+        for count in range(stones + 1):
+            for pits in distribute(count, 2 * size):
+                table._solve(Board(0, 0, pits[:size], pits[size:]))
+        return table
 
-            msg = str(int(id.value))
-            if ref:
-                msg += f'@{ref}'
-            msg += " " + cmd
 
-            for arg in args:
-                msg += " "
-                if isinstance(arg, str):
-                    string = re.sub(r'"', '\\"', arg)
-                    msg += f'"{string}"'
-                else:
-                    msg += str(arg)
+class OpeningBook:
+    """
+    Moves for the boards at the beginning of games, searched in advance.
 
-            if debug:
-                print(">", msg, file=sys.stderr)
-            msg += "\r\n"
-            queue.put(msg)
+    The book maps the key of a board, with south to move, to the value
+    and the move found by a search and the depth of that search.  The
+    keys are sorted, so that a board is looked up by bisection, also
+    when the book is mapped into memory from a file written by
+    persist using load.  Boards of any size can share one book.
+    """
 
-            with id.get_lock():
-                id.value += 2
+    HEADER_SIZE = 64
+    MAGIC = int.from_bytes(b'KGP-BOOK', 'little')
+    VERSION = 1
 
-        def query(state, cid):
-            """
-            Start querying agent what move to make.
+    def __init__(self, entries=None):
+        """
+        Create a book from the dictionary ENTRIES, by default empty.
 
-            State is the current board state and cid the ID of the
-            state command that issued the request.
-            """
+        ENTRIES maps the key of a board to a tuple of the value, the
+        move and the depth, as returned by lookup.
+        """
+        if entries is None:
+            entries = {}
+        self._mmap = None
+        keys = sorted(entries)
+        buf = bytearray(self.HEADER_SIZE + 16 * len(keys))
+        self._attach(buf, len(keys))
+        header = self._header
+        header[0] = self.MAGIC
+        header[1] = self.VERSION
+        header[2] = len(keys)
+        for i, key in enumerate(keys):
+            value, move, depth = entries[key]
+            self._keys[i] = key
+            self._data[i] = ((value & 0xffffffff) | (move & 0xffff) << 32 |
+                             (depth & 0xff) << 48)
+
+    def _attach(self, buf, count):
+        mem = self._view = memoryview(buf)
+        start = self.HEADER_SIZE
+        middle = start + 8 * count
+        self._header = mem[:start].cast('Q')
+        self._keys = mem[start:middle].cast('Q')
+        self._data = mem[middle:middle + 8 * count].cast('Q')
+        self.buffer = buf
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map the book stored in the file PATH into memory.
 
-            if state.is_final():
-                return
-            last = None
-            for move in agent(state):
-                if not type(move) is int:
-                    raise TypeError("Not a move")
-                if move != last:
-                    send("move", move+1, ref=cid)
-                    last = move
+        A ValueError is raised if the file was not written by persist.
+        """
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapping) < cls.HEADER_SIZE:
+            mapping.close()
+            raise ValueError(f"{path} is not an opening book")
+        magic, version, count = array('Q', mapping[:24])
+        if magic != cls.MAGIC:
+            mapping.close()
+            raise ValueError(f"{path} is not an opening book")
+        if version != cls.VERSION:
+            mapping.close()
+            raise ValueError(f"{path} has an unsupported version")
+        if len(mapping) < cls.HEADER_SIZE + 16 * count:
+            mapping.close()
+            raise ValueError(f"{path} is truncated")
+        book = cls.__new__(cls)
+        book._mmap = mapping
+        book._attach(mapping, count)
+        return book
+
+    def persist(self, path):
+        """Write the book to the file PATH, replacing it atomically."""
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self.buffer)
+        os.replace(tmp, path)
+
+    def close(self):
+        """Release the book."""
+        for view in (self._header, self._keys, self._data, self._view):
+            view.release()
+        self._header = self._keys = self._data = self._view = None
+        self.buffer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, board):
+        """
+        Return the value, move and depth for BOARD with south to move.
+
+        Returns None if BOARD is not in the book.  Only the key of BOARD
+        is compared, so a caller playing the move should check that it
+        is legal, in case another board has the same key.
+        """
+        key = board.key
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        data = self._data[i]
+        value = data & 0xffffffff
+        if value & 0x80000000:
+            value -= 1 << 32
+        return value, (data >> 32) & 0xffff, (data >> 48) & 0xff
+
+    @classmethod
+    def build(cls, search, boards, depth, plies, report=None):
+        """
+        Search the beginning of games starting with BOARDS.
+
+        SEARCH is called as search(state, depth), like by
+        IterativeDeepening, and returns the value and the best move of
+        a board with south to move.  Every board south may face within
+        its first PLIES moves, whether it begins or not, is searched to
+        DEPTH.  Only the move found is followed, but all replies of the
+        opponent.  REPORT is called with each board and its entry.
+        """
+        entries = {}
+        # boards with south to move and the number of moves made
+        pending = []
+        for board in boards:
+            pending.append((board, 0))
+            # north begins, and south moves after its replies
+            pending.extend((reply, 0) for reply in cls._replies(board))
+
+        while pending:
+            board, moves = pending.pop()
+            if board.key in entries or board.is_final():
+                continue
+            value, move, *_ = search(board, depth)
+            entries[board.key] = (value, move, depth)
+            if report is not None:
+                report(board, entries[board.key])
+            if moves + 1 >= plies:
+                continue
+            after, again = board.sow(SOUTH, move)
+            if again:
+                pending.append((after, moves + 1))
             else:
-                send("yield", ref=cid)
+                pending.extend((reply, moves + 1)
+                               for reply in cls._replies(after))
 
-        threads = {}
+        return cls(entries)
 
-        def sender():
-            while True:
-                write(queue.get())
-        threading.Thread(target=sender).start()
+    @staticmethod
+    def _replies(board):
+        """Return the boards after every sequence of moves north can make."""
+        result = []
+        pending = [board]
+        while pending:
+            board = pending.pop()
+            if board.is_final():
+                continue
+            for move in board.legal_moves(NORTH):
+                after, again = board.sow(NORTH, move)
+                if again:
+                    pending.append(after)
+                else:
+                    result.append(after)
+        return result
 
-        for line in read():
-            if debug:
-                print("<", line.strip(), file=sys.stderr)
 
-            try:
-                match = COMMAND_PATTERN.match(line)
-                if not match:
-                    continue
-                cid, ref = None, None
-                if match.group('id'):
-                    cid = int(match.group('id'))
-                if match.group('ref'):
-                    ref = int(match.group('ref'))
-                cmd = match.group('cmd')
-                args = split(match.group('args'))
+class _Cancelled(BaseException):
+    """Raised inside a worker process to abandon the current search."""
 
-                if cmd == "kgp":
-                    major, _minor, _patch = args
-                    if major != 1:
-                        send("error", "protocol not supported", ref=cid)
-                        raise ValueError()
-                    if name:
-                        send("set", "info:name", name)
-                    if authors:
-                        send("set", "info:authors", ",".join(authors))
-                    if token:
-                        send("set", "auth:token", token)
-                    send("mode", "freeplay")
-                elif cmd == "state":
-                    board = args[0]
 
-                    if cid in threads:
-                        # Duplicate IDs by the server are ignored
-                        continue
+def _start_interruptible(procs):
+    """
+    Start the processes PROCS with SIGUSR1 blocked.
 
-                    threads[cid] = mp.Process(
-                        name=f'query-{cid}',
-                        args=(board, cid),
-                        target=query)
-                    threads[cid].start()
-                elif cmd == "stop":
-                    if ref and ref in threads:
-                        thread = threads[ref]
-                        thread.kill()
-                        thread.join()
-                        threads.pop(ref, None)
-                elif cmd == "ok":
-                    pass    # ignored
-                elif cmd == "error":
-                    pass    # ignored
-                elif cmd == "ping":
-                    if len(args) >= 1:
-                        send("pong", args[0], ref=cid)
-                    else:
-                        send("pong", ref=cid)
-                elif cmd == "goodbye":
-                    return
-            except ValueError:
-                pass
-            except TypeError:
-                pass
+    The signal remains blocked until the process has installed its
+    handler using _interruptible, as it would otherwise be killed by a
+    signal that arrives too early.
+    """
+    if not hasattr(signal, 'pthread_sigmask'):
+        for proc in procs:
+            proc.start()
+        return
+    old = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+    try:
+        for proc in procs:
+            proc.start()
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old)
+
+
+def _interruptible(handler):
+    """Install HANDLER for SIGUSR1 and unblock the signal."""
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, handler)
+    if hasattr(signal, 'pthread_sigmask'):
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGUSR1})
+
+
+@contextlib.contextmanager
+def _uninterrupted():
+    """
+    Block SIGUSR1 within the context.
 
-    if host.startswith("ws"):
-        assert 'websocket' in sys.modules,\
-            "websocket library couldn't be loaded"
+    A search can be cancelled by the signal (see connect), which must
+    not arrive in the middle of a message.
+    """
+    if not hasattr(signal, 'pthread_sigmask'):
+        yield
+        return
+    old = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old)
 
-        ws = websocket.WebSocket(enable_multithread=True)
-        ws.connect(host)
-        def lines():
+
+class _WorkerPool:
+    """
+    Search processes that are started in advance and reused.
+
+    Each worker takes (state, id, args) jobs from a queue and passes
+    them to QUERY, as query(state, id, stopped, *args).  A job is
+    cancelled by recording its ID in a small ring of stopped IDs, that
+    the worker checks before starting a job and whenever the agent
+    produced a move.  As the agent might not produce a move for a long
+    time, the worker is additionally interrupted using SIGUSR1, where
+    available.  The signal can be delivered to any thread of the
+    worker, so QUERY should not start threads.
+
+    A job that raises an exception is abandoned, and the worker goes
+    on with the next one.  If DEBUG has a true value, the traceback is
+    printed to the standard error stream.
+    """
+
+    STOPPED = 64
+
+    def __init__(self, workers, query, debug=False):
+        """Start WORKERS processes that handle jobs using QUERY."""
+        self.debug = debug
+        self._jobs = mp.Queue()
+        self._running = mp.Array('q', workers, lock=False)
+        self._stopped = mp.Array('q', self.STOPPED, lock=False)
+        self._next = 0
+        self._procs = [mp.Process(name=f'worker-{slot}',
+                                  args=(slot, query),
+                                  target=self._work)
+                       for slot in range(workers)]
+        _start_interruptible(self._procs)
+
+    def is_stopped(self, cid):
+        """Check if the job for CID has been stopped."""
+        return cid in self._stopped[:]
+
+    def _work(self, slot, query):
+        busy = None
+
+        def interrupt(_signum, _frame):
+            if busy is not None and self.is_stopped(busy):
+                raise _Cancelled()
+        _interruptible(interrupt)
+
+        while True:
             try:
-                while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                state, cid, args = job
+                if self.is_stopped(cid):
+                    continue
+                self._running[slot] = cid or 0
+                busy = cid
+                try:
+                    query(state, cid, lambda: self.is_stopped(cid), *args)
+                finally:
+                    busy = None
+            except _Cancelled:
+                pass
+            except Exception:
+                if self.debug:
+                    traceback.print_exc()
+            self._running[slot] = 0
+
+    def submit(self, state, cid, *args):
+        """Queue a search of STATE for the state command CID."""
+        self._jobs.put((state, cid, args))
+
+    def stop(self, cid):
+        """Cancel the job for CID, if it is queued or running."""
+        self._stopped[self._next % self.STOPPED] = cid
+        self._next += 1
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        for slot, proc in enumerate(self._procs):
+            if self._running[slot] == cid:
+                os.kill(proc.pid, signal.SIGUSR1)
+
+    def close(self, lock=None):
+        """
+        Shut down all workers.
+
+        The running jobs are stopped, and a worker that does not end
+        in time is killed.  If LOCK is given, e.g. the lock a worker
+        holds while sending a message, a worker is only killed while
+        LOCK is held, so that it does not die holding it.
+        """
+        for cid in set(self._running[:]) - {0}:
+            self.stop(cid)
+        for _ in self._procs:
+            self._jobs.put(None)
+        for proc in self._procs:
+            proc.join(timeout=1)
+            if proc.is_alive():
+                with lock or contextlib.nullcontext():
+                    proc.kill()
+                    proc.join()
+
+
+class SearchPool:
+    """
+    Processes that search the moves of a state in parallel.
+
+    SEARCH is a function taking a board, a depth and the side to move,
+    and returning the value of the board from the perspective of
+    south.  It has to handle final boards.  When searching a state,
+    each legal move is handed to the next idle worker, that makes the
+    move and calls SEARCH on the result with one depth less.
+
+    The workers are started when the pool is created and are reused
+    for all following searches, also by processes forked afterwards,
+    e.g. by connect.  Starting a new search abandons the previous one.
+    To let the workers share results, SEARCH can use a transposition
+    table in shared memory, that was created before the pool.  An
+    exception raised by SEARCH in a worker is raised again by
+    search_moves.
+    """
+
+    def __init__(self, search, workers=None):
+        """Start WORKERS processes, by default one per CPU."""
+        self.search = search
+        self.workers = workers or os.cpu_count() or 1
+        self._job = mp.Value('q', 0, lock=False)
+        self._conns = []
+        self._procs = []
+        children = []
+        for slot in range(self.workers):
+            conn, child = mp.Pipe()
+            self._procs.append(mp.Process(name=f'search-{slot}',
+                                          args=(child,),
+                                          target=self._work,
+                                          daemon=True))
+            self._conns.append(conn)
+            children.append(child)
+        _start_interruptible(self._procs)
+        for child in children:
+            child.close()
+
+    def _work(self, conn):
+        busy = None
+
+        def interrupt(_signum, _frame):
+            if busy is not None and busy != self._job.value:
+                raise _Cancelled()
+        _interruptible(interrupt)
+
+        while True:
+            try:
+                task = conn.recv()
+                if task is None:
+                    return
+                job, state, move, depth, side = task
+                if job != self._job.value:
+                    continue
+                busy = job
+                try:
+                    after, again = state.sow(side, move)
+                    value = self.search(after, depth - 1,
+                                        side if again else not side)
+                except Exception as e:
+                    value = e
+                finally:
+                    busy = None
+                try:
+                    conn.send((job, move, value))
+                except Exception:
+                    # the exception could not be pickled
+                    conn.send((job, move, RuntimeError(repr(value))))
+            except _Cancelled:
+                pass
+            except EOFError:
+                return
+
+    def _interrupt(self):
+        """Interrupt workers that are still busy with an older search."""
+        if hasattr(signal, 'SIGUSR1'):
+            for proc in self._procs:
+                os.kill(proc.pid, signal.SIGUSR1)
+
+    def search_moves(self, state, depth, side=SOUTH):
+        """
+        Search all legal moves SIDE can make on STATE in parallel.
+
+        Returns a list of (value, move) tuples, ordered by the moves.
+        """
+        job = self._job.value + 1
+        self._job.value = job
+        self._interrupt()
+
+        moves = state.legal_moves(side)
+        pending = list(reversed(moves))
+        idle = list(self._conns)
+        results = {}
+        while len(results) < len(moves):
+            while pending and idle:
+                task = (job, state, pending.pop(), depth, side)
+                conn = idle.pop()
+                with _uninterrupted():
+                    conn.send(task)
+
+            for conn in mp.connection.wait(self._conns):
+                with _uninterrupted():
+                    done, move, value = conn.recv()
+                if done == job:
+                    if isinstance(value, Exception):
+                        raise value
+                    results[move] = value
+                    idle.append(conn)
+
+        return [(results[move], move) for move in moves]
+
+    def agent(self, state, depths=range(1, 16)):
+        """
+        Agent generator searching STATE with increasing DEPTHS.
+
+        The best move of every completed depth is yielded, so that the
+        method can directly be passed to connect.
+        """
+        try:
+            for depth in depths:
+                yield max(self.search_moves(state, depth),
+                          key=lambda ent: ent[0])[1]
+        finally:
+            # abandon the search when the agent is stopped
+            self._job.value += 1
+            self._interrupt()
+
+    def close(self):
+        """Stop all workers."""
+        for conn in self._conns:
+            conn.send(None)
+            conn.close()
+        for proc in self._procs:
+            proc.join(timeout=1)
+            if proc.is_alive():
+                proc.kill()
+
+
+class Stopped(Exception):
+    """Raised by a search that was stopped before it finished."""
+
+
+class Negamax:
+    """
+    Principal variation search of the value and best move of a state.
+
+    Values are differences of the stores from the perspective of the
+    side to move, so that the value of a child is negated when the
+    other side moves next.  After a repeat move, the same side moves
+    again, and the value and the window are passed on unchanged; a
+    repeat move does not count towards the depth.  The first move of
+    a node is searched with the full window, all other moves with a
+    null window, and only searched again if they turn out better.
+
+    The results are stored in the optional transposition TABLE with
+    the flag EXACT, LOWERBOUND (the search failed high, the value is
+    at least the one stored) or UPPERBOUND (it failed low), and are
+    used to cut off later searches of the same board.  Moves are
+    tried in the order of a MoveOrdering, starting with the move of
+    the table.  ENDGAME is an optional EndgameTable, whose exact
+    values replace searches of boards with few stones left.  Leaves
+    are valued by EVALUATE, called as evaluate(board, side), by
+    default the difference of the stores for SIDE.
+
+    When the same state is searched repeatedly with increasing
+    depths, e.g. by IterativeDeepening, every search after the first
+    starts with an aspiration window of WINDOW around the previous
+    value, which is widened if the value falls outside of it.
+
+    STOP is an optional function, that is called at every node.  When
+    it returns a true value, the search is abandoned by raising
+    Stopped, e.g. when the server stopped the request in a thread.
+    """
+
+    INFINITY = 1 << 24
+
+    def __init__(self, table=None, endgame=None, evaluate=None, window=2, stop=None):
+        self.table = table
+        self.endgame = endgame
+        self.evaluate = evaluate or (lambda board, side: board[side] - board[not side])
+        self.window = window
+        self.stop = stop
+        self.ordering = None
+        self._root = None
+        self._previous = None
+        self.depth = 0
+        self.nodes = 0
+        self.time = 0.0
+        self.researches = 0
+
+    def search(self, state, depth):
+        """
+        Search STATE, with south to move, to DEPTH.
+
+        Returns the value, the best move and the number of nodes
+        visited, and can be passed to IterativeDeepening.  Raises
+        Stopped if STOP ended the search.
+        """
+        start = time.monotonic()
+        if self.ordering is None or self.ordering.size != state.size:
+            self.ordering = MoveOrdering(state.size)
+        if self._root != state:
+            # a new move, only the history of searches is kept
+            self._root = state.copy()
+            self._previous = None
+            self.ordering.new_search()
+            if self.table is not None:
+                self.table.new_search()
+
+        board = state.copy()
+        self._move = -1
+        self.nodes = 0
+        self.researches = 0
+        alpha, beta = -self.INFINITY, self.INFINITY
+        if self._previous is not None:
+            alpha = self._previous - self.window
+            beta = self._previous + self.window
+        while True:
+            value = self._search(board, SOUTH, depth, alpha, beta, 0)
+            if alpha < value < beta:
+                break
+            self.researches += 1
+            if value <= alpha:
+                alpha = -self.INFINITY
+            else:
+                beta = self.INFINITY
+
+        self._previous = value
+        self.depth = depth
+        self.time = time.monotonic() - start
+        return value, self._move, self.nodes
+
+    def _search(self, board, side, depth, alpha, beta, ply):
+        """Return the value of BOARD for SIDE to move, searched to DEPTH."""
+        self.nodes += 1
+        if self.stop is not None and self.stop():
+            raise Stopped()
+        if board.is_final():
+            return board[side] - board[not side]
+        if ply > 0:
+            if self.endgame is not None:
+                exact = self.endgame.lookup(board, side)
+                if exact is not None:
+                    return exact if side == SOUTH else -exact
+            if depth <= 0:
+                return self.evaluate(board, side)
+
+        original = alpha
+        key = board.key ^ side
+        best = -1
+        if self.table is not None:
+            entry = self.table.probe(key)
+            if entry is not None:
+                value, stored, flag, best = entry
+                if stored >= depth and ply > 0:
+                    if flag == EXACT:
+                        return value
+                    if flag == LOWERBOUND:
+                        alpha = max(alpha, value)
+                    else:
+                        beta = min(beta, value)
+                    if alpha >= beta:
+                        return value
+
+        result, found = -self.INFINITY, -1
+        for index, move in enumerate(self.ordering.order(board, side, ply, best)):
+            again, undo = board.make_move(side, move)
+            if again:
+                if index == 0:
+                    value = self._search(board, side, depth, alpha, beta, ply + 1)
+                else:
+                    value = self._search(board, side, depth, alpha, alpha + 1, ply + 1)
+                    if alpha < value < beta:
+                        value = self._search(board, side, depth, alpha, beta, ply + 1)
+            else:
+                if index == 0:
+                    value = -self._search(board, not side, depth - 1,
+                                          -beta, -alpha, ply + 1)
+                else:
+                    value = -self._search(board, not side, depth - 1,
+                                          -alpha - 1, -alpha, ply + 1)
+                    if alpha < value < beta:
+                        value = -self._search(board, not side, depth - 1,
+                                              -beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+
+            if value > result:
+                result, found = value, move
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                self.ordering.cutoff(side, move, ply, depth, index)
+                break
+
+        if self.table is not None:
+            if result <= original:
+                flag = UPPERBOUND
+            elif result >= beta:
+                flag = LOWERBOUND
+            else:
+                flag = EXACT
+            self.table.store(key, result, depth, flag, found)
+        if ply == 0:
+            self._move = found
+        return result
+
+    def principal_variation(self, state, side=SOUTH, limit=64):
+        """
+        Return the moves expected to be played from STATE, SIDE to move.
+
+        The moves are followed through the transposition table, up to
+        LIMIT moves or until a board is missing from it.
+        """
+        if self.table is None:
+            return []
+        board = state.copy()
+        moves = []
+        seen = set()
+        while len(moves) < limit and not board.is_final():
+            key = board.key ^ side
+            entry = self.table.probe(key)
+            if entry is None or key in seen:
+                break
+            move = entry[3]
+            if not (0 <= move < board.size and board.is_legal(side, move)):
+                break
+            seen.add(key)
+            moves.append(move)
+            again, _ = board.make_move(side, move)
+            if not again:
+                side = not side
+        return moves
+
+    def stats(self):
+        """
+        Return a dictionary with statistics about the last search.
+
+        The effective branching factor is the number b, for which a
+        tree of the depth searched with b children per node has as
+        many nodes as were visited.
+        """
+        return {'depth': self.depth,
+                'nodes': self.nodes,
+                'time': self.time,
+                'nps': self.nodes / self.time if self.time else 0.0,
+                'branching_factor': (self.nodes ** (1 / self.depth)
+                                     if self.depth else 0.0),
+                'researches': self.researches}
+
+
+class IterativeDeepening:
+    """
+    Search a state with increasing depths within a time budget.
+
+    SEARCH is called as search(state, depth) and returns the value
+    and the best move of STATE searched to DEPTH, optionally followed
+    by the number of nodes it visited.  BUDGET is the time in seconds
+    available for a move.  After every iteration, the time of the
+    next one is estimated from the effective branching factor, and
+    the search ends if it could not finish within the budget, instead
+    of being stopped by the server in the middle of it.
+
+    Every iteration is recorded as a dictionary with the entries
+    'depth', 'value', 'move', 'nodes', 'time' and 'nps' in the list
+    iterations, and passed to REPORT if it is not None.
+    """
+
+    def __init__(self, search, budget, depths=range(1, 64), report=None):
+        self.search = search
+        self.budget = budget
+        self.depths = depths
+        self.report = report
+        self.iterations = []
+
+    def branching_factor(self):
+        """
+        Estimate the effective branching factor of the last iterations.
+
+        The ratio of the nodes, or of the times if no nodes are known,
+        is averaged over the last two iterations, as alpha-beta
+        searches of odd and even depths differ.  Returns None if there
+        are not enough iterations.
+        """
+        key = 'nodes'
+        if any(it['nodes'] is None for it in self.iterations[-3:]):
+            key = 'time'
+        amounts = [it[key] for it in self.iterations[-3:]]
+        if len(amounts) < 2 or not amounts[0]:
+            return None
+        steps = len(amounts) - 1
+        return max(1.0, (amounts[-1] / amounts[0]) ** (1 / steps))
+
+    def exhausted(self):
+        """True if the last iteration searched the whole game tree."""
+        if len(self.iterations) < 2 or self.iterations[-1]['nodes'] is None:
+            return False
+        return self.iterations[-1]['nodes'] == self.iterations[-2]['nodes']
+
+    def estimate(self):
+        """Estimate the time the next iteration will take."""
+        factor = self.branching_factor()
+        if factor is None:
+            return 0.0
+        return self.iterations[-1]['time'] * factor
+
+    def agent(self, state, iterations=(), deadline=None):
+        """
+        Agent generator yielding the best move of every iteration.
+
+        The method can directly be passed to connect.  It returns
+        early if the next iteration is not expected to finish in time,
+        or if the last one visited as many nodes as the one before,
+        i.e. the whole game tree was searched.
+
+        ITERATIONS are already finished iterations of STATE, e.g. from
+        pondering, that the search continues from.  DEADLINE is the
+        time.monotonic() time the move is due, as passed by connect,
+        and replaces the budget.
+        """
+        self.iterations = list(iterations)
+        if deadline is None:
+            deadline = time.monotonic() + self.budget
+        for depth in self.depths:
+            if self.iterations:
+                if depth <= self.iterations[-1]['depth']:
+                    continue
+                if self.exhausted():
+                    return
+                if time.monotonic() + self.estimate() > deadline:
+                    return
+
+            iteration = self.iterate(state, depth)
+            self.iterations.append(iteration)
+            if self.report is not None:
+                self.report(iteration)
+            yield iteration['move']
+
+    def iterate(self, state, depth):
+        """Search STATE to DEPTH and return the record of the iteration."""
+        start = time.monotonic()
+        value, move, *nodes = self.search(state, depth)
+        elapsed = time.monotonic() - start
+
+        nodes = nodes[0] if nodes else None
+        return {'depth': depth,
+                'value': value,
+                'move': move,
+                'nodes': nodes,
+                'time': elapsed,
+                'nps': nodes / elapsed if nodes and elapsed else None}
+
+
+class Telemetry:
+    """
+    Records of the iterations of the searches of every move.
+
+    Pass observe as REPORT to an IterativeDeepening and the telemetry
+    as TELEMETRY to connect, which calls start before every request
+    and sends the comment of the last finished iteration with the
+    option info:comment before the move found by it.  After every
+    iteration, the record of IterativeDeepening is extended by the
+    transposition table probes and hits and by the cutoffs of ENGINE,
+    e.g. a Negamax, since the previous iteration, and by the
+    re-searches of the iteration.  These are counters the table and
+    the move ordering keep anyway, and they are only read between
+    iterations, so that the search itself is not slowed down.
+
+    If COMMENT is false, no comments are sent.  LOG is the path of a
+    file that every record is appended to as a line of JSON, with the
+    entries 'id' and 'state' of the request in addition.  Records of
+    different processes are appended by separate writes of a line.
+    The records of the current request are kept in the list records.
+    """
+
+    def __init__(self, engine=None, comment=True, log=None):
+        self.engine = engine
+        self.comment = comment
+        self.log = log
+        self.records = []
+        self._id = None
+        self._state = None
+        self._counters = {}
+        self._comment = None
+        self._file = None
+        self._pid = None
+
+    def _count(self):
+        """Return the current counters of the engine."""
+        counters = {}
+        table = getattr(self.engine, 'table', None)
+        if table is not None:
+            counters['tt_probes'] = table.probes
+            counters['tt_hits'] = table.hits
+        ordering = getattr(self.engine, 'ordering', None)
+        if ordering is not None:
+            counters['cutoffs'] = ordering.cutoffs
+            counters['first_cutoffs'] = ordering.first_cutoffs
+        return counters
+
+    def start(self, state, cid=None):
+        """Start the records of the request CID for STATE."""
+        self._id = cid
+        self._state = str(state)
+        self.records = []
+        self._comment = None
+        self._counters = self._count()
+
+    def observe(self, iteration):
+        """Record the ITERATION of IterativeDeepening that finished."""
+        record = dict(iteration)
+        counters = self._count()
+        for key, count in counters.items():
+            # counters that were reset or replaced start over
+            previous = self._counters.get(key, 0)
+            record[key] = count - previous if count >= previous else count
+        self._counters = counters
+        if hasattr(self.engine, 'researches'):
+            record['researches'] = self.engine.researches
+        self.records.append(record)
+
+        if self.comment:
+            self._comment = self.format(record)
+        if self.log is not None:
+            if self._pid != os.getpid():
+                self._file = open(self.log, 'a', buffering=1)
+                self._pid = os.getpid()
+            self._file.write(json.dumps({'id': self._id, 'state': self._state,
+                                         **record}) + "\n")
+
+    def format(self, record):
+        """Return the comment for RECORD."""
+        text = f"depth {record['depth']}, value {record['value']:+}"
+        if record.get('nodes') is not None:
+            text += f", {record['nodes']} nodes in {record['time']:.3f}s"
+        if record.get('tt_probes'):
+            text += f", {record['tt_hits'] / record['tt_probes']:.0%} table hits"
+        if record.get('cutoffs'):
+            text += (f", {record['cutoffs']} cutoffs, "
+                     f"{record['first_cutoffs'] / record['cutoffs']:.0%} by the first move")
+        return text
+
+    def take(self):
+        """Return the comment not sent yet, or None."""
+        comment, self._comment = self._comment, None
+        return comment
+
+    def close(self):
+        """Close the log of this process."""
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._file = None
+        self._pid = None
+
+
+class Ponder:
+    """
+    Search on the opponent's time.
+
+    SEARCH, BUDGET, DEPTHS and REPORT are passed on to the
+    IterativeDeepening driver of the agent.  When the agent has
+    moved, a background process predicts the opponent's reply as the
+    opponent's best move at the depth below the last iteration, i.e.
+    the next move of the principal variation, and searches the
+    expected next state with increasing depths.  If the next state is
+    the expected one, the agent continues after the iterations that
+    have been finished in the meantime.  Otherwise only what SEARCH
+    stored in a transposition table in shared memory, created before
+    the Ponder, is of use.
+
+    As the agent relies on its previous search, it must be run in the
+    same process for every state, e.g. by connect_async or by
+    connect with a single worker.
+    """
+
+    def __init__(self, search, budget, depths=range(1, 64), report=None):
+        self.driver = IterativeDeepening(search, budget, depths, report)
+        self.moves = 0
+        self.hits = 0
+        self.gained = 0
+        self._job = mp.Value('q', 0, lock=False)
+        self._pending = None
+        self._conn, child = mp.Pipe()
+        self._proc = mp.Process(name='ponder',
+                                args=(child,),
+                                target=self._work,
+                                daemon=True)
+        _start_interruptible([self._proc])
+        child.close()
+
+    def predict(self, state, move, depth):
+        """
+        Predict the next state after the agent made MOVE on STATE.
+
+        The opponent's moves are searched to DEPTH on the mirrored
+        board.  Returns None if the game ends before.
+        """
+        after, ours = state.sow(SOUTH, move)
+        while not ours and not after.is_final():
+            _, reply, *_ = self.driver.search(after.mirror(), depth)
+            after, again = after.sow(NORTH, reply)
+            ours = not again
+        return None if after.is_final() else after
+
+    def _work(self, conn):
+        busy = None
+
+        def interrupt(_signum, _frame):
+            if busy is not None and busy != self._job.value:
+                raise _Cancelled()
+        _interruptible(interrupt)
+
+        driver = self.driver
+        while True:
+            try:
+                task = conn.recv()
+                if task is None:
+                    return
+                job, state, move, depth = task
+                if job != self._job.value:
+                    continue
+                busy = job
+                try:
+                    expected = self.predict(state, move, max(depth - 1, 1))
+                    with _uninterrupted():
+                        conn.send((job, expected))
+                    driver.iterations = []
+                    for depth in driver.depths:
+                        if expected is None or driver.exhausted():
+                            break
+                        iteration = driver.iterate(expected, depth)
+                        driver.iterations.append(iteration)
+                        with _uninterrupted():
+                            conn.send((job, iteration))
+                finally:
+                    busy = None
+            except _Cancelled:
+                pass
+            except EOFError:
+                return
+            except Exception:
+                # the agent searches the next state without the
+                # iterations of a failed pondering
+                pass
+
+    def _collect(self, state):
+        """
+        Stop pondering and return its iterations, if it expected STATE.
+        """
+        if self._pending is None:
+            return []
+        job, self._pending = self._pending, None
+        self._job.value += 1
+        if hasattr(signal, 'SIGUSR1'):
+            os.kill(self._proc.pid, signal.SIGUSR1)
+
+        expected = None
+        iterations = []
+        while self._conn.poll():
+            with _uninterrupted():
+                done, result = self._conn.recv()
+            if done != job:
+                continue
+            if isinstance(result, Board):
+                expected = result
+            else:
+                iterations.append(result)
+        return iterations if state == expected else []
+
+    def agent(self, state, deadline=None):
+        """
+        Agent generator, continuing the pondering if it was a hit.
+
+        The method can directly be passed to connect.  Pondering on
+        the next state starts when the generator is closed.  DEADLINE
+        is passed on to IterativeDeepening.agent.
+        """
+        iterations = self._collect(state)
+        self.moves += 1
+        if iterations:
+            self.hits += 1
+            self.gained += iterations[-1]['depth']
+        try:
+            if iterations:
+                yield iterations[-1]['move']
+            yield from self.driver.agent(state, iterations, deadline)
+        finally:
+            if self.driver.iterations:
+                last = self.driver.iterations[-1]
+                job = self._job.value + 1
+                self._job.value = job
+                with _uninterrupted():
+                    self._conn.send((job, state, last['move'], last['depth']))
+                self._pending = job
+
+    def stats(self):
+        """
+        Return a dictionary with statistics about the pondering.
+
+        A ponder hit is counted whenever the next state was predicted
+        and at least one iteration was finished on it.  The depth
+        gained is the depth searched before the state arrived,
+        averaged over all moves.
+        """
+        return {'moves': self.moves,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.moves if self.moves else 0.0,
+                'depth_gained': self.gained / self.moves if self.moves else 0.0}
+
+    def close(self):
+        """Stop the pondering process."""
+        self._job.value += 1
+        if hasattr(signal, 'SIGUSR1') and self._proc.is_alive():
+            os.kill(self._proc.pid, signal.SIGUSR1)
+        self._conn.send(None)
+        self._conn.close()
+        self._proc.join(timeout=1)
+        if self._proc.is_alive():
+            self._proc.kill()
+
+
+class _Node:
+    """A node of the search tree of MonteCarlo."""
+
+    __slots__ = ('board', 'side', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, board, side, rng):
+        self.board = board
+        self.side = side
+        self.children = {}
+        self.untried = [] if board.is_final() else board.legal_moves(side)
+        rng.shuffle(self.untried)
+        self.visits = 0
+        # the wins of the side that moved to this node
+        self.wins = 0.0
+
+
+class MonteCarlo:
+    """
+    Monte Carlo tree search using UCT.
+
+    Random playouts are run in batches of BATCH leaves.  The leaves of
+    a batch are selected one after the other, and every node on the
+    way to a leaf counts as visited, but not won, until the playouts
+    are done, so that the leaves of a batch differ.  With numpy, the
+    playouts of a batch are run by a BoardBatch, and otherwise one
+    after the other.  EXPLORATION is the UCT exploration constant.
+
+    The tree is kept between moves, and a search starts from the node
+    of the new state, if it was reached in the previous search.
+    """
+
+    def __init__(self, batch=256, exploration=1.4, seed=None):
+        self.batch = batch
+        self.exploration = exploration
+        self.playouts = 0
+        self.reused = 0
+        self._rng = random.Random(seed)
+        self._numpy_rng = None
+        if 'numpy' in sys.modules:
+            self._numpy_rng = numpy.random.default_rng(seed)
+        self._root = None
+
+    def _find(self, state, plies=4):
+        """Return the node of STATE with south to move, if in the tree."""
+        if self._root is None:
+            return None
+        nodes = [self._root]
+        for _ in range(plies):
+            following = []
+            for node in nodes:
+                for child in node.children.values():
+                    if child.side == SOUTH and child.board == state:
+                        return child
+                    following.append(child)
+            nodes = following
+        return None
+
+    def _select(self):
+        """Walk down to a new leaf, returning the path to it."""
+        node = self._root
+        path = [node]
+        node.visits += 1
+        while not node.untried and node.children:
+            scale = self.exploration * math.sqrt(math.log(node.visits))
+            node = max(node.children.values(),
+                       key=lambda child: child.wins / child.visits +
+                       scale / math.sqrt(child.visits))
+            node.visits += 1
+            path.append(node)
+        if node.untried:
+            move = node.untried.pop()
+            after, again = node.board.sow(node.side, move)
+            child = _Node(after, node.side if again else not node.side,
+                          self._rng)
+            node.children[move] = child
+            child.visits += 1
+            path.append(child)
+        return path
+
+    def _playout(self, leaves):
+        """Return the result of random playouts for south from LEAVES."""
+        if self._numpy_rng is not None:
+            batch = BoardBatch.from_boards(
+                [leaf.board if leaf.side == SOUTH else leaf.board.mirror()
+                 for leaf in leaves])
+            values = batch.playout(SOUTH, self._numpy_rng).tolist()
+            values = [value if leaf.side == SOUTH else -value
+                      for leaf, value in zip(leaves, values)]
+        else:
+            values = []
+            for leaf in leaves:
+                board, side = leaf.board, leaf.side
+                while not board.is_final():
+                    moves = board.legal_moves(side)
+                    board, again = board.sow(side, self._rng.choice(moves))
+                    if not again:
+                        side = not side
+                values.append(board.south + sum(board.south_pits) -
+                              board.north - sum(board.north_pits))
+        return [(value > 0) + (value == 0) / 2 for value in values]
+
+    def search(self):
+        """Run one batch of playouts."""
+        paths = [self._select() for _ in range(self.batch)]
+        results = self._playout([path[-1] for path in paths])
+        for path, result in zip(paths, results):
+            for parent, child in zip(path, path[1:]):
+                child.wins += result if parent.side == SOUTH else 1 - result
+        self.playouts += len(paths)
+
+    def best(self):
+        """Return the most visited move of the current state."""
+        return max(self._root.children.items(),
+                   key=lambda item: item[1].visits)[0]
+
+    def agent(self, state, playouts=None):
+        """
+        Agent generator yielding the most visited move after every batch.
+
+        The method can directly be passed to connect.  If PLAYOUTS is
+        not None, the search ends after as many playouts.
+        """
+        root = self._find(state)
+        if root is not None:
+            self.reused += 1
+        else:
+            root = _Node(state, SOUTH, self._rng)
+        self._root = root
+        if state.is_final():
+            return
+
+        done = 0
+        while playouts is None or done < playouts:
+            self.search()
+            done += self.batch
+            yield self.best()
+
+
+_COMMAND_PATTERN = re.compile(r"""
+^                   # beginning of line
+\s*                 # preceding white space is ignored
+(?:                 # the optional ID segment
+(?P<id>\d+)         # ... must consist of an ID
+(?:@(?P<ref>\d+))?  # ... and may consist of a reference
+\s+                 # ... and must have trailing white space
+)?
+(?P<cmd>\w+)        # the command is just a alphanumeric word
+(?:\s+|$)           # the arguments are separated by white space
+""", re.VERBOSE)
+
+_TOKEN_PATTERN = re.compile(r"""
+(?:
+"(?P<string>(?:\\.|[^"])*)"            # a string in double quotes
+|<(?P<board>\d+(?:,\d+)*)>             # a board
+|(?P<real>[+-]?\d*\.\d+)(?=\s|$)         # a real number
+|(?P<integer>[+-]?\d+)(?=\s|$)          # an integer
+|(?P<word>[0-9A-Za-z:-]+)(?=\s|$)       # a word, i.e. an unquoted string
+)
+\s*                                     # trailing white space is ignored
+""", re.VERBOSE)
+
+
+def _split(args, pos=0):
+    """
+    Parse ARGS from the offset POS on as far as possible.
+
+    Returns a list of python objects, each equivalent to the
+    elements of ARGS as parsed in order.  The arguments are read in
+    a single pass, without copying the remainder of ARGS.
+    """
+    parsed = []
+    match = _TOKEN_PATTERN.match
+
+    while True:
+        token = match(args, pos)
+        if not token:
+            return parsed
+
+        kind = token.lastgroup
+        arg = token.group(kind)
+        if kind == 'string':
+            if '\\' in arg:
+                arg = re.sub(r'\\(.)', '\\1', arg)
+            parsed.append(arg)
+        elif kind == 'board':
+            parsed.append(Board._decode(arg))
+        elif kind == 'integer':
+            parsed.append(int(arg))
+        elif kind == 'real':
+            parsed.append(float(arg))
+        elif kind == 'word':
+            parsed.append(arg)
+        else:
+            assert(False)
+
+        pos = token.end()
+
+
+def _parse(line):
+    """
+    Parse the command in LINE.
+
+    Returns a tuple of the ID, the reference, the command and its
+    parsed arguments, or None if LINE is not a command.  A missing ID
+    or reference is None.
+    """
+    match = _COMMAND_PATTERN.match(line)
+    if not match:
+        return None
+    cid, ref = None, None
+    if match.group('id'):
+        cid = int(match.group('id'))
+    if match.group('ref'):
+        ref = int(match.group('ref'))
+    return cid, ref, match.group('cmd'), _split(line, match.end())
+
+
+def _format(cid, cmd, args, ref=None):
+    """Format command CMD with ARGS, the ID CID and the reference REF."""
+    msg = str(cid)
+    if ref:
+        msg += f'@{ref}'
+    msg += " " + cmd
+
+    for arg in args:
+        msg += " "
+        if isinstance(arg, str):
+            string = re.sub(r'"', '\\"', arg)
+            msg += f'"{string}"'
+        elif isinstance(arg, float):
+            # reals are written without an exponent
+            real = f'{arg:f}'.rstrip('0')
+            msg += real + '0' if real.endswith('.') else real
+        else:
+            msg += str(arg)
+
+    return msg
+
+
+_MOVE_PATTERN = re.compile(rb'\d+@(\d+) move ')
+
+
+def _coalesce(batch, stats=None):
+    """
+    Join the encoded messages in BATCH for a single write.
+
+    A move is dropped if a later move in BATCH answers the same
+    request, as the server would only keep the last one.  If STATS is
+    a dictionary, the messages, bytes and writes are counted in its
+    entries 'messages', 'bytes' and 'writes'.  Writes of more than
+    one message are counted in 'coalesced', and the dropped moves in
+    'dropped'.
+    """
+    answered = set()
+    kept = []
+    for msg in reversed(batch):
+        match = _MOVE_PATTERN.match(msg)
+        if match:
+            if match.group(1) in answered:
+                continue
+            answered.add(match.group(1))
+        kept.append(msg)
+    kept.reverse()
+    data = b''.join(kept)
+
+    if stats is not None:
+        for key, count in (('messages', len(kept)),
+                           ('bytes', len(data)),
+                           ('writes', 1),
+                           ('coalesced', int(len(kept) > 1)),
+                           ('dropped', len(batch) - len(kept))):
+            stats[key] = stats.get(key, 0) + count
+    return data
+
+
+class Session:
+    """
+    The search state kept for the states of one game.
+
+    The server links the states of a game by setting the option
+    game:id before each of them.  Connect then passes the session of
+    the game to agents that take a keyword argument SESSION, so that
+    the search of a move can continue from what the search of the
+    previous move found, instead of starting over.
+
+    TABLE is a transposition table of MEGABYTES, created in shared
+    memory if SHARED is true, so that it keeps the results of the
+    searches connect runs in other processes.  Searching with the
+    table, e.g. by a Negamax, the moves of the principal variation
+    and the values of the subtree explored by the previous search are
+    found in it.  DATA is a dictionary for any other objects of the
+    agent, e.g. a MonteCarlo tree.  It is not passed to other
+    processes: a process the session is passed to, as by connect,
+    starts with an empty DATA, that is only kept for the requests of
+    the game that process handles later on.  With connect_async, the
+    agent runs in the same process and DATA is always kept.  STATES
+    counts the states of the game.
+
+    Only sessions with a shared table can be passed to other
+    processes.  A process keeps up to CAPACITY of the sessions passed
+    to it, by default Sessions.CAPACITY.
+    """
+
+    # sessions attached to by this process, by the name of the table
+    _attached = {}
+
+    def __init__(self, game, megabytes=16, shared=False, capacity=None):
+        self.game = game
+        self.table = TranspositionTable(megabytes, shared=shared)
+        self.data = {}
+        self.states = 0
+        self.capacity = capacity
+
+    def __reduce__(self):
+        if self.table is None or self.table.name is None:
+            raise TypeError("only sessions with a shared table can be passed"
+                            " between processes, see Sessions(shared=True)")
+        return (Session._attach,
+                (self.game, self.table.name, self.states, self.capacity))
+
+    @classmethod
+    def _attach(cls, game, name, states, capacity=None):
+        """
+        Return the session of GAME with the shared table NAME.
+
+        A process attaches to the table once, and keeps the session
+        for the next request of the same game, closing the least
+        recently used ones beyond CAPACITY.
+        """
+        session = cls._attached.pop(name, None)
+        if session is None:
+            session = cls.__new__(cls)
+            session.game = game
+            session.table = TranspositionTable.attach(name)
+            session.data = {}
+        session.states = states
+        session.capacity = capacity
+        cls._attached[name] = session
+        while len(cls._attached) > (capacity or Sessions.CAPACITY):
+            cls._attached.pop(next(iter(cls._attached))).close()
+        return session
+
+    def close(self):
+        """Release the table."""
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+
+
+class Sessions:
+    """
+    The sessions of up to CAPACITY games, by their game:id.
+
+    When a session is needed for another game, the least recently
+    used session, most likely of a game that has ended, is closed.
+    The other arguments are passed to every new Session.  Sessions
+    that are passed to other processes, as by connect, must be
+    SHARED.
+    """
+
+    CAPACITY = 8
+
+    def __init__(self, capacity=CAPACITY, megabytes=16, shared=False):
+        self.capacity = capacity
+        self.megabytes = megabytes
+        self.shared = shared
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, game):
+        return game in self._sessions
+
+    def get(self, game):
+        """
+        Return the session of GAME, creating it if necessary.
+
+        Returns None for anonymous games, i.e. if GAME is empty or
+        None.
+        """
+        if not game:
+            return None
+        session = self._sessions.pop(game, None)
+        if session is None:
+            session = Session(game, self.megabytes, self.shared, self.capacity)
+            while len(self._sessions) >= self.capacity:
+                self._sessions.pop(next(iter(self._sessions))).close()
+        self._sessions[game] = session
+        session.states += 1
+        return session
+
+    def end(self, game):
+        """Close the session of GAME, if there is one."""
+        session = self._sessions.pop(game, None)
+        if session is not None:
+            session.close()
+
+    def close(self):
+        """Close all sessions."""
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+class Clock:
+    """
+    The time a client has left, as announced by the server.
+
+    The server describes how it limits the time of a client with the
+    options time:mode, time:clock and time:opclock, that are passed
+    to set.  In the mode 'relative', the clock is the time for every
+    request.  In the mode 'absolute', it is the time left for the rest
+    of the game, which is reduced by the time of every request from
+    its state command to the stop command.  The time of a request is
+    then allocated considering the stones left in the pits and the
+    phase of the game, so that the clock does not run out and is not
+    saved up either.  If no mode is set, a clock is taken to be
+    absolute.
+
+    MARGIN seconds are kept for the latency of the connection, for
+    every move expected to be left.  NOW is the function measuring the
+    time, that may be replaced to simulate a clock.
+    """
+
+    def __init__(self, margin=0.25, now=time.monotonic):
+        self.margin = margin
+        self.now = now
+        self.mode = None
+        self.clock = None
+        self.opclock = None
+        self._used = 0.0
+        self._started = None
+
+    def set(self, option, value):
+        """
+        Handle the option OPTION set to VALUE by the server.
+
+        Returns true if it was a time option.
+        """
+        if option == "time:mode":
+            self.mode = value
+        elif option == "time:clock":
+            self.clock = value
+            self._used = 0.0
+            if self._started is not None:
+                self._started = self.now()
+        elif option == "time:opclock":
+            self.opclock = value
+        else:
+            return False
+        return True
+
+    def remaining(self):
+        """Return the seconds left on the clock, or None if unknown."""
+        if self.clock is None:
+            return None
+        used = self._used
+        if self._started is not None:
+            used += self.now() - self._started
+        return self.clock - used
+
+    def allocate(self, state):
+        """
+        Return the seconds to spend on STATE, or None if not limited.
+
+        The stones in the pits estimate the moves left, about three
+        for every two stones per pit, and the middle game, where many
+        stones are still in play but the decisions matter most, is
+        given up to three times the time of the opening and the
+        endgame.
+        """
+        if self.clock is None or self.mode == "none":
+            return None
+        if self.mode == "relative":
+            return max(0.0, self.clock - self.margin)
+
+        stones = sum(state.south_pits) + sum(state.north_pits)
+        total = stones + state.south + state.north
+        moves = 2 + 1.5 * stones / state.size
+        phase = stones / total if total else 0.0
+        weight = 0.5 + 4 * phase * (1 - phase)
+        left = self.remaining() - self.margin * moves
+        if left <= 0:
+            return 0.0
+        return min(left, left * weight / moves)
+
+    def start(self, state):
+        """
+        Start the time of the request for STATE.
+
+        Returns the time.monotonic() time its move is due, or None if
+        the time is not limited.
+        """
+        self._started = self.now()
+        seconds = self.allocate(state)
+        if seconds is None:
+            return None
+        return time.monotonic() + seconds
+
+    def stop(self):
+        """Stop the time of the current request."""
+        if self._started is not None:
+            self._used += self.now() - self._started
+            self._started = None
+
+
+def _options(keywords, **options):
+    """Return the OPTIONS an agent taking the arguments KEYWORDS accepts."""
+    return {key: value for key, value in options.items() if key in keywords}
+
+
+def _solve(board, move):
+    """
+    Solve the problem of the mode verify, sowing MOVE on BOARD for south.
+
+    MOVE is the index of the pit, counting from 0 unlike in a move
+    command, as the server sends it.  Returns the command and arguments
+    of the solution, the board after the move and if it was a repeat
+    move, or of an error if the move is illegal.
+    """
+    if (board is None or not 0 <= move < board.size or
+            not board.is_legal(SOUTH, move)):
+        return "error", "illegal move"
+    after, again = board.sow(SOUTH, move)
+    return "solution", after, int(again)
+
+
+def connect(agent, host='wss://kalah.kwarc.info/socket', port=2671, token=None, name=None, authors=[], debug=False, workers=0, stats=None, book=None, clock=None, sessions=None, mode="freeplay", telemetry=None):
+    """
+    Connect to KGP server at host:port as agent.
+
+    Agent is a generator function, that produces as many moves as it
+    can until the server ends a search request.
+
+    The optional arguments TOKEN, NAME and AUTHORS are used to send
+    the server optional information about the client implementation.
+
+    If DEBUG has a true value, the network communication is printed on
+    to the standard error stream.
+
+    By default every state command is handled by a new process, that
+    is killed when the server stops the request.  If WORKERS is
+    positive, that many processes are started in advance and handle
+    all requests, avoiding the cost of starting a process for every
+    move.  A stopped search is then abandoned as soon as the agent
+    produces its next move, or interrupted by a signal.
+
+    All messages are encoded by the process sending them, and written
+    by one thread, that joins the messages pending at once into a
+    single write and drops moves superseded by a later move for the
+    same request.  If STATS is a dictionary, it counts the written
+    messages, bytes and writes, see _coalesce.
+
+    BOOK is an optional OpeningBook.  States found in it are answered
+    with the move of the book right away, without asking the agent,
+    and the request is yielded, leaving the time to later moves.
+
+    The time options set by the server are tracked by CLOCK, by
+    default a new Clock.  If AGENT takes a keyword argument DEADLINE,
+    it is passed the time.monotonic() time the move is due, as
+    allocated by the clock, or None if the time is not limited.
+
+    If AGENT takes a keyword argument SESSION, it is passed the
+    Session of the game the server linked the state to with the
+    option game:id, or None.  The sessions are kept by SESSIONS, by
+    default Sessions with tables in shared memory, so that they keep
+    the results of the searches in the processes of the requests.
+
+    MODE is the mode requested from the server.  In the mode verify,
+    the server checks the rules of the client, sending problems that
+    are solved with Board.sow, and AGENT may be None.
+
+    TELEMETRY is an optional Telemetry, that is started before the
+    agent is asked for a move.  Its comment is sent as the option
+    info:comment before the next move that differs from the last one.
+    """
+    assert mode == "verify" or inspect.isgeneratorfunction(agent)
+    if clock is None:
+        clock = Clock()
+    keywords = inspect.signature(agent).parameters if agent else {}
+    if sessions is None and 'session' in keywords:
+        sessions = Sessions(shared=True)
+    assert sessions is None or sessions.shared,\
+        "the sessions of connect must be shared"
+    game = None
+
+    if os.getenv("KGP_PORT"):
+        port = int(os.getenv("KGP_PORT"))
+    host = os.getenv("KGP_HOST", host)
+
+    incoming, outgoing = mp.Pipe(duplex=False)
+
+    def handle(read, write):
+        nonlocal game
+        id = mp.Value('d', 1)
+
+        def send(cmd, *args, ref=None):
+            """
+            Send cmd with args to server.
+
+            If ref is not None, add a reference.
+            """
+
+            # a worker interrupted while sending would keep the lock
+            # and leave a partial message in the pipe
+            with _uninterrupted(), id.get_lock():
+                cid = int(id.value)
+                id.value += 2
+
+                msg = _format(cid, cmd, args, ref)
+                outgoing.send_bytes(msg.encode() + b"\r\n")
+            if debug:
+                print(">", msg, file=sys.stderr)
+
+        def query(state, cid, stopped=None, deadline=None, session=None):
+            """
+            Start querying agent what move to make.
+
+            State is the current board state and cid the ID of the
+            state command that issued the request.  If stopped is not
+            None, it is called after every move and the search is
+            abandoned when it returns a true value.  Deadline and
+            session are passed on to the agent if it takes them.
+            """
+
+            if state.is_final():
+                return
+            last = None
+            if telemetry is not None:
+                telemetry.start(state, cid)
+            search = agent(state, **_options(keywords, deadline=deadline,
+                                             session=session))
+            try:
+                for move in search:
+                    if stopped and stopped():
+                        return
+                    if not type(move) is int:
+                        raise TypeError("Not a move")
+                    if move != last:
+                        comment = telemetry and telemetry.take()
+                        if comment:
+                            send("set", "info:comment", comment, ref=cid)
+                        send("move", move+1, ref=cid)
+                        last = move
+                else:
+                    send("yield", ref=cid)
+            finally:
+                search.close()
+
+        threads = {}
+        pool = None
+        if workers > 0:
+            pool = _WorkerPool(workers, query, debug)
+
+        def sender():
+            while True:
+                batch = [incoming.recv_bytes()]
+                while incoming.poll():
+                    batch.append(incoming.recv_bytes())
+                # an empty message ends the sender
+                done = b'' in batch
+                batch = [msg for msg in batch if msg]
+                if batch:
+                    write(_coalesce(batch, stats))
+                if done:
+                    return
+        writer = threading.Thread(target=sender)
+        writer.start()
+
+        try:
+            for line in read():
+                if debug:
+                    print("<", line.strip(), file=sys.stderr)
+
+                try:
+                    command = _parse(line)
+                    if not command:
+                        continue
+                    cid, ref, cmd, args = command
+
+                    if cmd == "kgp":
+                        major, _minor, _patch = args
+                        if major != 1:
+                            send("error", "protocol not supported", ref=cid)
+                            raise ValueError()
+                        if name:
+                            send("set", "info:name", name)
+                        if authors:
+                            send("set", "info:authors", ",".join(authors))
+                        if token:
+                            send("set", "auth:token", token)
+                        send("mode", mode)
+                    elif cmd == "problem":
+                        send(*_solve(*args), ref=cid)
+                    elif cmd == "state":
+                        board = args[0]
+
+                        if cid in threads:
+                            # Duplicate IDs by the server are ignored
+                            continue
+
+                        if board.is_final():
+                            # the game is over, there is no move to make
+                            if sessions is not None:
+                                sessions.end(game)
+                            continue
+                        entry = book and book.lookup(board)
+                        if (entry and entry[1] < board.size and
+                                board.is_legal(SOUTH, entry[1])):
+                            send("move", entry[1]+1, ref=cid)
+                            send("yield", ref=cid)
+                            continue
+                        deadline = clock.start(board)
+                        session = None
+                        if sessions is not None:
+                            session = sessions.get(game)
+                        if pool:
+                            threads[cid] = None
+                            pool.submit(board, cid, deadline, session)
+                            continue
+                        threads[cid] = mp.Process(
+                            name=f'query-{cid}',
+                            args=(board, cid, None, deadline, session),
+                            target=query)
+                        threads[cid].start()
+                    elif cmd == "stop":
+                        if ref and ref in threads:
+                            clock.stop()
+                            thread = threads.pop(ref)
+                            if pool:
+                                pool.stop(ref)
+                            else:
+                                # a process killed while sending would
+                                # keep the lock of the IDs forever
+                                with id.get_lock():
+                                    thread.kill()
+                                thread.join()
+                    elif cmd == "set":
+                        if len(args) >= 2 and args[0] == "game:id":
+                            game = args[1]
+                        elif len(args) >= 2:
+                            clock.set(args[0], args[1])
+                    elif cmd == "ok":
+                        pass    # ignored
+                    elif cmd == "error":
+                        pass    # ignored
+                    elif cmd == "ping":
+                        if len(args) >= 1:
+                            send("pong", args[0], ref=cid)
+                        else:
+                            send("pong", ref=cid)
+                    elif cmd == "goodbye":
+                        return
+                except ValueError:
+                    pass
+                except TypeError:
+                    pass
+        finally:
+            if pool:
+                pool.close(id.get_lock())
+            if sessions is not None:
+                sessions.close()
+            # flush the remaining messages and let the sender finish
+            with id.get_lock():
+                outgoing.send_bytes(b'')
+            writer.join()
+
+    if host.startswith("ws"):
+        assert 'websocket' in sys.modules,\
+            "websocket library couldn't be loaded"
+
+        ws = websocket.WebSocket(enable_multithread=True)
+        ws.connect(host)
+        def lines():
+            try:
+                while True:
                     yield ws.recv()
             except websocket._exceptions.WebSocketConnectionClosedException:
                 pass
-        handle(lines, ws.send)
+        handle(lines, lambda data: ws.send(data.decode()))
     else:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             sock.setblocking(True)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             sock.connect((host, port))
-            with sock.makefile(mode='rw') as pseudo:
-                def write(msg):
-                    pseudo.write(msg)
-                    pseudo.flush()
-                handle(lambda: pseudo, write)
+            with sock.makefile(mode='r') as pseudo:
+                handle(lambda: pseudo, sock.sendall)
+
+
+class _StreamConnection:
+    """Connection of connect_async over a pair of asyncio streams."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+
+    async def recv(self):
+        line = await self._reader.readline()
+        return line.decode() if line else None
+
+    async def send(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class _WebSocketConnection:
+    """
+    Connection of connect_async over a websocket.
+
+    The blocking calls of the websocket library, as used by connect,
+    are run by two threads of its own, one receiving and one sending,
+    so that they do not occupy the threads of the agent.
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._executor = concurrent.futures.ThreadPoolExecutor(2)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, func, *args)
+
+    async def recv(self):
+        try:
+            return await self._run(self._ws.recv)
+        except websocket._exceptions.WebSocketConnectionClosedException:
+            return None
+
+    async def send(self, data):
+        await self._run(self._ws.send, data.decode())
+
+    async def close(self):
+        await self._run(self._ws.close)
+        self._executor.shutdown(wait=False)
+
+
+async def _open_connection(host, port):
+    """Open a connection to the server at HOST:PORT for connect_async."""
+    if host.startswith("ws"):
+        assert 'websocket' in sys.modules,\
+            "websocket library couldn't be loaded"
+        connection = _WebSocketConnection(websocket.WebSocket(enable_multithread=True))
+        await connection._run(connection._ws.connect, host)
+        return connection
+    reader, writer = await asyncio.open_connection(host, port)
+    sock = writer.get_extra_info('socket')
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return _StreamConnection(reader, writer)
+
+
+async def _sender(outgoing, connection, stats):
+    """
+    Write the encoded messages put into the queue OUTGOING.
+
+    The messages pending at once are joined by _coalesce into a
+    single send on CONNECTION.  None ends the sender.
+    """
+    while True:
+        batch = [await outgoing.get()]
+        while not outgoing.empty():
+            batch.append(outgoing.get_nowait())
+        done = None in batch
+        batch = [msg for msg in batch if msg is not None]
+        if batch:
+            await connection.send(_coalesce(batch, stats))
+        if done:
+            return
+
+
+async def connect_async(agent, host='wss://kalah.kwarc.info/socket', port=2671, token=None, name=None, authors=[], debug=False, executor=None, connection=None, stats=None, book=None, clock=None, sessions=None, mode="freeplay", telemetry=None):
+    """
+    Connect to KGP server at host:port as agent, using asyncio.
+
+    The arguments are the same as for connect.  Instead of a process
+    per request, the protocol is handled by a single event loop, so
+    that stop and ping commands are answered while searches are
+    running.  Each search is a call of AGENT in EXECUTOR, by default
+    the thread pool of the event loop.  A stopped search is abandoned
+    as soon as the agent produces its next move.  As the agent is
+    run in a thread, a CPU bound agent should delegate its work to
+    other processes, e.g. using a SearchPool.
+
+    CONNECTION may be used instead of HOST and PORT, and is an object
+    with the coroutine methods recv, returning the next line or None
+    at the end of the connection, send, writing encoded lines, and
+    close.  Pending messages are joined into a single call of send,
+    dropping superseded moves as connect does.
+
+    If STATS is a dictionary, the number of received states and of
+    moves produced by the agent are counted in its entries 'states'
+    and 'moves', in addition to the counters of _coalesce.  States
+    answered by BOOK are counted in the entry 'book'.  Deadlines
+    allocated by CLOCK and the sessions of SESSIONS are passed on as
+    by connect, but the tables of the sessions are not shared by
+    default.  As the searches run in threads of the same process, a
+    TELEMETRY should only be used if one search runs at a time.
+
+    The coroutine returns when the server says goodbye or closes the
+    connection.  Websocket hosts require the websocket library, as
+    for connect.
+    """
+    assert mode == "verify" or inspect.isgeneratorfunction(agent)
+    if clock is None:
+        clock = Clock()
+    keywords = inspect.signature(agent).parameters if agent else {}
+    if sessions is None and 'session' in keywords:
+        sessions = Sessions()
+    game = None
+
+    loop = asyncio.get_running_loop()
+    if connection is None:
+        if os.getenv("KGP_PORT"):
+            port = int(os.getenv("KGP_PORT"))
+        host = os.getenv("KGP_HOST", host)
+
+        connection = await _open_connection(host, port)
+
+    ids = itertools.count(1, 2)
+    outgoing = asyncio.Queue()
+
+    def send(cmd, *args, ref=None):
+        """
+        Send cmd with args to server.
+
+        If ref is not None, add a reference.  Must be called from the
+        event loop.
+        """
+        msg = _format(next(ids), cmd, args, ref)
+        if debug:
+            print(">", msg, file=sys.stderr)
+        if stats is not None and cmd == "move":
+            stats['moves'] = stats.get('moves', 0) + 1
+        outgoing.put_nowait(msg.encode() + b"\r\n")
+
+    def query(state, cid, stopped, deadline, session):
+        """
+        Query agent what move to make in STATE, from an executor.
+
+        Cid is the ID of the state command that issued the request.
+        The search is abandoned when the event STOPPED is set.
+        Deadline and session are passed on to the agent if it takes
+        them.
+        """
+
+        def post(cmd, *args):
+            if not stopped.is_set():
+                loop.call_soon_threadsafe(
+                    functools.partial(send, cmd, *args, ref=cid))
+
+        if state.is_final():
+            return
+        last = None
+        if telemetry is not None:
+            telemetry.start(state, cid)
+        search = agent(state, **_options(keywords, deadline=deadline,
+                                         session=session))
+        try:
+            for move in search:
+                if stopped.is_set():
+                    return
+                if not type(move) is int:
+                    raise TypeError("Not a move")
+                if move != last:
+                    comment = telemetry and telemetry.take()
+                    if comment:
+                        post("set", "info:comment", comment)
+                    post("move", move+1)
+                    last = move
+            else:
+                post("yield")
+        finally:
+            search.close()
+
+    def finished(future):
+        if not future.cancelled() and future.exception() and debug:
+            print("!", repr(future.exception()), file=sys.stderr)
+
+    searches = {}
+    writer = loop.create_task(_sender(outgoing, connection, stats))
+    try:
+        while not writer.done():
+            line = await connection.recv()
+            if not line:
+                break
+            if debug:
+                print("<", line.strip(), file=sys.stderr)
+
+            try:
+                command = _parse(line)
+                if not command:
+                    continue
+                cid, ref, cmd, args = command
+
+                if cmd == "kgp":
+                    major, _minor, _patch = args
+                    if major != 1:
+                        send("error", "protocol not supported", ref=cid)
+                        raise ValueError()
+                    if name:
+                        send("set", "info:name", name)
+                    if authors:
+                        send("set", "info:authors", ",".join(authors))
+                    if token:
+                        send("set", "auth:token", token)
+                    send("mode", mode)
+                elif cmd == "problem":
+                    send(*_solve(*args), ref=cid)
+                elif cmd == "state":
+                    board = args[0]
+
+                    if cid in searches:
+                        # Duplicate IDs by the server are ignored
+                        continue
+
+                    if stats is not None:
+                        stats['states'] = stats.get('states', 0) + 1
+                    if board.is_final():
+                        # the game is over, there is no move to make
+                        if sessions is not None:
+                            sessions.end(game)
+                        continue
+                    entry = book and book.lookup(board)
+                    if (entry and entry[1] < board.size and
+                            board.is_legal(SOUTH, entry[1])):
+                        if stats is not None:
+                            stats['book'] = stats.get('book', 0) + 1
+                        send("move", entry[1]+1, ref=cid)
+                        send("yield", ref=cid)
+                        continue
+                    session = None
+                    if sessions is not None:
+                        session = sessions.get(game)
+                    searches[cid] = threading.Event()
+                    future = loop.run_in_executor(executor, query, board,
+                                                  cid, searches[cid],
+                                                  clock.start(board), session)
+                    future.add_done_callback(finished)
+                elif cmd == "stop":
+                    if ref and ref in searches:
+                        clock.stop()
+                        searches.pop(ref).set()
+                elif cmd == "set":
+                    if len(args) >= 2 and args[0] == "game:id":
+                        game = args[1]
+                    elif len(args) >= 2:
+                        clock.set(args[0], args[1])
+                elif cmd == "ok":
+                    pass    # ignored
+                elif cmd == "error":
+                    pass    # ignored
+                elif cmd == "ping":
+                    if len(args) >= 1:
+                        send("pong", args[0], ref=cid)
+                    else:
+                        send("pong", ref=cid)
+                elif cmd == "goodbye":
+                    break
+            except ValueError:
+                pass
+            except TypeError:
+                pass
+    finally:
+        for stopped in searches.values():
+            stopped.set()
+        if sessions is not None:
+            sessions.close()
+        # flush the remaining messages before closing the connection
+        outgoing.put_nowait(None)
+        try:
+            await writer
+        except ConnectionError:
+            pass
+        await connection.close()
+
+
+async def connect_eval(evaluate, host='wss://kalah.kwarc.info/socket', port=2671, token=None, name=None, authors=[], debug=False, batch=False, window=0.001, limit=1024, executor=None, connection=None, stats=None):
+    """
+    Connect to KGP server at host:port in the mode eval, using asyncio.
+
+    In this mode the server streams states, and the client answers
+    each of them with an evaluation, a real number that is the larger
+    the better the board is for south.  EVALUATE is a function taking
+    a board and returning its evaluation, or if BATCH is true, a
+    function taking a list of boards and returning a sequence of their
+    evaluations, e.g. computed at once with a BoardBatch.
+
+    The states are collected for up to WINDOW seconds after the first
+    of them arrived, or until LIMIT states are pending, and are then
+    evaluated together by a call in EXECUTOR, by default the thread
+    pool of the event loop.  The evaluations of a batch are sent in a
+    single write.  States stopped by the server before they were
+    evaluated are not answered.
+
+    The other arguments are the same as for connect_async.  If STATS
+    is a dictionary, the received states, the sent evaluations and the
+    batches are counted in its entries 'states', 'evals' and
+    'batches', in addition to the counters of _coalesce.  The
+    coroutine returns when the server says goodbye or closes the
+    connection.
+    """
+    loop = asyncio.get_running_loop()
+    if connection is None:
+        if os.getenv("KGP_PORT"):
+            port = int(os.getenv("KGP_PORT"))
+        host = os.getenv("KGP_HOST", host)
+        connection = await _open_connection(host, port)
+
+    ids = itertools.count(1, 2)
+    outgoing = asyncio.Queue()
+
+    def send(cmd, *args, ref=None):
+        msg = _format(next(ids), cmd, args, ref)
+        if debug:
+            print(">", msg, file=sys.stderr)
+        outgoing.put_nowait(msg.encode() + b"\r\n")
+
+    def count(key, n=1):
+        if stats is not None:
+            stats[key] = stats.get(key, 0) + n
+
+    def evaluate_all(boards):
+        if batch:
+            return evaluate(boards)
+        return [evaluate(board) for board in boards]
+
+    # the states collected for the next batch, and the IDs of all
+    # states that have not been answered or stopped yet
+    pending = []
+    waiting = set()
+    timer = None
+
+    def answer(requests, future):
+        if future.cancelled():
+            return
+        if future.exception():
+            if debug:
+                print("!", repr(future.exception()), file=sys.stderr)
+            for cid, _ in requests:
+                waiting.discard(cid)
+            return
+        for (cid, _), value in zip(requests, future.result()):
+            if cid in waiting:
+                waiting.remove(cid)
+                send("eval", float(value), ref=cid)
+                count('evals')
+
+    def flush():
+        nonlocal pending, timer
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        requests, pending = pending, []
+        count('batches')
+        future = loop.run_in_executor(executor, evaluate_all,
+                                      [board for _, board in requests])
+        future.add_done_callback(functools.partial(answer, requests))
+
+    writer = loop.create_task(_sender(outgoing, connection, stats))
+    try:
+        while not writer.done():
+            line = await connection.recv()
+            if not line:
+                break
+            if debug:
+                print("<", line.strip(), file=sys.stderr)
+
+            try:
+                command = _parse(line)
+                if not command:
+                    continue
+                cid, ref, cmd, args = command
+
+                if cmd == "kgp":
+                    major, _minor, _patch = args
+                    if major != 1:
+                        send("error", "protocol not supported", ref=cid)
+                        raise ValueError()
+                    if name:
+                        send("set", "info:name", name)
+                    if authors:
+                        send("set", "info:authors", ",".join(authors))
+                    if token:
+                        send("set", "auth:token", token)
+                    send("mode", "eval")
+                elif cmd == "state":
+                    if cid in waiting:
+                        # Duplicate IDs by the server are ignored
+                        continue
+                    count('states')
+                    waiting.add(cid)
+                    pending.append((cid, args[0]))
+                    if len(pending) >= limit:
+                        flush()
+                    elif timer is None:
+                        timer = loop.call_later(window, flush)
+                elif cmd == "stop":
+                    waiting.discard(ref)
+                elif cmd == "ping":
+                    if len(args) >= 1:
+                        send("pong", args[0], ref=cid)
+                    else:
+                        send("pong", ref=cid)
+                elif cmd == "goodbye":
+                    break
+            except ValueError:
+                pass
+            except TypeError:
+                pass
+    finally:
+        if timer is not None:
+            timer.cancel()
+        waiting.clear()
+        # flush the remaining messages before closing the connection
+        outgoing.put_nowait(None)
+        try:
+            await writer
+        except ConnectionError:
+            pass
+        await connection.close()
+
+
+class Host:
+    """
+    Run many clients in one process.
+
+    Every client added with add is connected by connect_async on the
+    same event loop, and the searches of all clients share one pool of
+    WORKERS threads.  A client thus only costs its protocol state,
+    instead of an interpreter with its own threads and queues.
+    """
+
+    def __init__(self, workers=None):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix='kgp-host')
+        self._clients = []
+        self._started = None
+        self._stopped = None
+
+    def add(self, agent, **kwargs):
+        """
+        Add a client for AGENT.
+
+        The keyword arguments are passed on to connect_async, and may
+        e.g. give every client its own host, token and name.
+        """
+        assert 'executor' not in kwargs and 'stats' not in kwargs
+        self._clients.append((agent, kwargs, {}))
+
+    async def serve(self):
+        """
+        Connect all clients and wait until they are done.
+
+        Returns a list with the result of every client, which is the
+        exception that ended it, or None.
+        """
+        self._started = time.monotonic()
+        self._stopped = None
+        try:
+            return await asyncio.gather(
+                *(connect_async(agent, executor=self._executor,
+                                stats=stats, **kwargs)
+                  for agent, kwargs, stats in self._clients),
+                return_exceptions=True)
+        finally:
+            self._stopped = time.monotonic()
+
+    def run(self):
+        """Run serve in a new event loop."""
+        return asyncio.run(self.serve())
+
+    def stats(self):
+        """
+        Return a dictionary with statistics about all clients.
+
+        The number of states received and of moves sent are summed up
+        over all clients, and the moves per second are measured since
+        serve was started.
+        """
+        states = sum(stats.get('states', 0) for _, _, stats in self._clients)
+        moves = sum(stats.get('moves', 0) for _, _, stats in self._clients)
+        elapsed = 0.0
+        if self._started is not None:
+            elapsed = (self._stopped or time.monotonic()) - self._started
+        return {'clients': len(self._clients),
+                'states': states,
+                'moves': moves,
+                'elapsed': elapsed,
+                'moves_per_sec': moves / elapsed if elapsed else 0.0}
+
+    def close(self):
+        """Stop the worker threads, once the searches are abandoned."""
+        self._executor.shutdown(cancel_futures=True)
+
 
 # Local Variables:
 # indent-tabs-mode: nil
@@ -1,8 +1,82 @@
 #!/usr/bin/env python3
 
 from kgp import *
+from kgp import _WorkerPool, _coalesce, _parse, _uninterrupted
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import pickle
+import random
+import re
+import socket
+import tempfile
+import threading
+import time
 import unittest
 
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+try:
+    import websocket
+except ModuleNotFoundError:
+    websocket = None
+
+
+def reference_sow(board, side, pit):
+    """Sow stone by stone, the way kgp.py used to, on plain lists."""
+    n = board.size
+    pits = {SOUTH: board.south_pits, NORTH: board.north_pits}
+    store = {SOUTH: board.south, NORTH: board.north}
+
+    me = side
+    pos = pit + 1
+    stones = pits[side][pit]
+    pits[side][pit] = 0
+    while stones > 0:
+        if pos == n:
+            if side == me:
+                store[me] += 1
+                stones -= 1
+            side = not side
+            pos = 0
+        else:
+            pits[side][pos] += 1
+            pos += 1
+            stones -= 1
+
+    again = pos == 0 and side != me
+    if side == me and pos > 0:
+        last, other = pos - 1, n - pos
+        if pits[side][last] == 1 and pits[not side][other] > 0:
+            store[side] += pits[not side][other] + 1
+            pits[not side][other] = 0
+            pits[side][last] = 0
+
+    if not any(pits[NORTH]) or not any(pits[SOUTH]):
+        for s in (NORTH, SOUTH):
+            store[s] += sum(pits[s])
+            pits[s] = [0] * n
+        again = False
+
+    return Board(store[SOUTH], store[NORTH], pits[SOUTH], pits[NORTH]), again
+
+
+def minimax(state, depth, side):
+    """Plain minimax search, returning the store difference for south."""
+    if depth <= 0 or state.is_final():
+        return state[SOUTH] - state[NORTH]
+    choose = max if side == SOUTH else min
+    values = []
+    for move in state.legal_moves(side):
+        after, again = state.sow(side, move)
+        values.append(minimax(after, depth - 1, side if again else not side))
+    return choose(values)
+
 
 class TestBoard(unittest.TestCase):
     def test_eq(self):
@@ -83,6 +157,1432 @@ class TestBoard(unittest.TestCase):
             Board(0,0,[1,0,0],[1,1,0]).sow(NORTH, 1),
             (Board(0,3,[0,0,0],[0,0,0]), False))
 
+    def test_make_move(self):
+        rng = random.Random(2671)
+        for _ in range(5000):
+            size = rng.randint(1, 12)
+            b = Board(rng.randint(0, 20), rng.randint(0, 20),
+                      [rng.randint(0, 5 * size) for _ in range(size)],
+                      [rng.randint(0, 5 * size) for _ in range(size)])
+            side = rng.choice((NORTH, SOUTH))
+            if b.is_final() or not b.legal_moves(side):
+                continue
+            move = rng.choice(b.legal_moves(side))
+
+            before = b.copy()
+            after, again = b.sow(side, move)
+            self.assertEqual(b, before)
+            self.assertEqual((after, again), reference_sow(b, side, move))
+            self.assertEqual(b.make_move(side, move)[0], again)
+            self.assertEqual(b, after)
+            self.assertEqual(b.key, after.key)
+            self.assertEqual(b.key, Board.parse(str(b)).key)
+
+
+    def test_unmake_move(self):
+        rng = random.Random(2672)
+        for size in range(1, 9):
+            b = Board(0, 0, [size] * size, [size] * size)
+            history = []
+            side = SOUTH
+            while not b.is_final():
+                again, undo = b.make_move(side, rng.choice(b.legal_moves(side)))
+                history.append((b.copy(), undo))
+                if not again:
+                    side = not side
+            while history:
+                board, undo = history.pop()
+                self.assertEqual(b, board)
+                self.assertEqual(b.key, board.key)
+                b.unmake_move(undo)
+            self.assertEqual(b, Board(0, 0, [size] * size, [size] * size))
+
+    def test_sides(self):
+        b = Board(4,5,[1,2,3],[6,7,8])
+        self.assertEqual(b.south_pits, [1,2,3])
+        self.assertEqual(b.north_pits, [6,7,8])
+        b[NORTH, 2] = 0
+        b[SOUTH] = 10
+        self.assertEqual(b, Board(10,5,[1,2,3],[6,7,0]))
+        self.assertEqual(b.key, Board(10,5,[1,2,3],[6,7,0]).key)
+
+    def test_mirror(self):
+        b = Board(1, 2, [3, 4], [5, 6])
+        self.assertEqual(b.mirror(), Board(2, 1, [5, 6], [3, 4]))
+        self.assertEqual(b.mirror().mirror(), b)
+
+
+    def test_key(self):
+        self.assertEqual(Board(4,5,[1,2,3],[6,7,8]).key,
+                         Board(4,5,[1,2,3],[6,7,8]).key)
+        self.assertNotEqual(Board(4,5,[1,2,3],[6,7,8]).key,
+                            Board(5,4,[1,2,3],[6,7,8]).key)
+        self.assertNotEqual(Board(4,5,[1,2,3],[6,7,8]).key,
+                            Board(4,5,[6,7,8],[1,2,3]).key)
+        self.assertTrue(0 <= Board(4,5,[1,2,3],[6,7,8]).key < 2**64)
+
+    def test_repeats(self):
+        rng = random.Random(2671)
+        for _ in range(500):
+            size = rng.randint(1, 6)
+            b = Board(0, 0, [rng.randint(0, 30) for _ in range(size)],
+                      [rng.randint(0, 30) for _ in range(size)])
+            for side in (SOUTH, NORTH):
+                for pit in range(size):
+                    if not b.is_legal(side, pit):
+                        self.assertFalse(b.repeats(side, pit))
+                        continue
+                    after, again = reference_sow(b, side, pit)
+                    # moves that end the game never repeat
+                    if not after.is_final():
+                        self.assertEqual(b.repeats(side, pit), again)
+
+
+class TestParse(unittest.TestCase):
+    def test_command(self):
+        self.assertEqual(_parse("kgp 1 0 0"), (None, None, "kgp", [1, 0, 0]))
+        self.assertEqual(_parse("  4@2 stop  \r\n"), (4, 2, "stop", []))
+        self.assertIsNone(_parse("@2 stop"))
+
+    def test_arguments(self):
+        _, _, _, args = _parse(r'3 set "info:name" "a \"b\" \\ c" +3 -4 .5 -1.25 time:mode')
+        self.assertEqual(args, ['info:name', 'a "b" \\ c', 3, -4, 0.5, -1.25, 'time:mode'])
+        # parsing stops at the first malformed argument
+        self.assertEqual(_parse("5 x 1 3.5x 2")[3], [1])
+
+    def test_board(self):
+        for size in (1, 6, 64):
+            b = Board(size, 2 * size, list(range(size)), [3] * size)
+            _, _, _, args = _parse(f"7 state {b}")
+            self.assertEqual(args, [b])
+            self.assertEqual(args[0].key, b.key)
+        self.assertEqual(_parse("7 state <3,0,0,3,3,3,3,3>")[3], [None])
+        self.assertEqual(_parse("7 state <0,1,1>")[3], [None])
+
+
+@unittest.skipUnless(numpy, "requires numpy")
+class TestBoardBatch(unittest.TestCase):
+    def random_boards(self, rng, size, count):
+        pit = lambda: rng.choice([0, 0, 1, 2, 3, rng.randint(0, 40)])
+        return [Board(rng.randint(0, 5), rng.randint(0, 5),
+                      [pit() for _ in range(size)],
+                      [pit() for _ in range(size)])
+                for _ in range(count)]
+
+    def test_sow(self):
+        rng = random.Random(2671)
+        for size in range(1, 9):
+            for side in (SOUTH, NORTH):
+                boards = [b for b in self.random_boards(rng, size, 500)
+                          if b.legal_moves(side)]
+                moves = [rng.choice(b.legal_moves(side)) for b in boards]
+                batch = BoardBatch.from_boards(boards)
+                after, again = batch.sow(side, moves)
+                for i, (board, move) in enumerate(zip(boards, moves)):
+                    expected, repeat = board.sow(side, move)
+                    self.assertEqual(after[i], expected)
+                    self.assertEqual(bool(again[i]), repeat)
+
+    def test_boards(self):
+        rng = random.Random(2671)
+        boards = self.random_boards(rng, 6, 200)
+        batch = BoardBatch.from_boards(boards)
+        self.assertEqual(len(batch), 200)
+        self.assertEqual(batch.is_final().tolist(),
+                         [b.is_final() for b in boards])
+        for side in (SOUTH, NORTH):
+            self.assertEqual(batch.legal_moves(side).tolist(),
+                             [[m in b.legal_moves(side) for m in range(6)]
+                              for b in boards])
+            self.assertEqual(batch.evaluate(side).tolist(),
+                             [b[side] - b[not side] for b in boards])
+        self.assertEqual(batch.mirror()[3], boards[3].mirror())
+
+    def test_children(self):
+        board = Board(0, 0, [0, 2, 3], [1, 1, 1])
+        children, parents, moves, again = BoardBatch.from_boards([board]).children(SOUTH)
+        self.assertEqual(moves.tolist(), board.legal_moves(SOUTH))
+        self.assertEqual(parents.tolist(), [0, 0])
+        for i, move in enumerate(moves):
+            self.assertEqual((children[i], bool(again[i])), board.sow(SOUTH, move))
+
+    def test_playout(self):
+        boards = [Board(0, 0, [4]*6, [4]*6), Board(5, 1, [0]*6, [2]*6),
+                  Board(3, 2, [0, 0, 0, 0, 0, 1], [1, 0, 0, 0, 0, 0])]
+        batch = BoardBatch.from_boards(boards * 100)
+        for side in (SOUTH, NORTH):
+            sign = 1 if side == SOUTH else -1
+            values = batch.playout(side, numpy.random.default_rng(0))
+            self.assertTrue((abs(values[0::3]) <= 48).all())
+            self.assertTrue((values[0::3] % 2 == 0).all())
+            # the game is already over
+            self.assertTrue((values[1::3] == sign * -8).all())
+            # only one move each, south's ends the game
+            self.assertTrue((values[2::3] == sign).all())
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_size(self):
+        self.assertLessEqual(len(TranspositionTable(1).buffer), 2**20)
+        self.assertGreater(len(TranspositionTable(1).buffer), 2**19)
+        self.assertLessEqual(len(TranspositionTable(3).buffer), 3 * 2**20)
+
+
+    def test_store(self):
+        t = TranspositionTable(1)
+        key = Board(0,0,[3,3,3],[3,3,3]).key
+        self.assertIsNone(t.probe(key))
+        t.store(key, -5, 4, EXACT, 2)
+        self.assertEqual(t.probe(key), (-5, 4, EXACT, 2))
+        t.store(key, 7, 2, LOWERBOUND, 1)
+        self.assertEqual(t.probe(key), (7, 2, LOWERBOUND, 1))
+        self.assertEqual(t.stats()['hits'], 2)
+        self.assertEqual(t.stats()['collisions'], 0)
+
+
+    def test_replace(self):
+        t = TranspositionTable(1)
+        a, b, c = (t.mask + 1) * 1 + 5, (t.mask + 1) * 2 + 5, (t.mask + 1) * 3 + 5
+        t.store(a, 1, 8, EXACT)
+        t.store(b, 2, 2, EXACT)
+        # the deeper entry is kept, the shallow one goes to the second slot
+        self.assertEqual(t.probe(a), (1, 8, EXACT, -1))
+        self.assertEqual(t.probe(b), (2, 2, EXACT, -1))
+        t.store(c, 3, 1, UPPERBOUND)
+        self.assertEqual(t.probe(a), (1, 8, EXACT, -1))
+        self.assertIsNone(t.probe(b))
+        self.assertEqual(t.stats()['collisions'], 1)
+
+        # entries of older searches are replaced, whatever their depth
+        t.new_search()
+        t.store(b, 2, 2, EXACT)
+        self.assertIsNone(t.probe(a))
+        self.assertEqual(t.probe(b), (2, 2, EXACT, -1))
+        self.assertEqual(t.probe(c), (3, 1, UPPERBOUND, -1))
+        self.assertGreater(t.stats()['fill'], 0)
+
+        t.clear()
+        self.assertIsNone(t.probe(b))
+
+
+    def test_shared(self):
+        t = TranspositionTable(1, shared=True)
+        self.addCleanup(t.close)
+        key = Board(0,0,[3,3,3],[3,3,3]).key
+
+        def child(table):
+            table.new_search()
+            table.store(key, -42, 6, UPPERBOUND, 3)
+
+        proc = mp.get_context('fork').Process(target=child, args=(t,))
+        proc.start()
+        proc.join()
+        self.assertEqual(t.probe(key), (-42, 6, UPPERBOUND, 3))
+        self.assertEqual(t.generation, 2)
+
+        other = TranspositionTable.attach(t.name)
+        self.assertEqual(other.probe(key), (-42, 6, UPPERBOUND, 3))
+        other.close()
+
+
+    def test_persist(self):
+        path = os.path.join(tempfile.mkdtemp(), 'table')
+        key = Board(0,0,[3,3,3],[3,3,3]).key
+        t = TranspositionTable(1, size=3, seeds=3)
+        t.store(key, 12, 7, LOWERBOUND, 0)
+        t.persist(path)
+        t.close()
+
+        t = TranspositionTable.load(path, size=3, seeds=3)
+        self.assertEqual(t.probe(key), (12, 7, LOWERBOUND, 0))
+        t.new_search()
+        t.store(key + 1, 1, 1, EXACT, 1)
+        t.persist(path)
+        t.close()
+
+        t = TranspositionTable.load(path, size=3, seeds=3)
+        self.addCleanup(t.close)
+        self.assertEqual(t.probe(key), (12, 7, LOWERBOUND, 0))
+        self.assertEqual(t.probe(key + 1), (1, 1, EXACT, 1))
+        self.assertEqual(t.generation, 2)
+
+        with self.assertRaises(ValueError):
+            TranspositionTable.load(path, size=6, seeds=3)
+        with self.assertRaises(ValueError):
+            TranspositionTable.load(path, size=3, seeds=4)
+        with open(path, 'r+b') as f:
+            f.truncate(2**16)
+        with self.assertRaises(ValueError):
+            TranspositionTable.load(path, size=3, seeds=3)
+        for length in (10, 0):
+            with open(path, 'r+b') as f:
+                f.truncate(length)
+            with self.assertRaises(ValueError):
+                TranspositionTable.load(path, size=3, seeds=3)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 4096)
+        with self.assertRaises(ValueError):
+            TranspositionTable.load(path)
+
+
+    def test_torn(self):
+        t = TranspositionTable(1)
+        t.store(1234, 5, 3, EXACT, 1)
+        i = (1234 & t.mask) << 1
+        t._data[i] ^= 1 << 40
+        self.assertIsNone(t.probe(1234))
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_order(self):
+        # pit 3 repeats, pit 0 captures the 5 stones opposite of pit 1
+        b = Board(0, 0, [1, 0, 1, 1], [4, 3, 5, 1])
+        ordering = MoveOrdering(4)
+        self.assertEqual(ordering.order(b, SOUTH, 0), [3, 0, 2])
+        self.assertEqual(ordering.order(b, SOUTH, 0, best=2), [2, 3, 0])
+        after, again = b.sow(SOUTH, 0)
+        self.assertEqual(after.south, 6)
+
+        # killers come before the history
+        b = Board(0, 0, [5, 5, 5, 5], [5, 5, 5, 5])
+        self.assertEqual(ordering.order(b, NORTH, 1), [0, 1, 2, 3])
+        ordering.cutoff(NORTH, 2, 5, 4)
+        ordering.cutoff(NORTH, 3, 5, 1)
+        self.assertEqual(ordering.order(b, NORTH, 5), [3, 2, 0, 1])
+        self.assertEqual(ordering.order(b, NORTH, 4), [2, 3, 0, 1])
+
+        ordering.cutoff(NORTH, 1, 5, 2, index=2)
+        self.assertEqual(ordering.stats(), {'cutoffs': 3, 'first_cutoffs': 2,
+                                            'first_cutoff_rate': 2 / 3})
+        ordering.new_search()
+        self.assertEqual(ordering.history[NORTH], [0, 2, 8, 0])
+        self.assertEqual(ordering.killers[5], [-1, -1])
+
+    def test_search(self):
+        """Ordering the moves does not change the result of a search."""
+        def alphabeta(state, depth, side, alpha, beta, ply=0):
+            if depth == 0 or state.is_final():
+                return state.south - state.north
+            for index, move in enumerate(ordering.order(state, side, ply)):
+                after, again = state.sow(side, move)
+                value = alphabeta(after, depth - 1, side if again else not side,
+                                  alpha, beta, ply + 1)
+                if side == SOUTH:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    ordering.cutoff(side, move, ply, depth, index)
+                    break
+            return alpha if side == SOUTH else beta
+
+        ordering = MoveOrdering(3)
+        rng = random.Random(2671)
+        for _ in range(20):
+            b = Board(0, 0, [rng.randint(0, 4) for _ in range(3)],
+                      [rng.randint(0, 4) for _ in range(3)])
+            self.assertEqual(alphabeta(b, 4, SOUTH, -100, 100), minimax(b, 4, SOUTH))
+        self.assertGreater(ordering.stats()['first_cutoff_rate'], 0.5)
+
+
+class TestEndgameTable(unittest.TestCase):
+    @staticmethod
+    def exact(board, side):
+        if board.is_final():
+            return (board.south + sum(board.south_pits) -
+                    board.north - sum(board.north_pits))
+        values = []
+        for move in board.legal_moves(side):
+            after, again = board.sow(side, move)
+            values.append(TestEndgameTable.exact(after, side if again else not side))
+        return max(values) if side == SOUTH else min(values)
+
+    def random_board(self, rng, size, stones):
+        pits = [0] * (2 * size)
+        for _ in range(stones):
+            pits[rng.randrange(2 * size)] += 1
+        return Board(rng.randint(0, 9), rng.randint(0, 9), pits[:size], pits[size:])
+
+    def test_build(self):
+        rng = random.Random(2671)
+        table = EndgameTable.build(3, 5)
+        self.assertEqual(table.entries, 462)
+        indices = set()
+        for _ in range(500):
+            board = self.random_board(rng, 3, rng.randint(0, 5))
+            indices.add(table.index(board))
+            for side in (SOUTH, NORTH):
+                self.assertEqual(table.lookup(board, side), self.exact(board, side))
+        self.assertLess(max(indices), table.entries)
+        self.assertIsNone(table.lookup(Board(0, 0, [2, 2, 2], [0, 0, 0])))
+
+    def test_persist(self):
+        rng = random.Random(2671)
+        table = EndgameTable.build(2, 6)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "endgame.bin")
+            table.persist(path)
+            loaded = EndgameTable.load(path)
+            self.addCleanup(loaded.close)
+            self.assertEqual((loaded.size, loaded.stones), (2, 6))
+            for _ in range(100):
+                board = self.random_board(rng, 2, rng.randint(0, 6))
+                self.assertEqual(loaded.lookup(board, NORTH), table.lookup(board, NORTH))
+
+            with open(path, 'r+b') as f:
+                f.truncate(EndgameTable.HEADER_SIZE + 10)
+            self.assertRaises(ValueError, EndgameTable.load, path)
+            with open(path, 'wb') as f:
+                f.write(bytes(100))
+            self.assertRaises(ValueError, EndgameTable.load, path)
+
+
+class TestOpeningBook(unittest.TestCase):
+    @staticmethod
+    def search(state, depth):
+        def value(move):
+            after, again = state.sow(SOUTH, move)
+            return minimax(after, depth - (not again), SOUTH if again else NORTH)
+        move = max(state.legal_moves(SOUTH), key=value)
+        return value(move), move
+
+    def test_build(self):
+        start = Board(0, 0, [3] * 3, [3] * 3)
+        boards = []
+        book = OpeningBook.build(self.search, [start], 2, 2,
+                                 report=lambda board, entry: boards.append(board))
+        self.assertEqual(len(book), len(boards))
+        self.assertEqual(len({b.key for b in boards}), len(boards))
+        for board in boards:
+            value, move = self.search(board, 2)
+            self.assertEqual(book.lookup(board), (value, move, 2))
+        # north began
+        after, again = start.sow(NORTH, 2)
+        self.assertFalse(again)
+        self.assertIsNotNone(book.lookup(after))
+        self.assertIsNone(book.lookup(Board(0, 0, [3] * 4, [3] * 4)))
+
+    def test_build_north(self):
+        # the replies of north are made on the board, not its mirror
+        start = Board(0, 0, [1, 2, 3], [4, 0, 2])
+        book = OpeningBook.build(self.search, [start], 1, 1)
+        for move in start.legal_moves(NORTH):
+            after, again = start.sow(NORTH, move)
+            if not again:
+                self.assertIsNotNone(book.lookup(after))
+        self.assertEqual(len(OpeningBook()), 0)
+
+    def test_persist(self):
+        book = OpeningBook({Board(0, 0, [3] * 3, [3] * 3).key: (-5, 2, 9),
+                            Board(0, 0, [4] * 4, [4] * 4).key: (7, 1, 12)})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.bin")
+            book.persist(path)
+            book.close()
+            loaded = OpeningBook.load(path)
+            self.addCleanup(loaded.close)
+            self.assertEqual(len(loaded), 2)
+            self.assertEqual(loaded.lookup(Board(0, 0, [3] * 3, [3] * 3)), (-5, 2, 9))
+            self.assertEqual(loaded.lookup(Board(0, 0, [4] * 4, [4] * 4)), (7, 1, 12))
+            self.assertIsNone(loaded.lookup(Board(0, 0, [5] * 5, [5] * 5)))
+
+            with open(path, 'r+b') as f:
+                f.truncate(OpeningBook.HEADER_SIZE + 20)
+            self.assertRaises(ValueError, OpeningBook.load, path)
+            with open(path, 'wb') as f:
+                f.write(bytes(100))
+            self.assertRaises(ValueError, OpeningBook.load, path)
+
+
+class TestSessions(unittest.TestCase):
+    def test_lru(self):
+        sessions = Sessions(capacity=2, megabytes=1)
+        self.addCleanup(sessions.close)
+        self.assertIsNone(sessions.get(""))
+        a = sessions.get("a")
+        self.assertIs(sessions.get("a"), a)
+        self.assertEqual(a.states, 2)
+        b = sessions.get("b")
+        sessions.get("a")
+        # b was used least recently
+        sessions.get("c")
+        self.assertEqual((len(sessions), "a" in sessions, "b" in sessions),
+                         (2, True, False))
+        self.assertIsNone(b.table)
+        sessions.end("a")
+        self.assertIsNone(a.table)
+        self.assertEqual(len(sessions), 1)
+
+    def test_shared(self):
+        sessions = Sessions(megabytes=1, shared=True)
+        self.addCleanup(sessions.close)
+        session = sessions.get("a")
+        session.table.store(42, 7, 3, EXACT, 2)
+        attached = pickle.loads(pickle.dumps(session))
+        self.addCleanup(lambda: Session._attached.pop(attached.table.name).close())
+        self.assertEqual(attached.game, "a")
+        self.assertEqual(attached.table.probe(42), (7, 3, EXACT, 2))
+        self.assertIs(pickle.loads(pickle.dumps(session)), attached)
+
+    def test_not_shared(self):
+        sessions = Sessions(megabytes=1)
+        self.addCleanup(sessions.close)
+        self.assertRaises(TypeError, pickle.dumps, sessions.get("a"))
+
+    def test_attached_capacity(self):
+        """A process keeps as many sessions as configured."""
+        sessions = Sessions(capacity=1, megabytes=1, shared=True)
+        self.addCleanup(sessions.close)
+        a = pickle.loads(pickle.dumps(sessions.get("a")))
+        b = pickle.loads(pickle.dumps(sessions.get("b")))
+        self.addCleanup(lambda: Session._attached.pop(b.table.name).close())
+        self.assertIsNone(a.table)
+        self.assertEqual(b.capacity, 1)
+
+    def test_continue(self):
+        """The search of the next move starts from the previous one."""
+        table = TranspositionTable(4)
+        board = Board(0, 0, [6] * 6, [6] * 6)
+        engine = Negamax(table)
+        for depth in range(1, 9):
+            engine.search(board, depth)
+        pv = engine.principal_variation(board)
+        self.assertEqual(pv[0], engine.search(board, 8)[1])
+
+        # follow the principal variation until south moves again
+        side = SOUTH
+        for move in pv:
+            again, _ = board.make_move(side, move)
+            if not again:
+                side = not side
+                if side == SOUTH:
+                    break
+        warm = [Negamax(table).search(board, depth)[2] for depth in range(1, 6)]
+        cold = [Negamax(TranspositionTable(4)).search(board, depth)[2]
+                for depth in range(1, 6)]
+        self.assertLess(sum(warm), sum(cold) / 2)
+
+
+class TestClock(unittest.TestCase):
+    def test_modes(self):
+        board = Board(0, 0, [6] * 6, [6] * 6)
+        clock = Clock(margin=0.5)
+        self.assertIsNone(clock.start(board))
+        self.assertFalse(clock.set("info:name", "x"))
+        self.assertTrue(clock.set("time:clock", 5))
+        self.assertTrue(clock.set("time:mode", "relative"))
+        self.assertEqual(clock.allocate(board), 4.5)
+        deadline = clock.start(board)
+        self.assertAlmostEqual(deadline - time.monotonic(), 4.5, places=1)
+        clock.set("time:mode", "none")
+        self.assertIsNone(clock.allocate(board))
+        clock.set("time:mode", "absolute")
+        clock.set("time:opclock", 7)
+        self.assertLess(clock.allocate(board), 1)
+        self.assertEqual(clock.opclock, 7)
+
+    def test_simulated(self):
+        """Replay games on a simulated clock, that must not run out."""
+        rng = random.Random(2671)
+        saved = total = 0
+        for size, seconds in ((4, 10), (6, 60), (8, 120)):
+            for _ in range(5):
+                now = [0.0]
+                clock = Clock(now=lambda: now[0])
+                clock.set("time:mode", "absolute")
+                left = float(seconds)
+                board = Board(0, 0, [size] * size, [size] * size)
+                side = SOUTH
+                while not board.is_final():
+                    if side == SOUTH:
+                        # the server only sends whole seconds
+                        clock.set("time:clock", int(left))
+                        clock.start(board)
+                        allocated = clock.allocate(board)
+                        now[0] += allocated + 0.1
+                        clock.stop()
+                        left -= allocated + 0.1
+                        self.assertGreater(left, 0)
+                    board, again = board.sow(side, rng.choice(board.legal_moves(side)))
+                    if not again:
+                        side = not side
+                saved += left
+                total += seconds
+        # not much time is saved up
+        self.assertLess(saved / total, 0.1)
+
+    def test_remaining(self):
+        now = [0.0]
+        clock = Clock(now=lambda: now[0])
+        clock.set("time:clock", 30)
+        board = Board(0, 0, [3] * 3, [3] * 3)
+        clock.start(board)
+        now[0] = 4
+        self.assertEqual(clock.remaining(), 26)
+        clock.stop()
+        now[0] = 10     # the time of the opponent
+        self.assertEqual(clock.remaining(), 26)
+        clock.set("time:clock", 25)
+        self.assertEqual(clock.remaining(), 25)
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_stop(self):
+        # a pipe, unlike a queue, does not start a thread in the worker,
+        # that SIGUSR1 could be delivered to instead of the main thread
+        receiver, sender = mp.Pipe(duplex=False)
+
+        def query(state, cid, stopped):
+            sender.send(cid)
+            if cid == 1:
+                time.sleep(60)
+
+        def started():
+            self.assertTrue(receiver.poll(5))
+            return receiver.recv()
+
+        pool = _WorkerPool(1, query)
+        self.addCleanup(pool.close)
+
+        pool.submit(None, 1)
+        self.assertEqual(started(), 1)
+        start = time.monotonic()
+        pool.stop(1)
+        pool.submit(None, 3)
+        self.assertEqual(started(), 3)
+        self.assertLess(time.monotonic() - start, 5)
+
+        # requests stopped before they were started are skipped
+        pool.stop(5)
+        pool.submit(None, 5)
+        pool.submit(None, 7)
+        self.assertEqual(started(), 7)
+
+    def test_error(self):
+        receiver, sender = mp.Pipe(duplex=False)
+
+        def query(state, cid, stopped):
+            if cid == 1:
+                raise IndexError(cid)
+            sender.send(cid)
+
+        pool = _WorkerPool(1, query)
+        self.addCleanup(pool.close)
+
+        # the worker survives the failed request
+        pool.submit(None, 1)
+        pool.submit(None, 3)
+        self.assertTrue(receiver.poll(5))
+        self.assertEqual(receiver.recv(), 3)
+
+    def test_close(self):
+        """A worker is not killed while it holds the lock."""
+        receiver, sender = mp.Pipe(duplex=False)
+        lock = mp.Lock()
+
+        def query(state, cid, stopped):
+            with _uninterrupted():
+                with lock:
+                    sender.send(cid)
+                    # longer than close waits for the worker
+                    time.sleep(1.5)
+                time.sleep(60)
+
+        pool = _WorkerPool(1, query)
+        pool.submit(None, 1)
+        self.assertTrue(receiver.poll(5))
+        pool.close(lock)
+        self.assertTrue(lock.acquire(timeout=5))
+        lock.release()
+
+
+class TestSearchPool(unittest.TestCase):
+    def test_search_moves(self):
+        pool = SearchPool(minimax, workers=3)
+        self.addCleanup(pool.close)
+
+        for state in (Board(0,0,[4]*6,[4]*6), Board(3,5,[0,2,7,1],[1,0,4,4])):
+            for depth in (1, 3):
+                expected = []
+                for move in state.legal_moves(SOUTH):
+                    after, again = state.sow(SOUTH, move)
+                    value = minimax(after, depth - 1, SOUTH if again else NORTH)
+                    expected.append((value, move))
+                self.assertEqual(pool.search_moves(state, depth), expected)
+
+
+    def test_error(self):
+        def search(state, depth, side):
+            if depth == 2:
+                raise ValueError(depth)
+            return minimax(state, depth, side)
+
+        pool = SearchPool(search, workers=2)
+        self.addCleanup(pool.close)
+
+        state = Board(0,0,[3]*4,[3]*4)
+        with self.assertRaises(ValueError):
+            pool.search_moves(state, 3)
+        self.assertEqual(len(pool.search_moves(state, 2)), 4)
+
+    def test_agent(self):
+        pool = SearchPool(minimax, workers=2)
+        self.addCleanup(pool.close)
+
+        state = Board(0,0,[3]*4,[3]*4)
+        moves = list(pool.agent(state, depths=range(1, 4)))
+        self.assertEqual(len(moves), 3)
+        self.assertEqual(moves[-1], max(pool.search_moves(state, 3))[1])
+
+
+class TestNegamax(unittest.TestCase):
+    @staticmethod
+    def exact(state, depth, side):
+        """Minimax where repeat moves do not count towards the depth."""
+        if state.is_final() or depth <= 0:
+            return state.south - state.north
+        choose = max if side == SOUTH else min
+        values = []
+        for move in state.legal_moves(side):
+            after, again = state.sow(side, move)
+            values.append(TestNegamax.exact(after, depth - (not again),
+                                            side if again else not side))
+        return choose(values)
+
+    def boards(self, count, size=4):
+        rng = random.Random(2671)
+        result = []
+        while len(result) < count:
+            b = Board(rng.randint(0, 5), rng.randint(0, 5),
+                      [rng.randint(0, 5) for _ in range(size)],
+                      [rng.randint(0, 5) for _ in range(size)])
+            if not b.is_final():
+                result.append(b)
+        return result
+
+    def check(self, engine, board, depth):
+        value, move, nodes = engine.search(board, depth)
+        self.assertEqual(value, self.exact(board, depth, SOUTH))
+        after, again = board.sow(SOUTH, move)
+        self.assertEqual(self.exact(after, depth - (not again),
+                                    SOUTH if again else NORTH), value)
+        self.assertEqual(nodes, engine.stats()['nodes'])
+
+    def test_search(self):
+        for board in self.boards(30):
+            for depth in (1, 2, 3, 4):
+                self.check(Negamax(), board, depth)
+
+    def test_table(self):
+        table = TranspositionTable(1)
+        engine = Negamax(table, window=1)
+        for board in self.boards(30):
+            # iterative deepening with aspiration windows
+            for depth in (1, 2, 3, 4):
+                self.check(engine, board, depth)
+            # the table cuts off most of the search of the same board
+            searched = engine.stats()['nodes']
+            _, _, nodes = engine.search(board.copy(), 4)
+            self.assertLess(nodes, max(searched // 2, 5))
+        self.assertGreater(table.stats()['hits'], 0)
+
+    def test_endgame(self):
+        endgame = EndgameTable.build(4, 6)
+        rng = random.Random(2671)
+        for _ in range(20):
+            pits = [0] * 8
+            for _ in range(rng.randint(2, 6)):
+                pits[rng.randrange(8)] += 1
+            board = Board(3, 4, pits[:4], pits[4:])
+            if board.is_final():
+                continue
+            value, _, _ = Negamax(endgame=endgame).search(board, 2)
+            self.assertEqual(value, self.exact(board, 20, SOUTH))
+
+    def test_deepening(self):
+        engine = Negamax(TranspositionTable(1))
+        deepening = IterativeDeepening(engine.search, 60, depths=range(1, 6))
+        board = Board(0, 0, [4] * 4, [4] * 4)
+        moves = list(deepening.agent(board))
+        self.assertEqual(len(moves), 5)
+        self.assertEqual(deepening.iterations[-1]['value'], self.exact(board, 5, SOUTH))
+        stats = engine.stats()
+        self.assertEqual(stats['depth'], 5)
+        self.assertGreater(stats['branching_factor'], 1)
+        self.assertGreater(stats['nps'], 0)
+
+    def test_stop(self):
+        # the search is abandoned at the next node
+        engine = Negamax(TranspositionTable(1), stop=lambda: engine.nodes > 100)
+        board = Board(0, 0, [4] * 6, [4] * 6)
+        with self.assertRaises(Stopped):
+            engine.search(board, 12)
+        self.assertEqual(engine.nodes, 101)
+
+        # the engine can search again
+        engine.stop = None
+        self.assertEqual(engine.search(board, 3)[0], self.exact(board, 3, SOUTH))
+
+
+class TestIterativeDeepening(unittest.TestCase):
+    def test_agent(self):
+        def search(state, depth):
+            value, move = max((minimax(state.sow(SOUTH, move)[0], depth - 1, NORTH), move)
+                              for move in state.legal_moves(SOUTH))
+            return value, move, 6 ** depth
+
+        reports = []
+        driver = IterativeDeepening(search, 60, depths=range(1, 4),
+                                    report=reports.append)
+        moves = list(driver.agent(Board(0,0,[3]*6,[3]*6)))
+        self.assertEqual(len(moves), 3)
+        self.assertEqual(reports, driver.iterations)
+        self.assertEqual([it['depth'] for it in reports], [1, 2, 3])
+        self.assertEqual(moves[-1], reports[-1]['move'])
+        self.assertAlmostEqual(driver.branching_factor(), 6)
+
+    def test_budget(self):
+        def search(state, depth):
+            time.sleep(0.01 * 3 ** depth)
+            return 0, depth, 3 ** depth
+
+        driver = IterativeDeepening(search, 0.5)
+        start = time.monotonic()
+        moves = list(driver.agent(Board(0,0,[3]*6,[3]*6)))
+        self.assertLess(time.monotonic() - start, 0.5)
+        # the fourth iteration would take 0.81s
+        self.assertEqual(moves, [1, 2, 3])
+        self.assertAlmostEqual(driver.branching_factor(), 3)
+
+    def test_exhausted(self):
+        driver = IterativeDeepening(lambda state, depth: (0, 0, 100), 60)
+        self.assertEqual(len(list(driver.agent(Board(0,0,[3]*6,[3]*6)))), 2)
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_records(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'log')
+            engine = Negamax(TranspositionTable(1))
+            telemetry = Telemetry(engine, log=path)
+            deepening = IterativeDeepening(engine.search, 60, depths=range(1, 5),
+                                           report=telemetry.observe)
+            state = Board(0, 0, [4] * 4, [4] * 4)
+            telemetry.start(state, 4)
+            moves = list(deepening.agent(state))
+            telemetry.close()
+            with open(path) as log:
+                lines = [json.loads(line) for line in log]
+
+        self.assertEqual([r['depth'] for r in telemetry.records], [1, 2, 3, 4])
+        self.assertEqual([r['move'] for r in telemetry.records], moves)
+        for record, iteration in zip(telemetry.records, deepening.iterations):
+            self.assertLessEqual(iteration.items(), record.items())
+            self.assertLessEqual(record['tt_hits'], record['tt_probes'])
+            self.assertLessEqual(record['first_cutoffs'], record['cutoffs'])
+        self.assertEqual(sum(r['cutoffs'] for r in telemetry.records),
+                         engine.ordering.cutoffs)
+        self.assertEqual([line['id'] for line in lines], [4] * 4)
+        self.assertEqual(lines[-1]['state'], str(state))
+        self.assertEqual(lines[-1]['nodes'], telemetry.records[-1]['nodes'])
+
+        comment = telemetry.take()
+        self.assertTrue(comment.startswith("depth 4, value "))
+        self.assertIsNone(telemetry.take())
+
+    def test_disabled(self):
+        telemetry = Telemetry(comment=False)
+        telemetry.start(Board(0, 0, [1], [1]))
+        telemetry.observe({'depth': 1, 'value': 0, 'move': 0,
+                           'nodes': None, 'time': 0.0, 'nps': None})
+        self.assertEqual(len(telemetry.records), 1)
+        self.assertIsNone(telemetry.take())
+
+
+class TestPonder(unittest.TestCase):
+    @staticmethod
+    def search(state, depth):
+        return max((minimax(state.sow(SOUTH, move)[0], depth - 1, NORTH), move)
+                   for move in state.legal_moves(SOUTH))
+
+    def test_hit(self):
+        ponder = Ponder(self.search, 60, depths=range(1, 4))
+        self.addCleanup(ponder.close)
+
+        state = Board(0,0,[3]*6,[3]*6)
+        moves = list(ponder.agent(state))
+        expected = ponder.predict(state, moves[-1], 2)
+        time.sleep(1)
+
+        moves = list(ponder.agent(expected))
+        self.assertEqual(moves[-1], self.search(expected, 3)[1])
+        self.assertEqual(ponder.stats()['hits'], 1)
+        self.assertEqual(ponder.stats()['depth_gained'], 3 / 2)
+
+    def test_miss(self):
+        ponder = Ponder(self.search, 60, depths=range(1, 4))
+        self.addCleanup(ponder.close)
+
+        list(ponder.agent(Board(0,0,[3]*6,[3]*6)))
+        state = Board(0,0,[3]*6,[3]*6)
+        self.assertEqual(len(list(ponder.agent(state))), 3)
+        self.assertEqual(ponder.stats()['hits'], 0)
+        self.assertEqual(ponder.stats()['moves'], 2)
+
+
+class TestMonteCarlo(unittest.TestCase):
+    def test_agent(self):
+        for batched in (True, False):
+            mcts = MonteCarlo(batch=16, seed=0)
+            if not batched:
+                mcts._numpy_rng = None
+            state = Board(0, 0, [1, 0, 2], [0, 20, 1])
+            moves = list(mcts.agent(state, playouts=320))
+            self.assertEqual(len(moves), 20)
+            self.assertEqual(moves[-1], 0)
+            self.assertEqual(mcts.playouts, 320)
+
+    def test_reuse(self):
+        mcts = MonteCarlo(batch=32, seed=0)
+        state = Board(0, 0, [3]*4, [3]*4)
+        move = list(mcts.agent(state, playouts=2048))[-1]
+        after, again = state.sow(SOUTH, move)
+        while again:
+            after, again = after.sow(SOUTH, after.legal_moves(SOUTH)[0])
+        after, again = after.sow(NORTH, after.legal_moves(NORTH)[0])
+        self.assertFalse(again)
+
+        self.assertEqual(len(list(mcts.agent(after, playouts=64))), 2)
+        self.assertEqual(mcts.reused, 1)
+        self.assertGreater(mcts._root.visits, 64)
+
+
+class TestConnect(unittest.TestCase):
+    def test_coalesce(self):
+        stats = {}
+        batch = [b"1@4 move 1\r\n", b"3@6 move 2\r\n", b"5@4 move 3\r\n",
+                 b"7@4 yield\r\n", b"9@6 move 1\r\n"]
+        data = _coalesce(batch, stats)
+        self.assertEqual(data, b"5@4 move 3\r\n7@4 yield\r\n9@6 move 1\r\n")
+        _coalesce([b"11 pong\r\n"], stats)
+        self.assertEqual(stats, {'messages': 4, 'bytes': len(data) + 9,
+                                 'writes': 2, 'coalesced': 1, 'dropped': 2})
+
+    def test_connect(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        received = []
+
+        def serve():
+            conn, _ = server.accept()
+            with conn, conn.makefile('rw', newline='') as io:
+                io.write("kgp 1 0 0\r\n2 state <3,0,0,3,3,3,3,3,3>\r\n")
+                io.flush()
+                for line in io:
+                    received.append(_parse(line))
+                    if received[-1][2] == "yield":
+                        break
+                io.write("4 goodbye\r\n")
+                io.flush()
+                for line in io:
+                    pass
+
+        def agent(state):
+            yield from state.legal_moves(SOUTH)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        stats = {}
+        connect(agent, host='127.0.0.1', port=server.getsockname()[1],
+                stats=stats)
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+        moves = [args for _, ref, cmd, args in received if cmd == "move"]
+        self.assertEqual(moves[-1], [3])
+        self.assertEqual(stats['messages'], len(received))
+        self.assertEqual(stats['messages'] + stats['dropped'], 5)
+
+    def test_error(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        received = []
+
+        def serve():
+            conn, _ = server.accept()
+            with conn, conn.makefile('rw', newline='') as io:
+                io.write("kgp 1 0 0\r\n2 state <3,0,0,0,3,3,3,3,3>\r\n"
+                         "4 state <3,0,0,3,3,3,3,3,3>\r\n")
+                io.flush()
+                for line in io:
+                    received.append(_parse(line))
+                    if received[-1][2] == "yield":
+                        break
+                io.write("6 goodbye\r\n")
+                io.flush()
+                for line in io:
+                    pass
+
+        def agent(state):
+            # fails on the first state
+            yield state.legal_moves(SOUTH)[state.south_pits[0] - 3]
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        connect(agent, host='127.0.0.1', port=server.getsockname()[1],
+                workers=1)
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([(ref, cmd, args) for _, ref, cmd, args in received[1:]],
+                         [(4, "move", [1]), (4, "yield", [])])
+
+    def test_sessions(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        moves = []
+
+        def serve():
+            conn, _ = server.accept()
+            with conn, conn.makefile('rw', newline='') as io:
+                io.write("kgp 1 0 0\r\n")
+                cid = 2
+                for game in ("a", "a", "b", "a", ""):
+                    io.write(f'{cid} set game:id "{game}"\r\n'
+                             f'{cid + 2} state <3,0,0,3,3,3,3,3,3>\r\n')
+                    io.flush()
+                    for line in io:
+                        command = _parse(line)
+                        if command[1] == cid + 2 and command[2] == "move":
+                            moves.append(command[3][0])
+                        if command[1] == cid + 2 and command[2] == "yield":
+                            break
+                    io.write(f"{cid + 4}@{cid + 2} stop\r\n")
+                    cid += 6
+                io.write(f"{cid} goodbye\r\n")
+                io.flush()
+                for line in io:
+                    pass
+
+        def agent(state, session=None):
+            # count the requests of the game in its shared table
+            if session is None:
+                yield 0
+                return
+            entry = session.table.probe(1)
+            count = entry[0] + 1 if entry else 0
+            session.table.store(1, count, 1, EXACT, 0)
+            yield count
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        connect(agent, host='127.0.0.1', port=server.getsockname()[1])
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(moves, [1, 2, 1, 3, 1])
+
+
+class QueueConnection:
+    """In-memory stand-in for a websocket connection of connect_async."""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.closed = False
+
+    async def recv(self):
+        return await self.incoming.get()
+
+    async def send(self, data):
+        for line in data.decode().splitlines():
+            await self.outgoing.put(line)
+
+    async def close(self):
+        self.closed = True
+
+
+class TestConnectAsync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.abandoned = threading.Event()
+
+    def agent(self, state):
+        """Yield the first move and keep on searching."""
+        try:
+            yield state.legal_moves(SOUTH)[0]
+            while True:
+                time.sleep(0.01)
+                yield state.legal_moves(SOUTH)[0]
+        finally:
+            self.abandoned.set()
+
+    async def play(self, recv, send):
+        async def expect(cmd):
+            command = _parse(await asyncio.wait_for(recv(), 5))
+            self.assertEqual(command[2], cmd)
+            return command
+
+        await send("kgp 1 0 0\r\n")
+        self.assertEqual((await expect("set"))[3], ["info:name", "test"])
+        await expect("mode")
+
+        await send("4 state <3,0,0,3,3,3,3,3,3>\r\n")
+        _cid, ref, _cmd, args = await expect("move")
+        self.assertEqual((ref, args), (4, [1]))
+
+        # pings are answered while the agent is searching
+        await send('6 ping "x"\r\n')
+        _cid, ref, _cmd, args = await expect("pong")
+        self.assertEqual((ref, args), (6, ["x"]))
+
+        await send("8@4 stop\r\n")
+        await send("10 goodbye\r\n")
+
+    async def test_tcp(self):
+        done = asyncio.Event()
+
+        async def serve(reader, writer):
+            async def recv():
+                return (await reader.readline()).decode()
+
+            async def send(msg):
+                writer.write(msg.encode())
+                await writer.drain()
+
+            try:
+                await self.play(recv, send)
+            finally:
+                done.set()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        await asyncio.wait_for(
+            connect_async(self.agent, host='127.0.0.1', port=port, name="test"), 5)
+        self.assertTrue(done.is_set())
+        self.assertTrue(await asyncio.to_thread(self.abandoned.wait, 5))
+
+    @unittest.skipUnless(websocket, "requires the websocket library")
+    async def test_websocket(self):
+        done = asyncio.Event()
+
+        async def serve(reader, writer):
+            # a minimal websocket server, exchanging text frames
+            request = (await reader.readuntil(b"\r\n\r\n")).decode()
+            key = re.search(r"Sec-WebSocket-Key: *(\S+)", request, re.I)[1]
+            accept = base64.b64encode(hashlib.sha1(
+                (key + "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode()).digest())
+            writer.write(b"HTTP/1.1 101 Switching Protocols\r\n"
+                         b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+            async def frame():
+                opcode, length = await reader.readexactly(2)
+                length &= 0x7f
+                if length == 126:
+                    length = int.from_bytes(await reader.readexactly(2), 'big')
+                mask = await reader.readexactly(4)
+                data = await reader.readexactly(length)
+                return opcode & 0x0f, bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+            lines = []
+
+            async def recv():
+                while not lines:
+                    _opcode, data = await frame()
+                    lines.extend(data.decode().splitlines(keepends=True))
+                return lines.pop(0)
+
+            async def send(msg):
+                writer.write(bytes([0x81, len(msg)]) + msg.encode())
+                await writer.drain()
+
+            try:
+                await self.play(recv, send)
+                # answer the closing frame of the client
+                while (await frame())[0] != 0x8:
+                    pass
+                writer.write(bytes([0x88, 0]))
+                await writer.drain()
+                writer.close()
+            finally:
+                done.set()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        await asyncio.wait_for(
+            connect_async(self.agent, host=f"ws://127.0.0.1:{port}/", name="test"), 5)
+        self.assertTrue(done.is_set())
+        self.assertTrue(await asyncio.to_thread(self.abandoned.wait, 5))
+
+    async def test_connection(self):
+        conn = QueueConnection()
+        client = asyncio.create_task(
+            connect_async(self.agent, connection=conn, name="test"))
+        await self.play(conn.outgoing.get, conn.incoming.put)
+        await asyncio.wait_for(client, 5)
+        self.assertTrue(conn.closed)
+        self.assertTrue(await asyncio.to_thread(self.abandoned.wait, 5))
+
+    async def test_book(self):
+        board = Board(0, 0, [3] * 3, [3] * 3)
+        book = OpeningBook({board.key: (0, 2, 10)})
+        conn = QueueConnection()
+        stats = {}
+        client = asyncio.create_task(
+            connect_async(self.agent, connection=conn, stats=stats, book=book))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put(f"4 state {board}\r\n")
+        commands = []
+        while len(commands) < 3:
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        await conn.incoming.put("6 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+        self.assertEqual([(cmd, ref, args) for _, ref, cmd, args in commands[1:]],
+                         [("move", 4, [3]), ("yield", 4, [])])
+        self.assertEqual((stats['states'], stats['book']), (1, 1))
+        self.assertFalse(self.abandoned.is_set())
+
+    async def test_book_illegal(self):
+        # an entry of another board with the same key is not played
+        board = Board(0, 0, [3, 0, 3], [3] * 3)
+        book = OpeningBook({board.key: (0, 1, 10),
+                            Board(0, 0, [3] * 2, [3] * 2).key: (0, 5, 10)})
+        conn = QueueConnection()
+        stats = {}
+        client = asyncio.create_task(
+            connect_async(self.agent, connection=conn, stats=stats, book=book))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put(f"4 state {board}\r\n")
+        await conn.incoming.put(f"6 state {Board(0, 0, [3] * 2, [3] * 2)}\r\n")
+        commands = []
+        while len(commands) < 3:
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        await conn.incoming.put("8@4 stop\r\n")
+        await conn.incoming.put("10@6 stop\r\n")
+        await conn.incoming.put("12 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+        # the moves of the agent
+        self.assertEqual(sorted((ref, cmd, args) for _, ref, cmd, args in commands[1:]),
+                         [(4, "move", [1]), (6, "move", [1])])
+        self.assertNotIn('book', stats)
+
+    async def test_clock(self):
+        deadlines = []
+
+        def agent(state, deadline=None):
+            deadlines.append(deadline - time.monotonic())
+            yield state.legal_moves(SOUTH)[0]
+
+        conn = QueueConnection()
+        client = asyncio.create_task(connect_async(agent, connection=conn))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put("2 set time:mode relative\r\n")
+        await conn.incoming.put("4 set time:clock 3\r\n")
+        await conn.incoming.put("6 state <3,0,0,3,3,3,3,3,3>\r\n")
+        commands = []
+        while len(commands) < 3:
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        await conn.incoming.put("8@6 stop\r\n")
+        await conn.incoming.put("10 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+        self.assertEqual([cmd for _, _, cmd, _ in commands], ["mode", "move", "yield"])
+        self.assertEqual(len(deadlines), 1)
+        self.assertAlmostEqual(deadlines[0], 2.75, places=1)
+
+    async def test_sessions(self):
+        def agent(state, session=None):
+            yield state.legal_moves(SOUTH)[0]
+
+        sessions = Sessions(megabytes=1)
+        conn = QueueConnection()
+        client = asyncio.create_task(
+            connect_async(agent, connection=conn, sessions=sessions))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put('2 set game:id "a"\r\n')
+        await conn.incoming.put("4 state <3,0,0,3,3,3,3,3,3>\r\n")
+        commands = []
+        while len(commands) < 3:
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        self.assertEqual((len(sessions), "a" in sessions), (1, True))
+
+        # the final state ends the session, without starting a new one
+        await conn.incoming.put("6@4 stop\r\n")
+        await conn.incoming.put("8 state <3,9,9,0,0,0,0,0,0>\r\n")
+        await conn.incoming.put('10 ping "x"\r\n')
+        command = _parse(await asyncio.wait_for(conn.outgoing.get(), 5))
+        self.assertEqual(command[2], "pong")
+        self.assertEqual((len(sessions), "a" in sessions), (0, False))
+        await conn.incoming.put("12 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+
+    async def test_verify(self):
+        conn = QueueConnection()
+        client = asyncio.create_task(
+            connect_async(None, connection=conn, mode="verify"))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put("2 problem <3,0,0,3,3,3,3,3,3> 0\r\n")
+        await conn.incoming.put("4 problem <3,0,0,3,3,3,3,3,3> 1\r\n")
+        await conn.incoming.put("6 problem <3,0,0,0,3,3,3,3,3> 0\r\n")
+        commands = []
+        while len(commands) < 4:
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        await conn.incoming.put("8 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+        self.assertEqual(commands[0][2:], ("mode", ["verify"]))
+        self.assertEqual([(ref, cmd, args) for _, ref, cmd, args in commands[1:]],
+                         [(2, "solution", [Board(1, 0, [0, 4, 4], [3, 3, 3]), 1]),
+                          (4, "solution", [Board(1, 0, [3, 0, 4], [4, 3, 3]), 0]),
+                          (6, "error", ["illegal move"])])
+
+    async def test_verify_server(self):
+        # problems as the server of server/go-kgp sends them: a random
+        # board and a random legal move, sent as the index of the pit
+        rng = random.Random(2671)
+        problems = {}
+        conn = QueueConnection()
+        client = asyncio.create_task(
+            connect_async(None, connection=conn, mode="verify"))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        for cid in range(2, 202, 2):
+            size = rng.randint(1, 12)
+            board = Board(0, 0, [rng.randint(0, 12) for _ in range(size)],
+                          [rng.randint(0, 12) for _ in range(size)])
+            if not board.legal_moves(SOUTH):
+                continue
+            move = rng.choice(board.legal_moves(SOUTH))
+            problems[cid] = board.sow(SOUTH, move)
+            await conn.incoming.put(f"{cid} problem {board} {move}\r\n")
+        lines = []
+        while len(lines) < len(problems) + 1:
+            lines.append(await asyncio.wait_for(conn.outgoing.get(), 5))
+        await conn.incoming.put("202 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+
+        for line in lines[1:]:
+            # the server parses the flag as an unsigned integer
+            self.assertRegex(line, r" [01]\r?\n?$")
+            _, ref, cmd, (after, again) = _parse(line)
+            self.assertEqual(cmd, "solution")
+            self.assertEqual((after, bool(again)), problems[ref])
+
+    async def test_telemetry(self):
+        engine = Negamax(TranspositionTable(1))
+        telemetry = Telemetry(engine)
+        deepening = IterativeDeepening(engine.search, 60, depths=range(1, 4),
+                                       report=telemetry.observe)
+        conn = QueueConnection()
+        client = asyncio.create_task(
+            connect_async(deepening.agent, connection=conn, telemetry=telemetry))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put("2 state <4,0,0,1,4,4,4,4,4,4,4>\r\n")
+        commands = []
+        while not commands or commands[-1][2] != "yield":
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        await conn.incoming.put("4@2 stop\r\n")
+        await conn.incoming.put("6 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+
+        # every move is preceded by the comment of its iteration
+        for before, command in zip(commands, commands[1:]):
+            if command[2] == "move":
+                self.assertEqual(before[2], "set")
+                option, comment = before[3]
+                self.assertEqual(option, "info:comment")
+                self.assertTrue(comment.startswith("depth "))
+        self.assertIn("move", [cmd for _, _, cmd, _ in commands])
+
+
+class TestConnectEval(unittest.IsolatedAsyncioTestCase):
+    async def test_batches(self):
+        sizes = []
+
+        def evaluate(boards):
+            sizes.append(len(boards))
+            return [board.south - board.north + 0.25 for board in boards]
+
+        conn = QueueConnection()
+        stats = {}
+        client = asyncio.create_task(connect_eval(
+            evaluate, connection=conn, batch=True, limit=4, stats=stats))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        for cid in range(2, 22, 2):
+            await conn.incoming.put(f"{cid} state <3,{cid},0,3,3,3,3,3,3>\r\n")
+        # the state is stopped before its batch is answered
+        await conn.incoming.put("22@6 stop\r\n")
+        commands = []
+        while len(commands) < 10:
+            commands.append(_parse(await asyncio.wait_for(conn.outgoing.get(), 5)))
+        await conn.incoming.put("24 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+
+        self.assertEqual(commands[0][2:], ("mode", ["eval"]))
+        self.assertEqual(sorted((ref, args) for _, ref, _, args in commands[1:]),
+                         [(cid, [cid + 0.25]) for cid in range(2, 22, 2) if cid != 6])
+        self.assertEqual(sizes, [4, 4, 2])
+        self.assertEqual((stats['states'], stats['evals'], stats['batches']),
+                         (10, 9, 3))
+
+    async def test_single(self):
+        conn = QueueConnection()
+        client = asyncio.create_task(connect_eval(
+            lambda board: -1e-9 if board.is_final() else -1.5, connection=conn))
+        await conn.incoming.put("kgp 1 0 0\r\n")
+        await conn.incoming.put("2 state <3,0,0,3,3,3,3,3,3>\r\n")
+        await conn.incoming.put("4 state <3,0,9,0,0,0,3,3,3>\r\n")
+        lines = [await asyncio.wait_for(conn.outgoing.get(), 5) for _ in range(3)]
+        await conn.incoming.put("6 goodbye\r\n")
+        await asyncio.wait_for(client, 5)
+        self.assertEqual(sorted(line.split(" ", 1)[1] for line in lines[1:]),
+                         ["eval -0.0", "eval -1.5"])
+        self.assertEqual(sorted(_parse(line)[1] for line in lines[1:]), [2, 4])
+
+
+class TestHost(unittest.IsolatedAsyncioTestCase):
+    async def test_serve(self):
+        names = []
+
+        async def serve(reader, writer):
+            async def expect(cmd):
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), 5)
+                    command = _parse(line.decode())
+                    if command[2] == cmd:
+                        return command
+
+            writer.write(b"kgp 1 0 0\r\n")
+            names.append((await expect("set"))[3][1])
+            await expect("mode")
+            for cid in (2, 4, 6):
+                writer.write(f"{cid} state <3,0,0,3,3,3,3,3,3>\r\n".encode())
+                self.assertEqual((await expect("move"))[1], cid)
+                await expect("yield")
+            writer.write(b"8 goodbye\r\n")
+            await writer.drain()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        def agent(state):
+            yield state.legal_moves(SOUTH)[-1]
+
+        host = Host(workers=2)
+        self.addCleanup(host.close)
+        for i in range(5):
+            host.add(agent, host='127.0.0.1', port=port, name=f"bot-{i}")
+        self.assertEqual(await asyncio.wait_for(host.serve(), 10), [None] * 5)
+
+        self.assertEqual(sorted(names), [f"bot-{i}" for i in range(5)])
+        stats = host.stats()
+        self.assertEqual((stats['clients'], stats['states'], stats['moves']),
+                         (5, 15, 15))
+        self.assertGreater(stats['moves_per_sec'], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Build an opening book by searching the first moves of games on
+# boards with SIZE pits of SEEDS stones each, for every SIZE:SEEDS
+# combination given, and write it to a file, that can be mapped into
+# memory by kgp.OpeningBook.load and passed to connect as book.
+#
+#     PYTHONPATH=. python3 tools/book.py FILE DEPTH PLIES SIZE:SEEDS ...
+#
+# Every board south may face in its first PLIES moves is searched to
+# DEPTH, following only the move found but every reply.  For example
+#
+#     PYTHONPATH=. python3 tools/book.py book.bin 8 3 6:6 7:7 8:8
+
+import sys
+import time
+
+import kgp
+
+
+def alphabeta(state, depth, side, alpha, beta):
+    if depth == 0 or state.is_final():
+        return state.south - state.north
+    for move in state.legal_moves(side):
+        after, again = state.sow(side, move)
+        value = alphabeta(after, depth - (not again), side if again else not side,
+                          alpha, beta)
+        if side == kgp.SOUTH:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            break
+    return alpha if side == kgp.SOUTH else beta
+
+
+def search(state, depth):
+    best = None
+    for move in state.legal_moves(kgp.SOUTH):
+        after, again = state.sow(kgp.SOUTH, move)
+        alpha = -1000 if best is None else best[0]
+        value = alphabeta(after, depth - (not again),
+                          kgp.SOUTH if again else kgp.NORTH, alpha, 1000)
+        if best is None or value > best[0]:
+            best = (value, move)
+    return best
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print(f"usage: {sys.argv[0]} FILE DEPTH PLIES SIZE:SEEDS ...",
+              file=sys.stderr)
+        sys.exit(1)
+    path, depth, plies = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    boards = []
+    for config in sys.argv[4:]:
+        size, seeds = map(int, config.split(':'))
+        boards.append(kgp.Board(0, 0, [seeds] * size, [seeds] * size))
+
+    def report(board, entry):
+        value, move, _depth = entry
+        print(f"{board} {move + 1} ({value:+d})", file=sys.stderr)
+
+    start = time.perf_counter()
+    book = kgp.OpeningBook.build(search, boards, depth, plies, report)
+    elapsed = time.perf_counter() - start
+    book.persist(path)
+    print(f"{len(book)} boards in {elapsed:.1f}s, written to {path}")
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+# Build the endgame table of all boards of a size with up to a number
+# of stones in the pits, and write it to a file, that can be mapped
+# into memory by kgp.EndgameTable.load.
+#
+#     PYTHONPATH=. python3 tools/endgame.py SIZE STONES [FILE]
+#
+# The file holds one byte per board; for size 6, 10 stones result in
+# 646646 boards, 12 stones in 2704156 boards.
+
+import sys
+import time
+
+import kgp
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print(f"usage: {sys.argv[0]} SIZE STONES [FILE]", file=sys.stderr)
+        sys.exit(1)
+    size, stones = int(sys.argv[1]), int(sys.argv[2])
+    path = sys.argv[3] if len(sys.argv) > 3 else f"endgame-{size}-{stones}.bin"
+
+    start = time.perf_counter()
+    table = kgp.EndgameTable.build(size, stones)
+    elapsed = time.perf_counter() - start
+    table.persist(path)
+    print(f"{table.entries} boards in {elapsed:.1f}s "
+          f"({table.entries / elapsed:.0f} boards/s), written to {path}")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Cross-check the optimised sowing of kgp against a reference, on
+# random boards of sizes 1 to 12, without a server.  The reference is
+# the sowing loop Board.sow started out with, that moves one stone at a
+# time.  It is compared to Board.sow, to make_move, which also has to
+# be reverted exactly by unmake_move, to the keys the moves update
+# incrementally, to Board.repeats, to the board representation and,
+# if numpy is available, to BoardBatch.sow.  The first mismatch is
+# reported and ends the run with an error.
+#
+#     PYTHONPATH=. python3 tools/fuzz.py [boards] [seed] [processes]
+#
+# The boards are generated and checked in chunks by several processes,
+# and the moves per second of every implementation are reported.
+
+import collections
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+
+import kgp
+
+CHUNK = 20000
+BATCH = 512
+
+
+def reference(n, data, me, pit):
+    """Sow PIT of ME on the board array DATA, returning a new array."""
+    d = list(data)
+
+    def index(side, pos):
+        return pos if side == kgp.SOUTH else n + 1 + pos
+
+    def store(side):
+        return n if side == kgp.SOUTH else 2*n + 1
+
+    side, pos = me, pit + 1
+    stones, d[index(me, pit)] = d[index(me, pit)], 0
+    while stones > 0:
+        if pos == n:
+            if side == me:
+                d[store(me)] += 1
+                stones -= 1
+            side, pos = not side, 0
+        else:
+            d[index(side, pos)] += 1
+            pos += 1
+            stones -= 1
+
+    again = pos == 0 and side != me
+    if side == me and pos > 0:
+        last, other = index(me, pos - 1), index(not me, n - pos)
+        if d[last] == 1 and d[other] > 0:
+            d[store(me)] += d[other] + 1
+            d[other] = d[last] = 0
+
+    if not any(d[:n]) or not any(d[n+1:2*n+1]):
+        d[n] += sum(d[:n])
+        d[2*n+1] += sum(d[n+1:2*n+1])
+        d[:n] = [0] * n
+        d[n+1:2*n+1] = [0] * n
+        again = False
+    return d, again
+
+
+def random_board(rng):
+    """Return a random board and a legal move for a random side."""
+    n = rng.randint(1, 12)
+    # few stones, as in the endgame, up to several rounds of sowing
+    high = rng.choice((1, 2, 3, n, 2*n + 1, 4*n + 3))
+    empty = rng.random() * 0.6
+    pits = [0 if rng.random() < empty else rng.randint(0, high)
+            for _ in range(2*n)]
+    side = rng.random() < 0.5
+    own = 0 if side == kgp.SOUTH else n
+    if not any(pits[own:own + n]):
+        pits[own + rng.randrange(n)] = rng.randint(1, high)
+    board = kgp.Board(rng.randint(0, 50), rng.randint(0, 50), pits[:n], pits[n:])
+    pit = rng.choice(board.legal_moves(side))
+    return board, side, pit
+
+
+class Mismatch(Exception):
+    pass
+
+
+def check(label, board, side, pit, expected, got):
+    if expected != got:
+        raise Mismatch(f"{label}: sowing {pit + 1} for "
+                       f"{'north' if side == kgp.NORTH else 'south'} on {board} "
+                       f"gives {got}, expected {expected}")
+
+
+def fuzz(seed, count):
+    """
+    Check COUNT random boards generated from SEED.
+
+    Returns the seconds spent in every implementation and the error
+    message of the first mismatch, or None.
+    """
+    rng = random.Random(seed)
+    times = collections.Counter()
+    batches = collections.defaultdict(list)
+    clock = time.perf_counter
+
+    def check_batch(key):
+        rows = batches.pop(key)
+        data = kgp.numpy.array([board._data for board, *_ in rows])
+        moves = kgp.numpy.array([pit for _, _, pit, _ in rows])
+        start = clock()
+        after, again = kgp.BoardBatch(data).sow(key[1], moves)
+        times['BoardBatch.sow'] += clock() - start
+        for (board, side, pit, expected), row, repeat in zip(rows, after.data, again):
+            check("BoardBatch.sow", board, side, pit, expected,
+                  (row.tolist(), bool(repeat)))
+
+    try:
+        for _ in range(count):
+            board, side, pit = random_board(rng)
+            n = board.size
+            data = board._data.tolist()
+
+            start = clock()
+            expected = reference(n, data, side, pit)
+            times['reference'] += clock() - start
+
+            start = clock()
+            after, again = board.sow(side, pit)
+            times['Board.sow'] += clock() - start
+            check("Board.sow", board, side, pit, expected,
+                  (after._data.tolist(), again))
+            fresh = kgp.Board(after.south, after.north,
+                              after.south_pits, after.north_pits)
+            check("Board.key", board, side, pit, fresh.key, after.key)
+            check("Board.parse", board, side, pit, after, kgp.Board.parse(str(after)))
+            if not after.is_final():
+                check("Board.repeats", board, side, pit,
+                      again, board.repeats(side, pit))
+
+            copy = board.copy()
+            start = clock()
+            again, undo = copy.make_move(side, pit)
+            moved = copy._data.tolist(), again
+            copy.unmake_move(undo)
+            times['make_move'] += clock() - start
+            check("make_move", board, side, pit, expected, moved)
+            check("unmake_move", board, side, pit,
+                  (data, board.key), (copy._data.tolist(), copy.key))
+
+            if 'numpy' in sys.modules:
+                key = (n, side)
+                batches[key].append((board, side, pit, expected))
+                if len(batches[key]) >= BATCH:
+                    check_batch(key)
+        for key in list(batches):
+            check_batch(key)
+    except Mismatch as e:
+        return times, str(e)
+    return times, None
+
+
+def run(args):
+    return fuzz(*args)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 2671
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    chunks = [(seed * 1000003 + i, min(CHUNK, count - i))
+              for i in range(0, count, CHUNK)]
+    times = collections.Counter()
+    start = time.perf_counter()
+    with mp.Pool(processes) as pool:
+        for chunk, error in pool.imap_unordered(run, chunks):
+            times.update(chunk)
+            if error is not None:
+                print(error, file=sys.stderr)
+                pool.terminate()
+                sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    print(f"{count} boards checked in {elapsed:.1f}s with {processes} processes, "
+          f"{count / elapsed:.0f} boards/s")
+    for label, seconds in times.items():
+        print(f"  {label:<16} {count / seconds:12.0f} moves/s per process")
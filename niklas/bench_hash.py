@@ -0,0 +1,71 @@
+# Compare hashing a board with hashlittle(str(state)), as the search
+# used to, against the incrementally maintained Board.key.
+#
+#     python3 bench_hash.py
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "client", "pykgp"))
+
+from kgp import Board, NORTH, SOUTH
+from JenkisHash import hashlittle
+
+
+def boards(size, seeds, count=200):
+    """Return COUNT boards reached by random play from the start."""
+    rng = random.Random(size * seeds)
+    result = []
+    while len(result) < count:
+        b = Board(0, 0, [seeds] * size, [seeds] * size)
+        side = SOUTH
+        while not b.is_final() and len(result) < count:
+            again, _ = b.make_move(side, rng.choice(b.legal_moves(side)))
+            result.append(b.copy())
+            if not again:
+                side = not side
+    return result
+
+
+def per_call(stmt, count):
+    return min(timeit.repeat(stmt, number=1, repeat=5)) / count * 1e6
+
+
+if __name__ == "__main__":
+    print(f"{'board':<10} {'hashlittle(str)':>16} {'Board.key':>10} "
+          f"{'make+str+hash':>14} {'make+key':>9}   (usec per board)")
+    for size, seeds in ((6, 4), (8, 8), (16, 8), (32, 16), (64, 16)):
+        states = boards(size, seeds)
+        moves = [(b, b.legal_moves(SOUTH) or b.legal_moves(NORTH))
+                 for b in states]
+        moves = [(b, SOUTH if b.legal_moves(SOUTH) else NORTH, ms[0])
+                 for b, ms in moves if ms]
+
+        def jenkins():
+            for b in states:
+                hashlittle(str(b))
+
+        def zobrist():
+            for b in states:
+                b.key
+
+        def make_jenkins():
+            for b, side, move in moves:
+                _, undo = b.make_move(side, move)
+                hashlittle(str(b))
+                b.unmake_move(undo)
+
+        def make_zobrist():
+            for b, side, move in moves:
+                _, undo = b.make_move(side, move)
+                b.key
+                b.unmake_move(undo)
+
+        print(f"<{size},{seeds}>".ljust(10),
+              f"{per_call(jenkins, len(states)):16.2f}",
+              f"{per_call(zobrist, len(states)):10.2f}",
+              f"{per_call(make_jenkins, len(moves)):14.2f}",
+              f"{per_call(make_zobrist, len(moves)):9.2f}")
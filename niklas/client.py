@@ -1,138 +1,288 @@
-from kgp import Board, NORTH, SOUTH, connect
+import os
+import sys
+
+# use the library of the repository, instead of a copy of it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "client", "pykgp"))
+
+from kgp import Board, SOUTH
+import kgp
 from dotenv import load_dotenv
+from queue import Queue
+from threading import Thread
 from typing import Tuple
-from JenkisHash import hashlittle
-import utils
-import math
-import time
-import os
+import socket
 
 # Example board representation
 # <8,0,0,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8>
 # <size, north, south, *north_pits, *south_pits>
 
-EXACT = 1
-UPPERBOUND = 2
 CLIENT_SIDE = SOUTH
 DEPTH = 6
+TT_MEGABYTES = 64
+TT_FILE = os.getenv("TT_FILE", "tt-{size}-{seeds}.bin")
+MOVE_TIME = float(os.getenv("MOVE_TIME", "4.5"))
+# named as written by client/pykgp/tools/endgame.py
+ENDGAME_FILE = os.getenv("ENDGAME_FILE", "endgame-{size}-{stones}.bin")
+ENDGAME_STONES = int(os.getenv("ENDGAME_STONES", "10"))
+BOOK_FILE = os.getenv("BOOK_FILE", "book.bin")
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG")
 
 def getAllPits(board:Board):
     return board.north_pits + board.south_pits
 
-class TranspositionTable:
-    def __init__(self) -> None:
-        self.table = dict()
-        self.hits = 0
-        self.entries = 0
+def boardConfig(board:Board) -> Tuple[int, int]:
+    """Returns the board size and the initial number of seeds per pit"""
+    stones = sum(getAllPits(board)) + board.north + board.south
+    return board.size, stones // (2 * board.size)
+
+class TranspositionTable(kgp.TranspositionTable):
+    path = None
+
+    def __init__(self, megabytes: int = TT_MEGABYTES, size: int = 0, seeds: int = 0) -> None:
+        super().__init__(megabytes, size=size, seeds=seeds)
+
+    @classmethod
+    def forConfig(cls, size: int, seeds: int) -> 'TranspositionTable':
+        """
+        Maps the table persisted for boards of SIZE with SEEDS, or
+        creates an empty one if there is none or it is outdated
+        """
+        path = TT_FILE.format(size=size, seeds=seeds)
+        try:
+            table = cls.load(path, size, seeds)
+        except (OSError, ValueError):
+            table = cls(size=size, seeds=seeds)
+        table.path = path
+        return table
+
+    def lookUp(self, hash) -> Tuple[int, int, int, int]:
+        entry = self.probe(hash)
+        return entry if entry is not None else (0, -1, 0, -1)
 
-    def lookUp(self, hash) -> Tuple[int, int, int]:
-        if hash in self.table.keys(): self.hits += 1
-        return self.table.get(hash, (0, -1, 0, -1))
-    
     def save(self, hash, score: int, depth: int, flag: int, move:int = -1) -> bool:
-        if hash not in self.table.keys(): self.entries += 1
-        self.table[hash] = (score, depth, flag, move)
+        self.store(hash, score, depth, flag, move)
         return True
 
     def persist(self):
-        pass
+        if self.path is not None:
+            super().persist(self.path)
 
 def evaluate(state : Board, side:bool) -> int:
     # return sum(state.south_pits) - sum(state.north_pits) + 2 * (state.south - state.north)
     return state[side] - state[not side]
 
-def eval_approach(state: Board, side:bool, move:int) -> int:
-    next_state, again = state.sow(side,move)
-    return evaluate(next_state, side) + int(again) * 3
 
+def loadEndgame(size: int):
+    """
+    Maps the endgame table for boards of SIZE with up to ENDGAME_STONES
+    stones in the pits, if one was built
+    """
+    try:
+        return kgp.EndgameTable.load(ENDGAME_FILE.format(size=size, stones=ENDGAME_STONES))
+    except (OSError, ValueError):
+        return None
+
+def loadBook():
+    """Maps the opening book, if one was built"""
+    try:
+        return kgp.OpeningBook.load(BOOK_FILE)
+    except (OSError, ValueError):
+        return None
 
 class Agent:
     def __init__(self):
         self.t_table = TranspositionTable()
+        self.endgame = None
+        self.engine = None
+        self.book = loadBook()
+        self.telemetry = kgp.Telemetry(log=TELEMETRY_LOG)
         self.stopFlag = False
         self.halfPoints = 0
 
     def agent(self, state : Board):
-        self.stopFlag = False
+        entry = self.book and self.book.lookup(state)
+        if entry and entry[1] < state.size and state.is_legal(SOUTH, entry[1]):
+            yield entry[1]
+            return
+        config = boardConfig(state)
+        if (self.t_table.size, self.t_table.seeds) != config:
+            self.t_table.persist()
+            self.t_table.close()
+            self.t_table = TranspositionTable.forConfig(*config)
+            if self.endgame is not None:
+                self.endgame.close()
+            self.endgame = loadEndgame(config[0])
+            self.engine = kgp.Negamax(self.t_table, self.endgame, evaluate,
+                                      stop=lambda: self.stopFlag)
+            self.telemetry.engine = self.engine
         # if self.halfPoints == 0:
         #     self.halfPoints = (sum(state.north_pits + state.south_pits) + state.north + state.south) // 2
-        start = time.time()
-        for i in range(1,16):
-            self.t_table.hits = 0
-            if self.stopFlag: break
-            result = self.search(
-                state,
-                i,
-                CLIENT_SIDE
-            )
-            # print("Yield: ", self.stopFlag)
-            if not self.stopFlag:
-                yield result[1]
-            end = time.time()
-            print(utils.colors.fg.lightgreen if (end-start) <= 5.0 else utils.colors.fg.lightred, end="")
-            print(f"[{i}] {result} - {end - start}", end="")
-            print(utils.colors.reset, end=" | ")
-            print(f"Cache Hits: {self.t_table.hits} - Cache entries {self.t_table.entries}")
-            # start = end
-
-    def search(self, state: Board, depth: int, side: bool, alpha=-math.inf, beta=math.inf) -> (int, int):
-        """
-        Searches the best move for a given board state
-        Returns a move and its evaluation
-        """
-        if agent.stopFlag or depth <= 0 or state.is_final():
-            return evaluate(state, side), -3
-        
+        deepening = kgp.IterativeDeepening(
+            self.engine.search,
+            MOVE_TIME,
+            depths=range(1, 16),
+            report=self.telemetry.observe
+        )
+        try:
+            for move in deepening.agent(state):
+                # print("Yield: ", self.stopFlag)
+                if self.stopFlag: break
+                yield move
+        except kgp.Stopped:
+            pass
+
+def connect(agent, host='wss://kalah.kwarc.info/socket', port=2671, token=None, name=None, authors=[], debug=False, telemetry=None):
+    """
+    Connect to KGP server at host:port as AGENT, an Agent.
 
-        h = hashlittle(str(state))
-        tt_entry = agent.t_table.lookUp(h)
-        if tt_entry is not None and tt_entry[1] >= depth:
-            if tt_entry[2] == EXACT:
-                return tt_entry[0], tt_entry[3]
-            elif tt_entry[2] == UPPERBOUND:
-                beta = min(beta, tt_entry[0])
+    Unlike kgp.connect, every request is handled by a thread of this
+    process, so that the agent keeps its tables between the moves.  A
+    stopped request sets agent.stopFlag, that the search checks at
+    every node, and the thread of the next request waits for it to end,
+    so that the agent searches one state at a time.
 
-            if alpha >= beta:
-                return tt_entry[0], tt_entry[3]
+    TELEMETRY is an optional Telemetry, whose comments are sent as the
+    option info:comment before the moves.
+    """
+    if os.getenv("KGP_PORT"):
+        port = int(os.getenv("KGP_PORT"))
+    host = os.getenv("KGP_HOST", host)
 
+    queue = Queue()
 
-        allMoves = sorted(state.legal_moves(side), key=lambda x: -eval_approach(state, side, x))
-        bestMove = -1
+    def handle(read, write):
+        id = 1
 
-        for move in allMoves:
-            new_board, repeat_move = state.sow(side, move)
-            sign = 1 if repeat_move else -1
-            n_side = side if repeat_move else not side
+        def send(cmd, *args, ref=None):
+            nonlocal id
+            msg = kgp._format(id, cmd, args, ref)
+            if debug:
+                print(">", msg, file=sys.stderr)
+            queue.put(msg + "\r\n")
+            id += 2
 
-            if move == allMoves[0]:
-                n_alpha, n_beta = (alpha, beta) if repeat_move else (-beta, -alpha)
+        def query(state, cid, previous):
+            nonlocal current
+            if previous is not None:
+                previous.join()
+            agent.stopFlag = False
+            current = cid
+            if cid not in threads:
+                # stopped before it started
+                return
+            last = None
+            if telemetry is not None:
+                telemetry.start(state, cid)
+            for move in agent.agent(state):
+                if move is None:
+                    if agent.stopFlag:
+                        break
+                    continue
+                if not type(move) is int:
+                    raise TypeError("Not a move")
+                if move != last:
+                    comment = telemetry and telemetry.take()
+                    if comment:
+                        send("set", "info:comment", comment, ref=cid)
+                    send("move", move+1, ref=cid)
+                    last = move
             else:
-                n_alpha, n_beta = (alpha, -alpha - 1) if repeat_move else (-alpha - 1, -alpha)
+                if cid in threads:
+                    send("yield", ref=cid)
 
-            result = sign * self.search(state=new_board, depth=depth - 1, side=n_side, alpha=n_alpha, beta=n_beta)[0]
+        threads = {}
+        # the thread of the last request, and the request searched
+        previous = current = None
 
-            if move != allMoves[0] and alpha < result < beta:
-                n_alpha, n_beta = (alpha, beta) if repeat_move else (-beta, -alpha)
-                result = sign * self.search(state=new_board, depth=depth - 1, side=n_side, alpha=n_alpha, beta=n_beta)[0]
+        def sender():
+            # None ends the sender
+            for msg in iter(queue.get, None):
+                write(msg)
+        writer = Thread(target=sender)
+        writer.start()
 
-            if result > alpha:
-                alpha, bestMove = result, move
+        try:
+            for line in read():
+                if debug:
+                    print("<", line.strip(), file=sys.stderr)
 
-            if alpha >= beta:
-                break
+                try:
+                    command = kgp._parse(line)
+                    if not command:
+                        continue
+                    cid, ref, cmd, args = command
 
-        if agent.stopFlag:
-            return 0, -4
+                    if cmd == "kgp":
+                        major, _minor, _patch = args
+                        if major != 1:
+                            send("error", "protocol not supported", ref=cid)
+                            raise ValueError()
+                        if name:
+                            send("set", "info:name", name)
+                        if authors:
+                            send("set", "info:authors", ",".join(authors))
+                        if token:
+                            send("set", "auth:token", token)
+                        send("mode", "freeplay")
+                    elif cmd == "state":
+                        board = args[0]
+                        if cid in threads or board.is_final():
+                            # Duplicate IDs by the server are ignored, and
+                            # there is no move to make in a final state
+                            continue
+                        if debug:
+                            print(f"State: {cid}", file=sys.stderr)
+                        threads[cid] = previous = Thread(
+                            name=f'query-{cid}',
+                            args=(board, cid, previous),
+                            target=query)
+                        previous.start()
+                    elif cmd == "stop":
+                        if ref and ref in threads:
+                            if debug:
+                                print(f"Stop: {ref}", file=sys.stderr)
+                            threads.pop(ref)
+                            if current == ref:
+                                agent.stopFlag = True
+                    elif cmd == "ping":
+                        send("pong", *args[:1], ref=cid)
+                    elif cmd == "goodbye":
+                        return
+                except (ValueError, TypeError):
+                    pass
+        finally:
+            if previous is not None:
+                # end the search, and the requests waiting for it
+                threads.clear()
+                agent.stopFlag = True
+                previous.join()
+            queue.put(None)
+            writer.join()
 
-        flag = EXACT if alpha > beta else UPPERBOUND
-        agent.t_table.save(h, alpha, depth, flag, bestMove)
+    if host.startswith("ws"):
+        import websocket
 
-        return alpha, bestMove
+        ws = websocket.WebSocket(enable_multithread=True)
+        ws.connect(host)
+        def lines():
+            try:
+                while True:
+                    yield ws.recv()
+            except websocket._exceptions.WebSocketConnectionClosedException:
+                pass
+        handle(lines, ws.send)
+    else:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.connect((host, port))
+            # writing through the file of the reader would discard
+            # the input it has read ahead
+            with sock.makefile(mode='r') as pseudo:
+                handle(lambda: pseudo, lambda msg: sock.sendall(msg.encode()))
 
 if __name__ == '__main__':
     agent = Agent()
 
-    import os
     load_dotenv()
     connect(
         # getNegamaxAgent(),
@@ -141,5 +291,8 @@ if __name__ == '__main__':
         debug=True,
         token=os.getenv("TOKEN"),
         name=os.getenv("NAME"),
-        authors=[os.getenv("AUTHOR")]
-    )
\ No newline at end of file
+        authors=[os.getenv("AUTHOR")],
+        telemetry=agent.telemetry
+    )
+    agent.t_table.persist()
+    agent.telemetry.close()
@@ -48,16 +48,20 @@ func (cli *Client) verify(id, ref uint64, cmd, args string) {
 		}
 		delete(cli.chall, ref)
 
+		// the repeat move is indicated by an integer, that is
+		// non-zero for true
 		var (
 			state  *kgp.Board
-			repeat bool
+			repeat uint64
 		)
-		parse(args, &state, &repeat)
+		err := parse(args, &state, &repeat)
 		isrepeat := chall.board.Sow(kgp.South, chall.move)
 		switch {
+		case err != nil:
+			cli.error(id, "Malformed solution")
 		case !state.Equal(chall.board):
 			cli.error(id, fmt.Sprintf("Expected state %s", chall.board))
-		case isrepeat != repeat:
+		case isrepeat != (repeat != 0):
 			if isrepeat {
 				cli.error(id, "Was a repeat move")
 			} else {
@@ -0,0 +1,101 @@
+// Verify Mode Tests
+//
+// Copyright (c) 2021, 2022, 2023  Philip Kaludercic
+//
+// This file is part of go-kgp.
+//
+// go-kgp is free software: you can redistribute it and/or modify
+// it under the terms of the GNU Affero General Public License,
+// version 3, as published by the Free Software Foundation.
+//
+// go-kgp is distributed in the hope that it will be useful, but
+// WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+// Affero General Public License for more details.
+//
+// You should have received a copy of the GNU Affero General Public
+// License, version 3, along with go-kgp. If not, see
+// <http://www.gnu.org/licenses/>
+
+package proto
+
+import (
+	"bytes"
+	"fmt"
+	"strings"
+	"testing"
+
+	"go-kgp"
+)
+
+type buffer struct{ bytes.Buffer }
+
+func (*buffer) Close() error { return nil }
+
+// problem reads the last problem sent by the server, and returns the
+// solution a client would send back, with a correct or wrong repeat
+// flag.
+func problem(t *testing.T, buf *buffer, correct bool) (uint64, string) {
+	line := strings.TrimSpace(buf.String())
+	buf.Reset()
+
+	var (
+		id, move uint64
+		board    *kgp.Board
+	)
+	fields := strings.SplitN(line, " ", 3)
+	if len(fields) != 3 {
+		t.Fatalf("Unexpected message %q", line)
+	}
+	fmt.Sscan(fields[0], &id)
+	if fields[1] != "problem" {
+		t.Fatalf("Expected a problem, got %q", line)
+	}
+	if err := parse(fields[2], &board, &move); err != nil {
+		t.Fatal(err)
+	}
+
+	if !board.Legal(kgp.South, uint(move)) {
+		t.Fatalf("Illegal move in %q", line)
+	}
+	again := board.Sow(kgp.South, uint(move))
+	if !correct {
+		again = !again
+	}
+	flag := 0
+	if again {
+		flag = 1
+	}
+	return id, fmt.Sprintf("%s %d", board, flag)
+}
+
+func TestVerify(t *testing.T) {
+	var buf buffer
+	cli := MakeClient(&buf, nil)
+	cli.chall = make(map[uint64]*challenge)
+	cli.challenge()
+
+	for i := 0; i < 100; i++ {
+		correct := i%2 == 0
+		ref, args := problem(t, &buf, correct)
+		cli.verify(1, ref, "solution", args)
+
+		// the response is followed by the next problem
+		lines := strings.SplitN(buf.String(), "\r\n", 2)
+		line := lines[0]
+		buf.Reset()
+		buf.WriteString(lines[1])
+		if correct && !strings.HasSuffix(line, "@1 ok") {
+			t.Fatalf("Expected ok for %q, got %q", args, line)
+		}
+		if !correct && !strings.Contains(line, "@1 error") {
+			t.Fatalf("Expected an error for %q, got %q", args, line)
+		}
+	}
+
+	ref, _ := problem(t, &buf, true)
+	cli.verify(1, ref, "solution", "<3,0,0,3,3,3,3,3,3> true")
+	if !strings.Contains(buf.String(), "@1 error") {
+		t.Fatalf("Expected an error, got %q", buf.String())
+	}
+}